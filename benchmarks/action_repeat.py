@@ -0,0 +1,73 @@
+"""
+Episodes per hour for different action_repeat (frame skip) settings.
+
+    python benchmarks/action_repeat.py              # against a stand-in bridge
+    python benchmarks/action_repeat.py --port 8086  # against a running BizHawk
+
+The same weights are played for every setting: a "walker" whose Right output
+is positive on the first frame, so every episode runs the full 600 frames.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import neato_brain
+import neato_settings
+import neato_standin
+
+
+def walker_weights(substrate, bridge):
+    """Weights that press Right whenever the screen looks like it does now."""
+    inputs = np.empty(substrate.input_coords.shape[0], dtype=np.float32)
+    bridge.reset()
+    bridge.read_state()
+    bridge.capture_into(inputs)
+    weights = np.zeros((substrate.input_coords.shape[0], len(substrate.active_buttons)))
+    weights[:, substrate.active_buttons.index('Right')] = inputs * 0.01
+    return weights
+
+
+def benchmark(repeats, episodes, port=None):
+    server = None
+    if port is None:
+        server = neato_standin.StandInBridge().start()
+
+    results = []
+    try:
+        for repeat in repeats:
+            settings = neato_settings.NeatoSettings(
+                bridge_port=port or server.port, action_repeat=repeat)
+            brain = neato_brain.NeatoBrain(settings)
+            bridge = brain.pool.bridges[0]
+            if server is not None:
+                bridge.capture_session.source = server.render
+            bridge.connect()
+            weights = walker_weights(brain.substrate, bridge)
+
+            start = time.perf_counter()
+            for _ in range(episodes):
+                brain.run_simulation(weights, bridge)
+            elapsed = time.perf_counter() - start
+            brain.close()
+
+            results.append((repeat, episodes / elapsed * 3600.0, elapsed / episodes))
+    finally:
+        if server is not None:
+            server.stop()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=None, help="BizHawk bridge port (default: stand-in)")
+    parser.add_argument('--episodes', type=int, default=5)
+    parser.add_argument('--repeats', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"{'K':>3} | {'episodes/hour':>14} | {'s/episode':>9}")
+    for repeat, per_hour, per_episode in benchmark(args.repeats, args.episodes, args.port):
+        print(f"{repeat:>3} | {per_hour:>14.0f} | {per_episode:>9.3f}")
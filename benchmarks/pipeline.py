@@ -0,0 +1,72 @@
+"""
+Frames per second of the serial episode loop vs the pipelined one.
+
+    python benchmarks/pipeline.py                    # stand-in, 2 ms per emulated frame
+    python benchmarks/pipeline.py --frame-time 0     # stand-in, as fast as it can go
+    python benchmarks/pipeline.py --port 8086        # against a running BizHawk
+
+Depth 0 is the serial loop; depth N keeps up to N STEP requests in flight
+while the next screen is captured (see neato_pipeline). The same walker
+weights as benchmarks/action_repeat.py are used, so every episode runs the
+full 600 frames.
+
+The stand-in runs in this process, so with --frame-time 0 it competes with
+the capture for the GIL and pipelining can come out slower. An emulator is
+a separate process and doesn't have that problem.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import neato_brain
+import neato_settings
+import neato_standin
+from action_repeat import walker_weights
+
+
+def benchmark(depths, episodes, frame_time, port=None):
+    server = None
+    if port is None:
+        server = neato_standin.StandInBridge(frame_time=frame_time).start()
+
+    results = []
+    try:
+        for depth in depths:
+            settings = neato_settings.NeatoSettings(bridge_port=port or server.port, pipeline_depth=depth)
+            brain = neato_brain.NeatoBrain(settings)
+            bridge = brain.pool.bridges[0]
+            if server is not None:
+                bridge.capture_session.source = server.render
+            bridge.connect()
+            weights = walker_weights(brain.substrate, bridge)
+
+            frames = 0
+            start = time.perf_counter()
+            for _ in range(episodes):
+                start_frame = bridge.frame
+                brain.run_simulation(weights, bridge)
+                frames += bridge.frame - start_frame
+            elapsed = time.perf_counter() - start
+            brain.close()
+
+            results.append((depth, frames / elapsed, elapsed / episodes))
+    finally:
+        if server is not None:
+            server.stop()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=None, help="BizHawk bridge port (default: stand-in)")
+    parser.add_argument('--episodes', type=int, default=3)
+    parser.add_argument('--depths', type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument('--frame-time', type=float, default=0.002,
+                        help="seconds per emulated frame on the stand-in")
+    args = parser.parse_args()
+
+    print(f"{'depth':>5} | {'fps':>7} | {'s/episode':>9}")
+    for depth, fps, per_episode in benchmark(args.depths, args.episodes, args.frame_time, args.port):
+        print(f"{depth:>5} | {fps:>7.0f} | {per_episode:>9.3f}")
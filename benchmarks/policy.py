@@ -0,0 +1,100 @@
+"""
+Per-frame decision cost: the old run_simulation loop body vs neato_policy.Policy.
+
+    python benchmarks/policy.py
+
+Both start from the 128x112 grayscale frame and end with the buttons to send,
+on the run2 substrate (14336 pixels + 5 feedback inputs, 5 buttons). "before"
+is the loop as it was: flatten and normalize, concatenate the feedback,
+np.dot, sigmoid, a dict of buttons, a new feedback vector and index()
+lookups. "after" is the LUT normalization capture_into() does plus
+Policy.act(). Allocations are the bytes tracemalloc sees allocated per frame.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import neato_capture
+import neato_client
+import neato_policy
+
+ACTIVE_BUTTONS = ['B', 'Y', 'Left', 'Right', 'A']
+
+
+def before(weights):
+    prev_buttons_vector = np.zeros(len(ACTIVE_BUTTONS))
+
+    def frame(gray):
+        nonlocal prev_buttons_vector
+        screen_inputs = gray.flatten() / 127.5 - 1.0
+        inputs = np.concatenate((screen_inputs, (prev_buttons_vector * 2.0) - 1.0))
+        outputs = np.dot(inputs, weights)
+        outputs = 1 / (1 + np.exp(-outputs))
+        buttons = {}
+        new_buttons_vector = np.zeros(len(ACTIVE_BUTTONS))
+        for i, btn_name in enumerate(ACTIVE_BUTTONS):
+            is_pressed = outputs[i] > 0.5
+            buttons[btn_name] = is_pressed
+            new_buttons_vector[i] = 1.0 if is_pressed else 0.0
+        prev_buttons_vector = new_buttons_vector
+        if buttons.get('Left') and buttons.get('Right'):
+            left_idx = ACTIVE_BUTTONS.index('Left')
+            right_idx = ACTIVE_BUTTONS.index('Right')
+            if abs(outputs[left_idx]) > abs(outputs[right_idx]):
+                buttons['Right'] = False
+            else:
+                buttons['Left'] = False
+        return neato_client.buttons_to_mask(buttons)
+    return frame
+
+
+def after(weights):
+    policy = neato_policy.Policy(weights, ACTIVE_BUTTONS, feedback=True)
+    screen = policy.screen.reshape(112, 128)
+
+    def frame(gray):
+        cv2.LUT(gray, neato_capture.NORMALIZE_LUT, dst=screen)
+        return policy.act()
+    return frame
+
+
+def measure(frame, grays):
+    for gray in grays[:10]:
+        frame(gray)  # Warm up
+
+    latencies = np.empty(len(grays))
+    for i, gray in enumerate(grays):
+        start = time.perf_counter()
+        frame(gray)
+        latencies[i] = time.perf_counter() - start
+
+    tracemalloc.start()
+    allocated = 0
+    for gray in grays:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        frame(gray)
+        allocated += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return latencies.mean(), np.percentile(latencies, 95), allocated / len(grays)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    weights = rng.normal(scale=0.02, size=(128 * 112 + len(ACTIVE_BUTTONS), len(ACTIVE_BUTTONS)))
+    grays = [rng.integers(0, 256, (112, 128), dtype=np.uint8) for _ in range(args.frames)]
+
+    print(f"{'':>6} | {'mean us':>8} | {'p95 us':>8} | {'bytes allocated/frame':>21}")
+    for name, factory in (('before', before), ('after', after)):
+        mean, p95, allocated = measure(factory(weights), grays)
+        print(f"{name:>6} | {mean * 1e6:>8.1f} | {p95 * 1e6:>8.1f} | {allocated:>21.0f}")
@@ -0,0 +1,72 @@
+"""
+Per-frame preprocessing cost for each observation layout.
+
+    python benchmarks/preprocess.py
+
+Every layout turns the same 256x224 BGRA grabs into network inputs with
+neato_observation.Preprocessor, the way CaptureSession.grab_into() does after
+the grab itself. "default" is the single 128x112 frame the network has
+always seen. Allocations are the bytes tracemalloc sees allocated per frame
+(after the first frame of an episode, which fills the history).
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import neato_observation
+
+LAYOUTS = (
+    ('default', {}),
+    ('downsample 2', {'downsample': 2}),
+    ('downsample 4', {'downsample': 4}),
+    ('crop 0 16 128 96', {'crop': (0, 16, 128, 96)}),
+    ('stack 2', {'stack': 2}),
+    ('stack 4', {'stack': 4}),
+    ('difference', {'difference': True}),
+    ('stack 4 + difference', {'stack': 4, 'difference': True}),
+    ('ds 2, stack 4 + diff', {'downsample': 2, 'stack': 4, 'difference': True}),
+)
+
+
+def measure(layout, frames):
+    pre = neato_observation.Preprocessor(layout)
+    out = np.empty(layout.size, dtype=np.float32)
+    for frame in frames[:10]:
+        pre.process(frame, out)  # Warm up
+
+    latencies = np.empty(len(frames))
+    for i, frame in enumerate(frames):
+        start = time.perf_counter()
+        pre.process(frame, out)
+        latencies[i] = time.perf_counter() - start
+
+    tracemalloc.start()
+    allocated = 0
+    for frame in frames:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        pre.process(frame, out)
+        allocated += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return latencies.mean(), np.percentile(latencies, 95), allocated / len(frames)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (224, 256, 4), dtype=np.uint8) for _ in range(64)]
+    frames = [frames[i % len(frames)] for i in range(args.frames)]
+
+    print(f"{'layout':>22} | {'inputs':>6} | {'mean us':>8} | {'p95 us':>8} | {'bytes allocated/frame':>21}")
+    for name, kwargs in LAYOUTS:
+        layout = neato_observation.ObservationLayout(**kwargs)
+        mean, p95, allocated = measure(layout, frames)
+        print(f"{name:>22} | {layout.size:>6} | {mean * 1e6:>8.1f} | {p95 * 1e6:>8.1f} | {allocated:>21.0f}")
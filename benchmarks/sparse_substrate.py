@@ -0,0 +1,105 @@
+"""
+Dense substrate vs the sparse hidden-layer substrate.
+
+    python benchmarks/sparse_substrate.py
+    python benchmarks/sparse_substrate.py --hidden 32 28 --thresholds 0.2 0.5 0.8
+
+For a handful of genomes from a fresh run2 population this reports, per
+substrate: phenotype build time, weight memory, surviving connections and
+per-frame inference latency (the neato_sparse.forward call run_simulation makes).
+The "unpruned" row is the same hidden layer with full float32 matrices, i.e.
+what the sparse substrate would cost without pruning.
+"""
+import argparse
+import os
+import sys
+import time
+
+import neat
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'runs'))
+import neato_cppn
+import neato_sparse
+import run2_runner
+
+CONFIG_PATH = os.path.join(ROOT, 'runs', 'configs', 'config-run2')
+
+
+class DenseHidden:
+    """Unpruned input -> hidden -> output reference, with the same forward() as SparsePhenotype."""
+    def __init__(self, cppn, substrate):
+        compiled = neato_cppn.CompiledCPPN(cppn)
+        self.to_hidden = compiled.query_grid(substrate.all_input_coords, substrate.hidden_coords).astype(np.float32)
+        self.to_output = compiled.query_grid(substrate.hidden_coords, substrate.output_coords).astype(np.float32)
+        self.nbytes = self.to_hidden.nbytes + self.to_output.nbytes
+        self.nnz = self.to_hidden.size + self.to_output.size
+
+    def forward(self, inputs):
+        return np.dot(np.tanh(np.dot(inputs, self.to_hidden)), self.to_output)
+
+
+def measure(substrate, cppns, frames, build=None):
+    inputs = np.random.default_rng(0).uniform(-1, 1, substrate.all_input_coords.shape[0]).astype(np.float32)
+
+    build_times = []
+    phenotypes = []
+    for cppn in cppns:
+        start = time.perf_counter()
+        if build is None:
+            phenotypes.append(substrate.build_phenotype(cppn, None))
+        else:
+            phenotypes.append(build(cppn, substrate))
+        build_times.append(time.perf_counter() - start)
+
+    latencies = []
+    for phenotype in phenotypes:
+        start = time.perf_counter()
+        for _ in range(frames):
+            neato_sparse.forward(phenotype, inputs)
+        latencies.append((time.perf_counter() - start) / frames)
+
+    if isinstance(phenotypes[0], np.ndarray):
+        nbytes = [p.astype(np.float32).nbytes for p in phenotypes]
+        connections = [p.size for p in phenotypes]
+    else:
+        nbytes = [p.nbytes for p in phenotypes]
+        connections = [p.nnz for p in phenotypes]
+    return (np.mean(build_times), np.mean(nbytes), np.mean(connections), np.mean(latencies))
+
+
+def benchmark(hidden, thresholds, genomes, frames):
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_PATH)
+    population = neat.Population(config)
+    cppns = [neat.nn.FeedForwardNetwork.create(genome, config)
+             for genome in list(population.population.values())[:genomes]]
+
+    name = f"{hidden[0]}x{hidden[1]}"
+    rows = [('dense', '-') + measure(run2_runner.Substrate(), cppns, frames)]
+    substrate = run2_runner.Substrate(hidden_width=hidden[0], hidden_height=hidden[1])
+    rows.append((name, 'unpruned') + measure(substrate, cppns, frames, build=DenseHidden))
+    for threshold in thresholds:
+        substrate = run2_runner.Substrate(hidden_width=hidden[0], hidden_height=hidden[1],
+                                          weight_threshold=threshold)
+        rows.append((name, threshold) + measure(substrate, cppns, frames))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hidden', type=int, nargs=2, default=[16, 14], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--thresholds', type=float, nargs='+', default=[0.2, 0.5, 0.8, 0.95])
+    parser.add_argument('--genomes', type=int, default=5)
+    parser.add_argument('--frames', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'substrate':>9} | {'threshold':>9} | {'build ms':>8} | {'memory KiB':>10} | "
+          f"{'connections':>11} | {'frame us':>8}")
+    for name, threshold, build, nbytes, connections, latency in benchmark(
+            args.hidden, args.thresholds, args.genomes, args.frames):
+        print(f"{name:>9} | {threshold!s:>9} | {build * 1e3:>8.1f} | {nbytes / 1024:>10.1f} | "
+              f"{connections:>11.0f} | {latency * 1e6:>8.1f}")
@@ -0,0 +1,270 @@
+"""
+Reproducible performance numbers for run1_awakening and run2_runner.
+
+    python benchmarks/suite.py                           # JSON to stdout
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --runs run2 --genomes 5   # quicker
+    python benchmarks/suite.py --compare before.json after.json
+
+Everything runs against neato_standin.StandInBridge, which serves synthetic
+frames and a small integer Mario X/Y physics model over the real bridge
+protocol. With fixed seeds and a fixed frame_time the workload is the same
+from commit to commit. For each run this measures:
+
+    build         phenotype build time per genome (CPPN -> substrate weights)
+    inference     per-frame decision latency (run1: np.dot + sigmoid, run2: Policy.act)
+    episodes      episodes/s and emulated frames/s for a walker that plays all 600 frames
+    generation    wall time of one brain.evaluate() over the config's population
+
+plus the bridge round-trip time of a STEP (binary) and an ACT + GET_STATE
+(text). Times are in milliseconds.
+
+run1_awakening is measured as it is, including the 0.5 s sleep after every
+reset, so its episode and generation numbers are dominated by that.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import neat
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'runs'))
+import neato_client
+import neato_policy
+import neato_settings
+import neato_standin
+import run1_awakening
+import run2_runner
+
+CONFIGS = {
+    'run1': os.path.join(ROOT, 'runs', 'configs', 'config-run1'),
+    'run2': os.path.join(ROOT, 'runs', 'configs', 'config-run2'),
+}
+
+
+def stats(samples):
+    """Millisecond summary of a list of durations in seconds."""
+    ms = np.asarray(samples, dtype=np.float64) * 1000.0
+    return {
+        'mean': float(ms.mean()),
+        'p50': float(np.percentile(ms, 50)),
+        'p95': float(np.percentile(ms, 95)),
+        'max': float(ms.max()),
+        'n': int(len(ms)),
+    }
+
+
+def timed(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def make_population(run, seed):
+    random.seed(seed)
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIGS[run])
+    return config, list(neat.Population(config).population.items())
+
+
+def make_brain(run, server):
+    """The run's NeatoBrain, talking to the stand-in (screen included)."""
+    if run == 'run1':
+        brain = run1_awakening.NeatoBrain()
+        brain.bridge = neato_client.NeatoBridge(port=server.port, frame_source=server.render)
+        return brain, brain.bridge
+
+    settings = neato_settings.NeatoSettings.from_file(CONFIGS[run])
+    # One stand-in, and nothing written to disk
+    settings.bridge_port = server.port
+    settings.bridge_count = 1
+    settings.phenotype_cache_dir = ''
+    settings.record_dir = ''
+    brain = run2_runner.NeatoBrain(settings)
+    bridge = brain.pool.bridges[0]
+    bridge.capture_session.source = server.render
+    return brain, bridge
+
+
+def input_count(run, substrate):
+    return substrate.all_input_coords.shape[0] if run == 'run2' else substrate.input_coords.shape[0]
+
+
+def walker_weights(run, substrate, server):
+    """Right output = 0.01 * (current screen . screen): positive all episode, so it plays 600 frames."""
+    bridge = neato_client.NeatoBridge(port=server.port, frame_source=server.render)
+    bridge.connect()
+    bridge.reset()
+    screen = np.empty(substrate.input_coords.shape[0], dtype=np.float32)
+    bridge.capture_into(screen)
+    bridge.close()
+
+    weights = np.zeros((input_count(run, substrate), len(substrate.active_buttons)))
+    weights[:len(screen), substrate.active_buttons.index('Right')] = screen * 0.01
+    return weights
+
+
+def bench_build(run, genomes, config):
+    substrate = (run1_awakening if run == 'run1' else run2_runner).Substrate()
+    samples = []
+    weights = None
+    for _, genome in genomes:
+        start = time.perf_counter()
+        cppn = neat.nn.FeedForwardNetwork.create(genome, config)
+        weights = substrate.build_phenotype(cppn, config)
+        samples.append(time.perf_counter() - start)
+    return stats(samples), weights
+
+
+def bench_inference(run, weights, frames):
+    rng = np.random.default_rng(0)
+    if run == 'run1':
+        # run1_awakening's loop: float64 inputs, np.dot, sigmoid
+        inputs = rng.uniform(-1, 1, weights.shape[0])
+        return stats(timed(lambda: 1 / (1 + np.exp(-np.dot(inputs, weights))), frames))
+
+    policy = neato_policy.Policy(weights, run2_runner.Substrate().active_buttons, feedback=True)
+    policy.screen[:] = rng.uniform(-1, 1, policy.n_pixels)
+    return stats(timed(policy.act, frames))
+
+
+def bench_rtt(server, binary, requests):
+    bridge = neato_client.NeatoBridge(port=server.port, binary=binary)
+    bridge.connect()
+    bridge.reset()
+    samples = timed(lambda: bridge.step(neato_client.BUTTON_MASKS['right']), requests)
+    bridge.close()
+    return stats(samples)
+
+
+def bench_episodes(run, server, episodes):
+    brain, bridge = make_brain(run, server)
+    weights = walker_weights(run, brain.substrate, server)
+    frames = 0
+    start = time.perf_counter()
+    for _ in range(episodes):
+        start_frame = server.frame
+        if run == 'run1':
+            brain.run_simulation(weights)
+        else:
+            brain.run_simulation(weights, bridge)
+        frames += server.frame - start_frame
+    elapsed = time.perf_counter() - start
+    if run == 'run2':
+        brain.close()
+    else:
+        bridge.close()
+    return {'episodes_per_s': episodes / elapsed, 'frames_per_s': frames / elapsed, 'episodes': episodes}
+
+
+def bench_generation(run, server, genomes, config):
+    brain, bridge = make_brain(run, server)
+    start = time.perf_counter()
+    brain.evaluate(genomes, config)
+    elapsed = time.perf_counter() - start
+    if run == 'run2':
+        brain.close()
+    else:
+        bridge.close()
+    return {'seconds': elapsed, 'genomes': len(genomes)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(runs, genomes=None, frames=2000, episodes=3, requests=500, frame_time=0.0, seed=0):
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'frame_time': frame_time,
+            'seed': seed,
+        },
+    }
+
+    # The runs print every genome and connection; keep the JSON output clean
+    with neato_standin.StandInBridge(frame_time=frame_time) as server, \
+            contextlib.redirect_stdout(io.StringIO()):
+        results['bridge_rtt'] = {
+            'binary': bench_rtt(server, True, requests),
+            'text': bench_rtt(server, False, requests),
+        }
+        for run in runs:
+            config, population = make_population(run, seed)
+            population = population[:genomes] if genomes else population
+            build, weights = bench_build(run, population, config)
+            results[run] = {
+                'build': build,
+                'inference': bench_inference(run, weights, frames),
+                'episodes': bench_episodes(run, server, episodes),
+                'generation': bench_generation(run, server, population, config),
+            }
+    return results
+
+
+def flatten(tree, prefix=''):
+    for key, value in tree.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f"{prefix}{key}.")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and key not in ('n', 'seed'):
+            yield prefix + key, value
+
+
+def compare(base_path, new_path):
+    with open(base_path) as f:
+        base = dict(flatten({k: v for k, v in json.load(f).items() if k != 'meta'}))
+    with open(new_path) as f:
+        new = dict(flatten({k: v for k, v in json.load(f).items() if k != 'meta'}))
+    print(f"{'metric':<36} | {'before':>10} | {'after':>10} | {'ratio':>6}")
+    for name in sorted(set(base) & set(new)):
+        ratio = new[name] / base[name] if base[name] else float('nan')
+        print(f"{name:<36} | {base[name]:>10.3f} | {new[name]:>10.3f} | {ratio:>6.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', nargs='+', choices=sorted(CONFIGS), default=sorted(CONFIGS))
+    parser.add_argument('--genomes', type=int, default=None, help="genomes per generation (default: pop_size)")
+    parser.add_argument('--frames', type=int, default=2000, help="inference samples")
+    parser.add_argument('--episodes', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=500, help="round trips per protocol")
+    parser.add_argument('--frame-time', type=float, default=0.0, help="seconds per emulated stand-in frame")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the JSON here instead of stdout")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    results = run_suite(args.runs, args.genomes, args.frames, args.episodes, args.requests,
+                        args.frame_time, args.seed)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
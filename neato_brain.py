@@ -1,23 +1,40 @@
+import cProfile
 import neat
 import numpy as np
 import neato_client
+import neato_build
+import neato_cache
+import neato_distributed
+import neato_lockstep
+import neato_memo
+import neato_metrics
+import neato_pipeline
+import neato_policy
+import neato_novelty
+import neato_observation
+import neato_pool
+import neato_racing
+import neato_settings
+import neato_sparse
+import neato_termination
+import neato_timing
+import neato_trajectory
 import time
 import pickle
-import cv2
 
 class Substrate:
-    def __init__(self, width=128, height=112):
-        self.width = width
-        self.height = height
+    def __init__(self, width=128, height=112, hidden_width=0, hidden_height=0, weight_threshold=0.2,
+                 layout=None):
+        # What the network sees (see neato_observation): one width x height frame
+        # unless the layout crops, downsamples, stacks or differences it, or is
+        # the tile grid around Mario (coordinates are then relative to him)
+        self.layout = layout or neato_observation.ObservationLayout(width, height)
+        self.width = self.layout.width
+        self.height = self.layout.height
         
-        # Generate coordinate grids (normalized -1 to 1)
-        # Shape: (height, width)
-        x_range = np.linspace(-1, 1, width)
-        y_range = np.linspace(-1, 1, height)
-        self.input_x, self.input_y = np.meshgrid(x_range, y_range)
-        
-        # Flatten to (N, 1)
-        self.input_coords = np.column_stack((self.input_x.flatten(), self.input_y.flatten()))
+        # Generate coordinate grids (normalized -1 to 1), one (x, y) per input
+        # in input order: (N, 2)
+        self.input_coords = self.layout.coords()
         
         # Define Output Coordinates (Buttons)
         # We place them in a geometric arrangement to give the AI spatial hints
@@ -39,165 +56,405 @@ class Substrate:
             self.output_coords.append([x, y])
         self.output_coords = np.array(self.output_coords)
 
+        # Optional hidden ("Processing") grid between inputs and buttons.
+        # Its connections are pruned below weight_threshold and stored sparse.
+        self.hidden_coords = None
+        self.weight_threshold = weight_threshold
+        if hidden_width > 0 and hidden_height > 0:
+            self.hidden_coords = neato_sparse.hidden_grid(hidden_width, hidden_height)
+            self.layers = (self.input_coords, self.hidden_coords, self.output_coords)
+        else:
+            self.layers = (self.input_coords, self.output_coords)
+
     def build_phenotype(self, cppn, config):
         """
         Constructs the weight matrix from Input -> Output using the CPPN.
-        Returns a function that takes an image and returns button probabilities.
+        Returns the (N_inputs, N_outputs) weight matrix.
         """
         # We need to query CPPN for every pair of (Input, Output)
         # Input: (N_pixels, 2)
         # Output: (N_buttons, 2)
-        # Total weights: N_pixels * N_buttons
-        
-        # Broadcast inputs and outputs to create all pairs
-        # This can be memory intensive. Let's do it per output neuron to save memory.
-        
-        weights = np.zeros((self.input_coords.shape[0], self.output_coords.shape[0]))
-        
-        for i in range(self.output_coords.shape[0]):
-            out_x, out_y = self.output_coords[i]
-            print(f"Building weights for Output {i+1}/{self.output_coords.shape[0]}...")
-            
-            # Create inputs for CPPN: x1, y1, x2, y2
-            # x1, y1 are all input pixels
-            # x2, y2 are constant for this output neuron
-            
-            # We can batch query the CPPN if it supports it, but neat-python CPPN is usually node-by-node.
-            # However, neat-python's FeedForwardNetwork.activate is for a single input vector.
-            # We need to iterate. This is the slow part of HyperNEAT construction.
-            # Optimization: The CPPN is usually small.
-            
-            for j in range(self.input_coords.shape[0]):
-                in_x, in_y = self.input_coords[j]
-                # Query CPPN
-                # Inputs: x1, y1, x2, y2
-                w = cppn.activate([in_x, in_y, out_x, out_y])[0]
-                weights[j, i] = w
-                
-        return weights
+        # CompiledCPPN evaluates all pairs as numpy arrays in one pass instead of
+        # calling cppn.activate() once per pixel per button.
+        # With a hidden grid this is a neato_sparse.SparsePhenotype instead.
+        return neato_build.build_phenotype(cppn, self.layers, self.weight_threshold)
 
 class NeatoBrain:
-    def __init__(self):
-        self.substrate = Substrate()
-        self.bridge = neato_client.NeatoBridge()
+    max_frames = 600 # 10 seconds limit to start
+    # Part of every memoized fitness's key: bump it when run_simulation's fitness changes
+    fitness_version = 'neato_brain/1'
+
+    def __init__(self, settings=None):
+        self.settings = settings or neato_settings.NeatoSettings()
+        layout = neato_observation.ObservationLayout.from_settings(self.settings)
+        self.substrate = Substrate(
+            hidden_width=self.settings.hidden_width,
+            hidden_height=self.settings.hidden_height,
+            weight_threshold=self.settings.weight_threshold,
+            layout=layout)
+        self.pool = neato_pool.EvaluationPool(
+            base_port=self.settings.bridge_port,
+            count=self.settings.bridge_count,
+            timeout=self.settings.bridge_timeout,
+            layout=layout)
+        self.cache = None
+        if self.settings.phenotype_cache_size > 0 or self.settings.phenotype_cache_dir:
+            self.cache = neato_cache.PhenotypeCache(
+                max_entries=self.settings.phenotype_cache_size,
+                cache_dir=self.settings.phenotype_cache_dir)
+        self.builder = neato_build.PhenotypeBuilder(
+            self.substrate.input_coords, self.substrate.output_coords,
+            workers=self.settings.build_workers, cache=self.cache,
+            hidden_coords=self.substrate.hidden_coords,
+            weight_threshold=self.substrate.weight_threshold)
+        # Lockstep mode: concurrent episodes share one batched product per frame
+        self.batch = None
+        if self.settings.lockstep:
+            self.batch = neato_lockstep.LockstepBatch(
+                self.settings.bridge_count,
+                self.substrate.input_coords.shape[0], len(self.substrate.active_buttons))
+        # Trajectory recording (see neato_trajectory), off unless record_dir is set
+        self.recorder = None
+        if self.settings.record_dir:
+            # Recordings keep the newest full 128x112 frame of every observation
+            if layout.source != 'screen' or (layout.height, layout.width) != neato_trajectory.OBSERVATION_SHAPE:
+                raise RuntimeError("record_dir needs screen observations without crop or downsampling")
+            self.recorder = neato_trajectory.TrajectoryRecorder(self.settings.record_dir)
+        # When episodes end early (death, level clear, pits, ...), and why they ended
+        self.termination = neato_termination.TerminationPolicy.from_settings(self.settings)
+        # Successive-halving horizons (a single full-length rung unless racing_horizons is set)
+        self.racing = neato_racing.SuccessiveHalving.from_settings(self.settings, self.max_frames)
+        # Per-stage timings of every episode (see neato_timing.TimingReporter)
+        self.timings = neato_timing.GenerationTimes()
+        # Novelty search over the episodes' trajectories (off unless novelty_weight > 0)
+        self.novelty = neato_novelty.NoveltySearch.from_settings(self.settings, self.max_frames)
+        # Optional neato_checkpoint.CheckpointStore: finished genomes are recorded as
+        # they come in, and a generation resumed mid-way doesn't replay them
+        self.checkpoints = None
+        # Results of episodes already played, handed back instead of replaying them (see neato_memo)
+        self.memo = neato_memo.FitnessMemo.from_settings(self.settings, self.fitness_version)
+        # Remote workers play the episodes instead of the local pool (see neato_distributed)
+        self.coordinator = None
+        if self.settings.coordinator_port > 0:
+            self.coordinator = neato_distributed.Coordinator(
+                self.settings.coordinator_host, self.settings.coordinator_port,
+                heartbeat_timeout=self.settings.worker_timeout,
+                join_timeout=self.settings.worker_wait)
         
     def evaluate(self, genomes, config):
         """
         Evaluates a population of genomes.
         """
-        for genome_id, genome in genomes:
-            # 1. Build CPPN
-            cppn = neat.nn.FeedForwardNetwork.create(genome, config)
-            
-            # 2. Build Phenotype (Weight Matrix)
-            # This maps 14k pixels -> 8 buttons
-            weights = self.substrate.build_phenotype(cppn, config)
-            
-            # 3. Run Game
-            fitness = self.run_simulation(weights)
-            genome.fitness = fitness
-            print(f"Genome {genome_id} Fitness: {fitness}")
+        # 1-2. Build CPPNs and Phenotypes (Weight Matrices)
+        # This maps 14k pixels -> 8 buttons. With build_workers > 1 the whole
+        # population is built in a process pool and weights arrive as soon as
+        # each one finishes, so the game can start on the first genome early.
+        # Emulators run unthrottled (and muted, ...) while evaluating
+        self.pool.set_turbo(self.settings.turbo)
+        resumed, resumed_behaviors = self.checkpoints.take_resumed() if self.checkpoints is not None else ({}, {})
+        if resumed:
+            print(f"Resuming the generation: {len(resumed)} genomes were already played")
+        playing = [(genome_id, genome) for genome_id, genome in genomes if genome_id not in resumed]
+
+        # Behavior descriptors, by genome (the longest horizon played wins)
+        behaviors = dict(resumed_behaviors)
+        # Genomes built to be played, i.e. not resumed or memoized
+        building = list(playing)
+        def jobs():
+            if self.memo is not None:
+                # Genomes memoized for every rung are never played, so never built
+                building.clear()
+                for genome_id, genome in playing:
+                    if self.memo.plan(genome_id, genome, self.builder.geometry, self.racing.horizons):
+                        yield genome_id, None
+                    else:
+                        building.append((genome_id, genome))
+            for genome_id, genome, weights in self.builder.build_all(building, config):
+                seconds = self.builder.build_seconds.pop(genome_id, None)
+                if seconds is not None:
+                    self.timings.for_genome(genome_id).add('build', seconds)
+                yield genome_id, weights
+
+        def recalled(genome_id, fitness, descriptor):
+            # Keep finished genomes across a crash (racing rungs aren't final)
+            if self.checkpoints is not None and len(self.racing.horizons) == 1:
+                self.checkpoints.record_fitness(genome_id, fitness, descriptor)
+            if descriptor is not None:
+                behaviors[genome_id] = descriptor
+
+        def finished(genome_id, horizon, fitness, outcome, descriptor, seconds):
+            recalled(genome_id, fitness, descriptor)
+            # An empty outcome means the episode never started (no bridge, failed reset)
+            if self.memo is not None and outcome:
+                self.memo.store(genome_id, horizon, fitness, outcome, descriptor, seconds)
+
+        # 3. Run Game
+        # Each weight matrix goes to whichever emulator is free
+        def episode(bridge, job):
+            genome_id, weights, horizon = job
+            behavior = self.novelty.tracker() if self.novelty is not None else None
+            outcome = {}
+            start = time.perf_counter()
+            fitness = self.play_episode(bridge, genome_id, weights, horizon,
+                                        self.timings.for_genome(genome_id), behavior, outcome)
+            # A lost bridge's genome is requeued rather than finished
+            if bridge.sock is not None:
+                finished(genome_id, horizon, fitness, outcome,
+                         behavior.descriptor() if behavior is not None else None, time.perf_counter() - start)
+            return fitness
+
+        # Remote episodes: the worker's telemetry goes where the local episode's would have
+        def received(job, fitness, telemetry):
+            genome_id, _, horizon, _ = job
+            self.timings.for_genome(genome_id).extend(telemetry['timings'])
+            outcome = telemetry['outcome']
+            if outcome:
+                self.termination.tally(outcome['reason'], outcome['frames'], outcome['saved'])
+            finished(genome_id, horizon, fitness, outcome, telemetry['behavior'], telemetry['seconds'])
+
+        # With racing_horizons set, every genome plays a short horizon first and
+        # only the best go on to longer ones (see neato_racing)
+        def play(rung_jobs, horizon):
+            if self.coordinator is not None:
+                samples = self.novelty.samples if self.novelty is not None else 0
+                return self.coordinator.evaluate(((genome_id, weights, horizon, samples)
+                                                  for genome_id, weights in rung_jobs), received)
+            return self.pool.evaluate(((genome_id, weights, horizon) for genome_id, weights in rung_jobs), episode)
+
+        if self.memo is not None:
+            fitnesses = self.racing.run(jobs(), lambda rung_jobs, horizon: self.memo.play(rung_jobs, horizon, play,
+                                                                                           recalled))
+        else:
+            fitnesses = self.racing.run(jobs(), play)
+
+        # Resumed genomes' fitness was recorded before the novelty blend, so
+        # they are blended with the rest of the generation
+        fitnesses.update(resumed)
+        # Blend in how new each behavior is
+        if self.novelty is not None:
+            fitnesses.update(self.novelty.combine(behaviors, fitnesses))
+            print(f"Novelty: mean {self.novelty.last_mean:.1f}, archive of {len(self.novelty.archive)} behaviors")
+
+        for genome_id, genome in sorted(genomes, key=lambda item: item[0]):
+            genome.fitness = fitnesses.get(genome_id, 0)
+            print(f"Genome {genome_id} Fitness: {genome.fitness}")
+
+        if self.cache is not None:
+            hits, misses = self.cache.end_generation()
+            print(f"Phenotype cache: {hits} hits, {misses} misses")
+
+        if self.batch is not None and self.batch.batches:
+            print(f"Lockstep: {self.batch.batches} batched frames, "
+                  f"{self.batch.mean_batch_size():.2f} episodes per batch")
+            self.batch.batches = self.batch.rows = 0
+
+        reasons, saved, played = self.termination.end_generation()
+        if reasons:
+            print("Episodes ended by " + ", ".join(f"{reason}: {count}" for reason, count in reasons.most_common())
+                  + f" ({saved} frames saved by early termination)")
+        if len(self.racing.horizons) > 1:
+            print("Racing: " + " -> ".join(f"{size} genomes x {horizon}" for size, horizon
+                                           in zip(self.racing.rung_sizes, self.racing.horizons)) + " frames")
+        if self.memo is not None:
+            skipped, frames, seconds, verified, mismatched = self.memo.end_generation()
+            print(f"Fitness memo: {skipped} episodes skipped ({frames} frames, {seconds:.1f} s of play saved)"
+                  + (f", {verified} verified, {mismatched} mismatched" if verified else ""))
+        budget = len(building) * self.max_frames
+        if budget:
+            print(f"Emulated frames: {played} of the fixed {budget}-frame budget ({played / budget:.0%})")
+
+        if self.recorder is not None:
+            self.recorder.end_generation()
 
-    def run_simulation(self, weights):
+        self.timings.end_generation()
+
+        if self.coordinator is not None:
+            episodes = self.coordinator.end_generation()
+            print("Workers: " + (", ".join(f"{name}: {count}" for name, count in sorted(episodes.items()))
+                                 or "none") + f" episodes ({self.coordinator.requeued} genomes reassigned so far)")
+
+        for bridge in self.pool.bridges:
+            stats = bridge.capture_session.latency_stats()
+            if stats:
+                print(f"Capture latency (port {bridge.port}): mean {stats['mean'] * 1000:.1f} ms, "
+                      f"p95 {stats['p95'] * 1000:.1f} ms, {stats['budget_used']:.0%} of the 60 fps frame budget")
+
+    def close(self):
+        self.builder.close()
+        self.pool.close()
+        if self.coordinator is not None:
+            self.coordinator.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def replay(self, genome, config):
+        """
+        Plays genome once on the first emulator with turbo mode off (normal
+        speed, screen and sound on) so it can be watched. Returns its fitness,
+        or None if there is no emulator here (e.g. all of them are on workers).
+        """
+        self.pool.set_turbo(False)
+        bridge = self.pool.bridges[0]
+        if not bridge.sock and not bridge.connect():
+            print("No emulator to replay the winner on")
+            return None
+        _, _, weights = next(self.builder.build_all([(genome.key, genome)], config))
+        self.builder.build_seconds.pop(genome.key, None)
+        return self.run_simulation(weights, bridge)
+
+    def play_episode(self, bridge, genome_id, weights, horizon, timings, behavior=None, outcome=None):
+        """
+        One episode of genome_id for horizon frames, with the bridge's stage
+        timings going to timings (and under cProfile if it's profile_genome).
+        Used by evaluate() and by neato_distributed.Worker. Returns the fitness.
+        """
+        bridge.timings = timings
+        profiler = None
+        if genome_id == self.settings.profile_genome:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            # Sparse phenotypes can't be stacked, they always run on their own
+            if self.batch is None or not isinstance(weights, np.ndarray):
+                return self.run_simulation(weights, bridge, horizon, behavior, outcome)
+            with self.batch.seat(weights) as seat:
+                return self.run_simulation(seat, bridge, horizon, behavior, outcome)
+        finally:
+            bridge.timings = None
+            if profiler is not None:
+                profiler.disable()
+                path = self.settings.profile_output or f"genome-{genome_id}.prof"
+                profiler.dump_stats(path)
+                print(f"Profile of genome {genome_id} written to {path}")
+
+    def run_simulation(self, weights, bridge, max_frames=None, behavior=None, outcome=None):
         """
-        Runs the game for a single agent.
+        Runs the game for a single agent on the given bridge, for at most
+        max_frames emulated frames (default: the full budget). Mario's
+        positions go to behavior (a neato_novelty.BehaviorTracker) if given,
+        and the termination reason, frames played and frames saved to the
+        outcome dict.
         """
         # Connect if not already connected
-        if not self.bridge.sock:
-            if not self.bridge.connect():
+        if not bridge.sock:
+            if not bridge.connect():
                 print("Could not connect to bridge!")
                 return 0
             
-        # Always reset to save state at start of each genome evaluation
-        self.bridge.reset()
-        time.sleep(0.5)  # Give save state time to load
-        
-        # Read initial state to verify we're in the level
-        img = self.bridge.get_state()
-        if img is None:
+        # Always reset to save state at start of each genome evaluation.
+        # reset() returns once the state is applied, with the post-reset game
+        # variables already read, so there's no need to sleep or re-query.
+        if bridge.reset() is None or bridge.geometry is None:
             print("Failed to get initial state!")
             return 0
         
-        initial_x = self.bridge.mario_x
+        # Pipelined stepping: the next screen is grabbed while each step is in
+        # flight (see neato_pipeline for the observation lag this implies)
+        if self.settings.pipeline_depth > 0:
+            bridge = neato_pipeline.PipelinedBridge(bridge, self.settings.pipeline_depth)
+        
+        initial_x = bridge.mario_x
         print(f"  Starting position: X={initial_x}")
         
         # Initial State
-        max_frames = 600 # 10 seconds limit to start
+        max_frames = max_frames or self.max_frames
         current_frame = 0
         max_distance = initial_x  # Start from actual initial position
         stagnation_counter = 0
+        start_mode = bridge.game_mode  # Mode changes after this end the episode
+        if behavior is not None:
+            behavior.start(bridge.mario_x, bridge.mario_y)
+        reason = neato_termination.MAX_FRAMES
         right_press_count = 0  # Track how many frames RIGHT was pressed
+        # Action repeat: each decision is held for this many emulated frames.
+        # All counters below are in emulated frames, so fitness stays
+        # comparable whatever the setting.
+        action_repeat = self.settings.action_repeat
+        
+        # Inputs, outputs and the button logic are compiled once per genome
+        policy = neato_policy.Policy(weights, self.substrate.active_buttons,
+                                     n_inputs=self.substrate.input_coords.shape[0])
+        right_bit = neato_client.BUTTON_MASKS['right']
+        # Optional recording of every decision (observation, RAM, buttons)
+        recording = self.recorder.start_episode() if self.recorder is not None else None
+        # The bridge times reset, grab, preprocess and step; inference and recording are timed here
+        timings = bridge.timings
+        if timings is None:
+            timings = neato_timing.StageTimes()
         
         while current_frame < max_frames:
             # 1. Get Input
-            # We need the raw image. The bridge returns it via get_state()
-            # but get_state also updates metadata.
-            # We need to access the image data directly or modify get_state to return it.
-            # Currently get_state returns the image.
-            img = self.bridge.get_state()
-            
-            if img is None:
+            # The game variables were already refreshed by the last step(), so
+            # only the screen is needed here (no GET_STATE round trip).
+            # capture_into() crops, converts to grayscale (14k vs 42k weights),
+            # downsamples and normalizes to -1..1 straight into the buffer.
+            if bridge.capture_into(policy.screen) is None:
+                reason = neato_termination.BRIDGE_LOST
                 break
                 
-            # Flatten image to (N,)
-            # Convert to grayscale for simplicity first? Or keep RGB?
-            # Let's do Grayscale to save weights (14k vs 42k)
-            img_gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            inputs = (img_gray.flatten() / 127.5) - 1.0  # Normalize to -1 to 1
-            
-            # 2. Activate Network (Matrix Mult)
-            # (1, N) dot (N, Outputs) = (1, Outputs)
-            outputs = np.dot(inputs, weights)
-            
-            # 3. Decide Buttons (Sigmoid activation)
-            # Sigmoid ranges from 0 to 1, threshold at 0.5
-            outputs = 1 / (1 + np.exp(-outputs))
-            
-            buttons = {}
-            for i, btn_name in enumerate(self.substrate.active_buttons):
-                buttons[btn_name] = outputs[i] > 0.5  # Press if > 0.5
-                
-            # Prevent conflicting directional inputs
-            
-            # Prevent conflicting directional inputs
-            # Left+Right cancel each other out in SNES
-            if buttons.get('Left') and buttons.get('Right'):
-                # Keep the one with stronger output
-                left_idx = self.substrate.active_buttons.index('Left')
-                right_idx = self.substrate.active_buttons.index('Right')
-                if abs(outputs[left_idx]) > abs(outputs[right_idx]):
-                    buttons['Right'] = False
-                else:
-                    buttons['Left'] = False
+            # 2-3. Activate Network and Decide Buttons
+            # (1, N) dot (N, Outputs), then press where sigmoid > 0.5. Left+Right
+            # conflicts are resolved in favour of the stronger output.
+            start = time.perf_counter()
+            buttons = policy.act()
+            timings.add('infer', time.perf_counter() - start)
                 
             # 4. Send Action
-            self.bridge.act(buttons)
+            # step() holds the buttons for `frames` frames and returns with
+            # fresh RAM values (one STEP message on the binary protocol)
+            frames = min(action_repeat, max_frames - current_frame)
+            if recording is not None:
+                start = time.perf_counter()
+                recording.append(policy.screen[:self.substrate.layout.plane_size], bridge, buttons, frames)
+                timings.add('record', time.perf_counter() - start)
+            if not bridge.step(buttons, repeat=frames):
+                reason = neato_termination.BRIDGE_LOST
+                break
             
             # Track Right presses for exploration bonus
-            if buttons.get('Right', False):
-                right_press_count += 1
+            if buttons & right_bit:
+                right_press_count += frames
             
             # 5. Check Fitness
             # Simple fitness: Max X position
-            current_distance = self.bridge.mario_x
+            current_distance = bridge.mario_x
             if current_distance > max_distance:
                 max_distance = current_distance
                 stagnation_counter = 0
             else:
-                stagnation_counter += 1
+                stagnation_counter += frames
                 
             # Early exit if stuck
-            if stagnation_counter > 60: # 1 second stuck
+            if stagnation_counter > self.termination.stagnation_frames: # 1 second stuck
+                reason = neato_termination.STAGNATION
                 break
                 
-            current_frame += 1
+            current_frame += frames
+            if behavior is not None:
+                behavior.record(current_frame, bridge.mario_x, bridge.mario_y)
+            
+            # Early exit on death, level clear, pits, ... (no point playing them out)
+            ended = self.termination.check(bridge, start_mode)
+            if ended is not None:
+                reason = ended
+                break
+        
+        # Don't leave STEP replies unread for the next episode's reset
+        if self.settings.pipeline_depth > 0:
+            bridge.drain()
+        saved = self.termination.finish(reason, current_frame, max_frames, stagnation_counter, action_repeat)
+        if outcome is not None:
+            outcome.update(reason=reason, frames=current_frame, saved=saved)
         
         # Calculate fitness with exploration bonus
         # Add bonus for pressing Right to encourage exploration
         # Increased to 1.0 to make it significant
         right_press_bonus = 1.0 * right_press_count
             
-        return max_distance + right_press_bonus
+        fitness = max_distance + right_press_bonus
+        if recording is not None:
+            self.recorder.finish(recording, fitness, reason)
+        return fitness
 
 def run(config_path):
     config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
@@ -211,12 +468,29 @@ def run(config_path):
     stats = neat.StatisticsReporter()
     p.add_reporter(stats)
     
-    brain = NeatoBrain()
-    winner = p.run(brain.evaluate, 10) # Run for 10 generations
-    
-    # Save winner
-    with open('winner.pkl', 'wb') as f:
-        pickle.dump(winner, f)
+    brain = NeatoBrain(neato_settings.NeatoSettings.from_file(config_path))
+    # Where each generation's time went (build, capture, inference, round trips)
+    p.add_reporter(neato_timing.TimingReporter(brain.timings))
+    # Live metrics for dashboards (off unless metrics_port is set)
+    metrics = neato_metrics.MetricsReporter.from_settings(brain.settings, brain)
+    if metrics is not None:
+        p.add_reporter(metrics)
+    try:
+        winner = p.run(brain.evaluate, 10) # Run for 10 generations
+        # Save winner before the replay, so nothing that goes wrong there can lose it
+        with open('winner.pkl', 'wb') as f:
+            pickle.dump(winner, f)
+        # Watch the winner at normal speed
+        try:
+            fitness = brain.replay(winner, config)
+            if fitness is not None:
+                print(f"Winner replay fitness: {fitness}")
+        except Exception as e:
+            print(f"Could not replay the winner: {e}")
+    finally:
+        brain.close()
+        if metrics is not None:
+            metrics.close()
 
 if __name__ == "__main__":
     run("config-feedforward")
@@ -4,10 +4,67 @@
 local socket = require("socket.core")
 
 local HOST = "127.0.0.1"
-local PORT = 8086
+-- Each emulator in an evaluation pool needs its own port.
+-- Start BizHawk with NEATO_PORT=8087 (8088, ...) to run several side by side.
+local PORT = tonumber(os.getenv("NEATO_PORT") or "") or 8086
 local server = nil
 local tcp_client = nil -- Renamed from client to avoid shadowing Bizhawk API
 
+-- Binary protocol (v3)
+-- A client that sends the text command "HELLO 3" is answered "NEATO_BIN 3" and
+-- the connection switches to binary. Any other (or no) version is answered
+-- "NEATO_BIN 3" too, but the connection stays on text. In binary, every
+-- message is a u16 little-endian length followed by that many bytes; the
+-- first byte is the opcode. All requests are answered with a STATE message:
+--   u8 opcode (0x81), u8 flags, u32 frame, u16 mario_x, u16 mario_y,
+--   u8 game_mode, u8 level_index, u8 end_level_timer, u8 anim_state
+--   [+ 6 x i32 window geometry x, y, w, h, bx, by when flags has bit 0 set]
+-- The geometry is only included when it changed since the last reply.
+-- Flags bit 1 means the request failed (e.g. an unknown savestate handle).
+-- After OP_TILES every STATE also carries the tile grid around Mario (flags
+-- bit 2): width * height u8 cells, row-major, after the geometry.
+local PROTOCOL_VERSION = 3
+local OP_STEP = 1      -- u16 button mask, u8 repeat: hold for repeat frames, then STATE
+local OP_GET_STATE = 2
+local OP_RESET = 3     -- restore the start state, then STATE
+local OP_SAVE = 4      -- u16 handle: snapshot the emulator into memory
+local OP_LOAD = 5      -- u16 handle: restore a snapshot, then STATE
+local OP_DROP = 6      -- u16 handle: free a snapshot
+local OP_TILES = 7     -- u8 width, u8 height: send the tile grid with every STATE (0 x 0 = off)
+local OP_TURBO = 8     -- u8 mode: enter turbo training mode (TURBO_* bits), 0 = back to normal
+local OP_STATE = 129
+local FLAG_GEOMETRY = 1
+local FLAG_ERROR = 2
+local FLAG_TILES = 4
+
+-- Tile grid cells (must match TILE_* in neato_observation.py). Each cell is
+-- one 16x16 level tile; the grid is centred on Mario.
+local TILE_EMPTY = 0
+local TILE_SOLID = 1
+local TILE_SPRITE = 2
+local unpack = table.unpack or unpack
+
+-- Turbo training mode bits (must match TURBO_* in neato_client.py)
+local TURBO_UNTHROTTLED = 1  -- run as fast as the host allows
+local TURBO_NO_RENDER = 2    -- stop drawing the screen (only when nothing grabs it)
+local TURBO_MUTE = 4
+
+-- Bit i of a button mask (must match BUTTON_BITS in neato_client.py)
+local BUTTON_BITS = {"B", "Y", "Select", "Start", "Up", "Down", "Left", "Right", "A", "X", "L", "R"}
+
+local binary_mode = false
+local rx_buffer = ""
+local last_geometry = nil
+local tile_width = 0
+local tile_height = 0
+local turbo_mode = 0
+local normal_sound = nil
+
+-- In-memory savestates (memorysavestate ids), keyed by client handle.
+-- The start state (slot 1) is read from disk once and then kept in memory.
+local saved_states = {}
+local reset_state_id = nil
+
 -- Initialize Server
 function init_server()
     print("Attempting to start server on " .. HOST .. ":" .. PORT)
@@ -20,7 +77,7 @@ function init_server()
     end
     server:listen(1)
     server:settimeout(0) -- Non-blocking
-    print("Server started v17 (Port " .. PORT .. "). Waiting for connection...")
+    print("Server started v22 (Port " .. PORT .. "). Waiting for connection...")
     return true
 end
 
@@ -31,6 +88,16 @@ function accept_client()
     if new_client then
         tcp_client = new_client
         tcp_client:settimeout(0)
+        -- Every connection starts on the text protocol
+        binary_mode = false
+        rx_buffer = ""
+        last_geometry = nil
+        tile_width = 0
+        tile_height = 0
+        -- Savestates belong to the connection; the client forgets its handles too
+        drop_all_states()
+        -- A trainer that went away without leaving turbo mode doesn't keep it
+        set_turbo(0)
         print("Client connected!")
     end
 end
@@ -59,80 +126,383 @@ function send_data(data)
     end
 end
 
+-- Send raw bytes (binary protocol)
+function send_raw(data)
+    if tcp_client == nil then return end
+    local res, err = tcp_client:send(data)
+    if not res then
+        print("Failed to send: " .. err)
+        tcp_client = nil
+    end
+end
+
+-- Little-endian packing that works on both Lua 5.1 and 5.4
+function pack_u8(n)
+    return string.char(n % 256)
+end
+
+function pack_u16(n)
+    n = n % 65536
+    return string.char(n % 256, math.floor(n / 256))
+end
+
+function pack_u32(n)
+    n = n % 4294967296 -- Negative window positions wrap like a signed i32
+    return string.char(n % 256, math.floor(n / 256) % 256,
+                       math.floor(n / 65536) % 256, math.floor(n / 16777216) % 256)
+end
+
+-- Receive one length-framed binary message, or nil if it hasn't fully arrived
+function receive_frame()
+    if tcp_client == nil then return nil end
+    local data, err, partial = tcp_client:receive(4096)
+    local chunk = data or partial
+    if chunk and #chunk > 0 then
+        rx_buffer = rx_buffer .. chunk
+    end
+    if err and err ~= "timeout" then
+        print("Client disconnected: " .. err)
+        tcp_client = nil
+        return nil
+    end
+    if #rx_buffer < 2 then return nil end
+    local length = rx_buffer:byte(1) + rx_buffer:byte(2) * 256
+    if #rx_buffer < 2 + length then return nil end
+    local payload = rx_buffer:sub(3, 2 + length)
+    rx_buffer = rx_buffer:sub(3 + length)
+    return payload
+end
+
+-- Window coordinates for Python to capture
+function read_window()
+    local x = 0
+    local y = 0
+    if client.xpos then x = client.xpos() end
+    if client.ypos then y = client.ypos() end
+    
+    local w = 256
+    local h = 224
+    if client.screenwidth then w = client.screenwidth() end
+    if client.screenheight then h = client.screenheight() end
+    
+    -- Also get border info to help crop
+    local bx = 0
+    local by = 0
+    if client.borderwidth then bx = client.borderwidth() end
+    if client.borderheight then by = client.borderheight() end
+    return x, y, w, h, bx, by
+end
+
+-- Game variables (SMW specific)
+function read_ram()
+    -- 0x94 = Mario X (2 bytes)
+    -- 0x96 = Mario Y (2 bytes)
+    local mario_x = memory.read_u16_le(0x94)
+    local mario_y = memory.read_u16_le(0x96)
+    
+    -- Read Game State
+    -- 0x100 = Game Mode (u8)
+    -- 0x13BF = Level Index (u8)
+    -- 0x1493 = End Level Timer (u8) - Non-zero means level finished
+    -- 0x71   = Player Animation (u8) - 9 means dead
+    local game_mode = memory.read_u8(0x100)
+    local level_index = memory.read_u8(0x13BF)
+    local end_timer = memory.read_u8(0x1493)
+    local anim_state = memory.read_u8(0x71)
+    return mario_x, mario_y, game_mode, level_index, end_timer, anim_state
+end
+
+-- Level tiles and sprites around Mario as a tile_width x tile_height grid
+-- (string of u8 cells, row-major). Cell (col, row) looks at the tile under
+-- mario_x + 8 + (col - tile_width / 2) * 16, mario_y + (row - tile_height / 2) * 16.
+function read_tiles()
+    local mario_x = memory.read_u16_le(0x94)
+    local mario_y = memory.read_u16_le(0x96)
+    local left = math.floor(tile_width / 2)
+    local top = math.floor(tile_height / 2)
+    local cells = {}
+    for row = 0, tile_height - 1 do
+        local y = mario_y + (row - top) * 16
+        for col = 0, tile_width - 1 do
+            local x = mario_x + 8 + (col - left) * 16
+            local cell = TILE_EMPTY
+            -- Horizontal levels are 0x1B0 pixels (27 tiles) tall
+            if x >= 0 and y >= 0 and y < 0x1B0 then
+                local tx = math.floor(x / 16)
+                local ty = math.floor(y / 16)
+                -- 0x1C800: Map16 tile numbers (high byte), one 16 x 27 block per screen
+                if memory.read_u8(0x1C800 + math.floor(tx / 16) * 0x1B0 + ty * 16 + tx % 16) == 1 then
+                    cell = TILE_SOLID
+                end
+            end
+            cells[row * tile_width + col + 1] = cell
+        end
+    end
+
+    local function mark(sprite_x, sprite_y)
+        local col = math.floor((sprite_x - mario_x + 8) / 16) + left
+        local row = math.floor((sprite_y - mario_y + 8) / 16) + top
+        if col >= 0 and col < tile_width and row >= 0 and row < tile_height then
+            cells[row * tile_width + col + 1] = TILE_SPRITE
+        end
+    end
+    -- Sprites: 12 slots, 0x14C8 = status (0 = free), position low/high bytes
+    for slot = 0, 11 do
+        if memory.read_u8(0x14C8 + slot) ~= 0 then
+            mark(memory.read_u8(0xE4 + slot) + memory.read_u8(0x14E0 + slot) * 256,
+                 memory.read_u8(0xD8 + slot) + memory.read_u8(0x14D4 + slot) * 256)
+        end
+    end
+    -- Extended sprites (fireballs, ...): 10 slots, 0x170B = number (0 = free)
+    for slot = 0, 9 do
+        if memory.read_u8(0x170B + slot) ~= 0 then
+            mark(memory.read_u8(0x171F + slot) + memory.read_u8(0x1733 + slot) * 256,
+                 memory.read_u8(0x1715 + slot) + memory.read_u8(0x1729 + slot) * 256)
+        end
+    end
+    return string.char(unpack(cells))
+end
+
+function has_bit(mode, bit)
+    return math.floor(mode / bit) % 2 == 1
+end
+
+-- Enter turbo training mode (mode = TURBO_* bits), or go back to how the
+-- emulator was before with mode 0
+function set_turbo(mode)
+    if mode == turbo_mode then return true end
+    if turbo_mode == 0 then
+        normal_sound = client.GetSoundOn()
+    end
+    emu.limitframerate(not has_bit(mode, TURBO_UNTHROTTLED))
+    client.invisibleemulation(has_bit(mode, TURBO_NO_RENDER))
+    if has_bit(mode, TURBO_MUTE) then
+        client.SetSoundOn(false)
+    else
+        client.SetSoundOn(normal_sound)
+    end
+    turbo_mode = mode
+    if mode == 0 then
+        print("Turbo mode off")
+    else
+        print("Turbo mode on (" .. mode .. ")")
+    end
+    return true
+end
+
+-- Restore the start state. Slot 1 comes from disk the first time only.
+function reset_game()
+    if reset_state_id == nil then
+        savestate.loadslot(1)  -- Load slot 1 (1-indexed for slots)
+        reset_state_id = memorysavestate.savecorestate()
+    else
+        memorysavestate.loadcorestate(reset_state_id)
+    end
+    emu.frameadvance()  -- Let the save state fully apply
+end
+
+function save_state(handle)
+    if saved_states[handle] then
+        memorysavestate.removestate(saved_states[handle])
+    end
+    saved_states[handle] = memorysavestate.savecorestate()
+    return true
+end
+
+function load_state(handle)
+    local id = saved_states[handle]
+    if id == nil then return false end
+    memorysavestate.loadcorestate(id)
+    return true
+end
+
+function drop_state(handle)
+    local id = saved_states[handle]
+    if id == nil then return false end
+    memorysavestate.removestate(id)
+    saved_states[handle] = nil
+    return true
+end
+
+function drop_all_states()
+    for handle, id in pairs(saved_states) do
+        memorysavestate.removestate(id)
+    end
+    saved_states = {}
+end
+
+-- Build a binary STATE message (length prefix included)
+function state_message(failed)
+    local x, y, w, h, bx, by = read_window()
+    local flags = 0
+    if failed then flags = FLAG_ERROR end
+    local geometry = ""
+    local key = table.concat({x, y, w, h, bx, by}, ",")
+    if key ~= last_geometry then
+        last_geometry = key
+        flags = flags + FLAG_GEOMETRY
+        geometry = pack_u32(x) .. pack_u32(y) .. pack_u32(w) .. pack_u32(h) .. pack_u32(bx) .. pack_u32(by)
+    end
+
+    local tiles = ""
+    if tile_width > 0 and tile_height > 0 then
+        flags = flags + FLAG_TILES
+        tiles = read_tiles()
+    end
+
+    local mario_x, mario_y, game_mode, level_index, end_timer, anim_state = read_ram()
+    local payload = pack_u8(OP_STATE) .. pack_u8(flags) .. pack_u32(emu.framecount()) ..
+                    pack_u16(mario_x) .. pack_u16(mario_y) ..
+                    pack_u8(game_mode) .. pack_u8(level_index) .. pack_u8(end_timer) .. pack_u8(anim_state) ..
+                    geometry .. tiles
+    return pack_u16(#payload) .. payload
+end
+
+function buttons_from_mask(mask)
+    local buttons = {}
+    for i, name in ipairs(BUTTON_BITS) do
+        if math.floor(mask / 2 ^ (i - 1)) % 2 == 1 then
+            buttons[name] = true
+        end
+    end
+    return buttons
+end
+
+function handle_binary(payload)
+    local opcode = payload:byte(1)
+    local ok = true
+    if opcode == OP_STEP then
+        local mask = payload:byte(2) + payload:byte(3) * 256
+        -- Action repeat: hold the same buttons for several frames without
+        -- waiting for Python in between
+        local repeat_count = 1
+        if #payload >= 4 then repeat_count = math.max(1, payload:byte(4)) end
+        local buttons = buttons_from_mask(mask)
+        for i = 1, repeat_count do
+            joypad.set(buttons, 1) -- joypad.set only lasts for one frame
+            emu.frameadvance()
+        end
+    elseif opcode == OP_RESET then
+        reset_game()
+    elseif opcode == OP_SAVE or opcode == OP_LOAD or opcode == OP_DROP then
+        local handle = payload:byte(2) + payload:byte(3) * 256
+        if opcode == OP_SAVE then
+            ok = save_state(handle)
+        elseif opcode == OP_LOAD then
+            ok = load_state(handle)
+        else
+            ok = drop_state(handle)
+        end
+    elseif opcode == OP_TILES then
+        tile_width = payload:byte(2)
+        tile_height = payload:byte(3)
+    elseif opcode == OP_TURBO then
+        ok = set_turbo(payload:byte(2))
+    elseif opcode ~= OP_GET_STATE then
+        print("Unknown binary opcode: " .. tostring(opcode))
+        ok = false
+    end
+    -- The reply is only sent once the request has been applied, so the
+    -- RAM values in it are already post-reset / post-load
+    send_raw(state_message(not ok))
+end
+
 -- Cleanup on exit
 event.onexit(function()
     print("Shutting down server...")
+    set_turbo(0)
     if tcp_client then tcp_client:close() end
     if server then server:close() end
 end)
 
+-- Handle one text-protocol command
+function handle_text(command)
+    -- Verbose logging for user visibility
+    if command ~= "GET_STATE" then -- Don't spam GET_STATE, it happens every frame
+         -- print("Lua Received: " .. command)
+    end
+    
+    if command == "GET_STATE" then
+        local x, y, w, h, bx, by = read_window()
+        local mario_x, mario_y, game_mode, level_index, end_timer, anim_state = read_ram()
+        
+        send_data(string.format("%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d", x, y, w, h, bx, by, mario_x, mario_y, game_mode, level_index, end_timer, anim_state))
+    elseif command == "HELLO" or string.sub(command, 1, 6) == "HELLO " then
+        -- HELLO <version>: switch this connection to binary only if the client
+        -- speaks our version. Otherwise say which one we speak and stay on text.
+        send_data("NEATO_BIN " .. PROTOCOL_VERSION)
+        if tonumber(string.sub(command, 7)) == PROTOCOL_VERSION then
+            binary_mode = true
+            rx_buffer = ""
+            last_geometry = nil
+        end
+    elseif string.sub(command, 1, 4) == "ACT:" then
+        -- Parse buttons
+        -- Format: ACT:A,B,Up
+        local btn_str = string.sub(command, 5)
+        local buttons = {}
+        for btn in string.gmatch(btn_str, "([^,]+)") do
+            buttons[btn] = true
+        end
+        
+        joypad.set(buttons, 1)
+        emu.frameadvance()
+        send_data("ACT_OK")
+    elseif command == "RESET" then
+        reset_game()
+        send_data("RESET_OK")
+    elseif string.sub(command, 1, 5) == "SAVE:" or string.sub(command, 1, 5) == "LOAD:" or
+           string.sub(command, 1, 5) == "DROP:" then
+        local name = string.sub(command, 1, 4)
+        local handle = tonumber(string.sub(command, 6))
+        local ok = false
+        if handle ~= nil then
+            if name == "SAVE" then
+                ok = save_state(handle)
+            elseif name == "LOAD" then
+                ok = load_state(handle)
+            else
+                ok = drop_state(handle)
+            end
+        end
+        if ok then
+            send_data(name .. "_OK")
+        else
+            send_data("STATE_ERR")
+        end
+    elseif string.sub(command, 1, 6) == "TURBO:" then
+        local mode = tonumber(string.sub(command, 7))
+        if mode ~= nil and set_turbo(mode) then
+            send_data("TURBO_OK")
+        else
+            send_data("TURBO_ERR")
+        end
+    else
+        send_data("UNKNOWN_CMD")
+    end
+end
+
 -- Main Loop
 if init_server() then
     while true do
         accept_client()
         
-        local command = receive_data()
-        if command then
-            -- Verbose logging for user visibility
-            if command ~= "GET_STATE" then -- Don't spam GET_STATE, it happens every frame
-                 -- print("Lua Received: " .. command)
-            end
-            
-            if command == "GET_STATE" then
-                -- Return window coordinates for Python to capture
-                local x = 0
-                local y = 0
-                if client.xpos then x = client.xpos() end
-                if client.ypos then y = client.ypos() end
-                
-                local w = 256
-                local h = 224
-                if client.screenwidth then w = client.screenwidth() end
-                if client.screenheight then h = client.screenheight() end
-                
-                -- Also get border info to help crop
-                local bx = 0
-                local by = 0
-                if client.borderwidth then bx = client.borderwidth() end
-                if client.borderheight then by = client.borderheight() end
-                
-                -- Read Mario's Position (SMW specific)
-                -- 0x94 = Mario X (2 bytes)
-                -- 0x96 = Mario Y (2 bytes)
-                local mario_x = memory.read_u16_le(0x94)
-                local mario_y = memory.read_u16_le(0x96)
-                
-                -- Read Game State
-                -- 0x100 = Game Mode (u8)
-                -- 0x13BF = Level Index (u8)
-                -- 0x1493 = End Level Timer (u8) - Non-zero means level finished
-                -- 0x71   = Player Animation (u8) - 9 means dead
-                local game_mode = memory.read_u8(0x100)
-                local level_index = memory.read_u8(0x13BF)
-                local end_timer = memory.read_u8(0x1493)
-                local anim_state = memory.read_u8(0x71)
-                
-                send_data(string.format("%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d,%d", x, y, w, h, bx, by, mario_x, mario_y, game_mode, level_index, end_timer, anim_state))
-            elseif string.sub(command, 1, 4) == "ACT:" then
-                -- Parse buttons
-                -- Format: ACT:A,B,Up
-                local btn_str = string.sub(command, 5)
-                local buttons = {}
-                for btn in string.gmatch(btn_str, "([^,]+)") do
-                    buttons[btn] = true
-                end
-                
-                joypad.set(buttons, 1)
-                emu.frameadvance()
-                send_data("ACT_OK")
-            elseif command == "RESET" then
-                savestate.loadslot(1)  -- Load slot 1 (1-indexed for slots)
-                emu.frameadvance()  -- Let the save state fully apply
-                send_data("RESET_OK")
-            else
-                send_data("UNKNOWN_CMD")
+        local handled = false
+        if binary_mode then
+            local payload = receive_frame()
+            if payload then
+                handle_binary(payload)
+                handled = true
             end
         else
+            local command = receive_data()
+            if command then
+                handle_text(command)
+                handled = true
+            end
+        end
+        
+        if not handled then
             -- If no command, just advance frame to keep game running?
             -- Or pause? For now, let's just yield
             emu.yield()
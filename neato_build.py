@@ -0,0 +1,161 @@
+"""
+Population-wide phenotype construction.
+
+PhenotypeBuilder turns every genome of a generation into its substrate weight
+matrix (or, with a hidden layer, a pruned neato_sparse.SparsePhenotype). With more than one worker the CPPNs are fanned out to a process pool;
+the substrate coordinates never change, so they are put in shared memory once
+and every worker maps them instead of receiving a pickled copy per genome.
+Weight matrices are yielded in completion order, so the first emulator episode
+can start while the rest of the population is still being built.
+"""
+import concurrent.futures
+import time
+from multiprocessing import shared_memory
+
+import neat
+import numpy as np
+
+import neato_cache
+import neato_cppn
+import neato_sparse
+
+# Set in each worker process by _init_worker
+_worker_shm = None
+_worker_layers = None
+_worker_threshold = 0.0
+
+
+def build_phenotype(cppn, layers, threshold=0.0):
+    """
+    layers: (input_coords, output_coords) for the dense substrate, or
+    (input_coords, hidden_coords, output_coords) for the sparse one.
+    """
+    if len(layers) == 2:
+        return neato_cppn.CompiledCPPN(cppn).query_grid(*layers)
+    return neato_sparse.build_sparse(cppn, *layers, threshold)
+
+
+def _init_worker(shm_name, sizes, threshold):
+    global _worker_shm, _worker_layers, _worker_threshold
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    coords = np.ndarray((sum(sizes), 2), dtype=np.float64, buffer=_worker_shm.buf)
+    offsets = np.cumsum((0,) + tuple(sizes))
+    _worker_layers = tuple(coords[start:end] for start, end in zip(offsets[:-1], offsets[1:]))
+    _worker_threshold = threshold
+
+
+def _build_worker(genome_id, cppn):
+    start = time.perf_counter()
+    weights = build_phenotype(cppn, _worker_layers, _worker_threshold)
+    return genome_id, weights, time.perf_counter() - start
+
+
+class PhenotypeBuilder:
+    def __init__(self, input_coords, output_coords, workers=1, cache=None,
+                 hidden_coords=None, weight_threshold=0.0):
+        self.input_coords = input_coords
+        self.output_coords = output_coords
+        self.hidden_coords = hidden_coords
+        self.weight_threshold = weight_threshold
+        if hidden_coords is None:
+            self.layers = (input_coords, output_coords)
+            self.geometry = neato_cache.geometry_digest(*self.layers)
+        else:
+            self.layers = (input_coords, hidden_coords, output_coords)
+            self.geometry = neato_cache.geometry_digest(*self.layers, threshold=weight_threshold)
+        self.workers = max(1, int(workers))
+        self.cache = cache
+        self.shm = None
+        self.executor = None
+        # Seconds each built genome took, by genome id (cache hits aren't built)
+        self.build_seconds = {}
+
+    def _start_pool(self):
+        sizes = tuple(layer.shape[0] for layer in self.layers)
+
+        # Copy every coordinate set into one shared block, in layer order
+        coords = np.vstack(self.layers).astype(np.float64)
+        self.shm = shared_memory.SharedMemory(create=True, size=coords.nbytes)
+        shared = np.ndarray(coords.shape, dtype=np.float64, buffer=self.shm.buf)
+        shared[:] = coords
+
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(self.shm.name, sizes, self.weight_threshold))
+
+    def build_all(self, genomes, config):
+        """
+        Yields (genome_id, genome, weights) for every genome.
+        Cached phenotypes come out first. In-process builds then follow in
+        genome order, pooled builds in completion order.
+        """
+        cached = []
+        pending = []
+        keys = {}
+        for genome_id, genome in genomes:
+            if self.cache is not None:
+                key = neato_cache.cppn_digest(genome, self.geometry)
+                weights = self.cache.get(key)
+                if weights is not None:
+                    cached.append((genome_id, genome, weights))
+                    continue
+                keys[genome_id] = key
+            pending.append((genome_id, genome))
+
+        # Misses go to the pool before any cached phenotype is handed out,
+        # so the workers are busy while the cached genomes are being played
+        built = self._start_builds(pending, config)
+        yield from cached
+
+        for genome_id, genome, weights in built:
+            if self.cache is not None:
+                self.cache.put(keys[genome_id], weights)
+            yield genome_id, genome, weights
+
+    def _start_builds(self, genomes, config):
+        if not genomes:
+            return iter(())
+
+        if self.workers == 1:
+            return self._build_in_process(genomes, config)
+
+        if self.executor is None:
+            self._start_pool()
+
+        # The CPPN itself is tiny, so build it here and only ship the network
+        by_id = {}
+        futures = []
+        for genome_id, genome in genomes:
+            by_id[genome_id] = genome
+            cppn = neat.nn.FeedForwardNetwork.create(genome, config)
+            futures.append(self.executor.submit(_build_worker, genome_id, cppn))
+        return self._collect(futures, by_id)
+
+    def _build_in_process(self, genomes, config):
+        for genome_id, genome in genomes:
+            start = time.perf_counter()
+            cppn = neat.nn.FeedForwardNetwork.create(genome, config)
+            weights = build_phenotype(cppn, self.layers, self.weight_threshold)
+            self.build_seconds[genome_id] = time.perf_counter() - start
+            yield genome_id, genome, weights
+
+    def _collect(self, futures, by_id):
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                genome_id, weights, seconds = future.result()
+                self.build_seconds[genome_id] = seconds
+                yield genome_id, by_id[genome_id], weights
+        finally:
+            # If the consumer stops early, don't leave stale builds queued
+            for future in futures:
+                future.cancel()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
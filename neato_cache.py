@@ -0,0 +1,139 @@
+"""
+Content-addressed cache for substrate weight matrices.
+
+Elites and genomes from stagnant species are carried over unchanged, so their
+weight matrices can be reused instead of being rebuilt every generation. The
+key is a hash of everything the CPPN's output depends on (node activations,
+aggregations, biases, responses, enabled connection weights) plus the
+substrate geometry, so two genomes with different ids but the same network
+share an entry.
+
+Entries live in a bounded in-memory LRU. With a cache directory set, every
+entry is also written to <dir>/<key>.npy (<key>.npz for sparse phenotypes) so that a run resumed from a
+checkpoint starts warm.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+import neato_sparse
+
+
+def geometry_digest(*layers, threshold=None):
+    """Hash of the substrate layout (and pruning threshold) the weights were built for."""
+    h = hashlib.sha1()
+    for coords in layers:
+        coords = np.ascontiguousarray(coords, dtype=np.float64)
+        h.update(repr(coords.shape).encode('utf-8'))
+        h.update(coords.tobytes())
+    if threshold is not None:
+        h.update(f"threshold:{threshold!r}".encode('utf-8'))
+    return h.hexdigest()
+
+
+def cppn_digest(genome, geometry=''):
+    """
+    Canonical hash of a genome's CPPN.
+    Disabled connections are ignored since they don't change the weights.
+    """
+    parts = [geometry]
+    for key in sorted(genome.nodes):
+        node = genome.nodes[key]
+        parts.append(f"n{key}:{node.activation}:{node.aggregation}:{node.bias!r}:{node.response!r}")
+    for key in sorted(genome.connections):
+        conn = genome.connections[key]
+        if conn.enabled:
+            parts.append(f"c{key[0]},{key[1]}:{conn.weight!r}")
+    return hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()
+
+
+class PhenotypeCache:
+    def __init__(self, max_entries=64, cache_dir=None):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir or None
+        self.entries = OrderedDict()
+
+        # Counters for the current generation, plus (hits, misses) per finished one
+        self.hits = 0
+        self.misses = 0
+        self.history = []
+        self.used_keys = set()
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key, ext=".npy"):
+        return os.path.join(self.cache_dir, key + ext)
+
+    def get(self, key):
+        """Returns the cached weights for key, or None."""
+        self.used_keys.add(key)
+        weights = self.entries.get(key)
+        if weights is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return weights
+
+        if self.cache_dir:
+            weights = self._load(key)
+            if weights is not None:
+                self._remember(key, weights)
+                self.hits += 1
+                return weights
+
+        self.misses += 1
+        return None
+
+    def _load(self, key):
+        try:
+            if os.path.exists(self._path(key)):
+                return np.load(self._path(key))
+            if os.path.exists(self._path(key, ".npz")):
+                with np.load(self._path(key, ".npz")) as arrays:
+                    return neato_sparse.SparsePhenotype.from_arrays(arrays)
+        except (OSError, ValueError, KeyError):
+            pass  # Half-written file from a crash, rebuild it
+        return None
+
+    def put(self, key, weights):
+        self.used_keys.add(key)
+        self._remember(key, weights)
+        if not self.cache_dir:
+            return
+        sparse = isinstance(weights, neato_sparse.SparsePhenotype)
+        path = self._path(key, ".npz" if sparse else ".npy")
+        if not os.path.exists(path):
+            # Write under a temp name first so a crash never leaves a partial file
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                if sparse:
+                    np.savez(f, **weights.to_arrays())
+                else:
+                    np.save(f, weights)
+            os.replace(tmp_path, path)
+
+    def _remember(self, key, weights):
+        if self.max_entries <= 0:
+            return
+        self.entries[key] = weights
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def end_generation(self):
+        """
+        Records this generation's counters and starts new ones.
+        Files on disk that the generation didn't touch are deleted, which keeps
+        the directory to roughly one population's worth of matrices.
+        """
+        self.history.append((self.hits, self.misses))
+        if self.cache_dir:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith((".npy", ".npz")) and name[:-4] not in self.used_keys:
+                    os.remove(os.path.join(self.cache_dir, name))
+        self.hits = 0
+        self.misses = 0
+        self.used_keys = set()
+        return self.history[-1]
@@ -0,0 +1,166 @@
+"""
+Persistent screen capture for NeatoBridge.
+
+The original get_state() opened a new mss context every frame, rebuilt the
+capture rectangle, copied the BGRA grab into a fresh array and left the
+grayscale/flatten/normalize work to the caller. CaptureSession keeps one mss
+instance alive, recomputes the monitor region only when the window geometry
+changes, and turns the raw BGRA grab into normalized network inputs through
+preallocated buffers:
+
+    grab (BGRA, cropped to the game area)
+      -> resize to 128x112      (cv2, into a cached BGRA buffer)
+      -> grayscale              (cv2, into a cached uint8 buffer)
+      -> [-1, 1] float32        (256-entry lookup table, into the caller's buffer)
+
+Nothing is allocated per frame after the first grab at a given size. With
+an observation layout (crop, downsample, frame stacking, differencing) the
+resize and history follow neato_observation.Preprocessor instead, and
+tile observations skip the grab altogether (tiles_into()).
+"""
+import time
+from collections import deque
+
+import cv2
+import mss
+import numpy as np
+
+import neato_observation
+
+# These values might need tuning based on the user's OS/theme.
+TITLE_BAR_HEIGHT = 25
+MENU_BAR_HEIGHT = 20
+BORDER_WIDTH = 8
+
+# 60 fps emulation leaves this much time per frame
+FRAME_BUDGET = 1.0 / 60.0
+
+NORMALIZE_LUT = neato_observation.NORMALIZE_LUT
+
+
+def monitor_for(geometry):
+    """Capture rectangle for the window geometry (x, y, w, h, bx, by) from the bridge."""
+    x, y, w, h, bx, by = geometry
+
+    # If the API returned valid border info, use it, otherwise use defaults
+    offset_y = by if by > 0 else (TITLE_BAR_HEIGHT + MENU_BAR_HEIGHT + BORDER_WIDTH)
+    offset_x = bx if bx > 0 else BORDER_WIDTH
+
+    return {
+        "top": y + offset_y,
+        "left": x + offset_x,
+        "width": w,
+        "height": h
+    }
+
+
+class CaptureSession:
+    def __init__(self, width=128, height=112, history=600, source=None, layout=None):
+        self.width = width
+        self.height = height
+        # What grab_into() produces (a single 128x112 frame by default)
+        self.preprocessor = neato_observation.Preprocessor(
+            layout or neato_observation.ObservationLayout(width, height))
+        # Optional callable returning a BGRA frame instead of grabbing the
+        # screen (stand-in bridges, replays)
+        self.source = source
+        self.sct = None
+        self.geometry = None
+        self.monitor = None
+
+        # Preallocated buffers for grab_bgr()
+        self.small_bgra = np.empty((height, width, 4), dtype=np.uint8)
+
+        # Per-frame capture latency in seconds (most recent last), and how
+        # much of the last one was the grab itself (the rest is preprocessing)
+        self.last_latency = 0.0
+        self.last_grab = 0.0
+        self.latencies = deque(maxlen=history)
+
+    def set_geometry(self, geometry):
+        """Recomputes the monitor region, but only when the geometry changed."""
+        if geometry != self.geometry:
+            self.geometry = geometry
+            self.monitor = monitor_for(geometry)
+
+    def _grab(self):
+        if self.source is not None:
+            return self.source()
+        # mss handles are tied to the thread that made them, so open lazily
+        if self.sct is None:
+            self.sct = mss.mss()
+        shot = self.sct.grab(self.monitor)
+        # View the raw BGRA bytes without copying them
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+    def process(self, bgra, out):
+        """
+        Resize, grayscale and normalize a BGRA frame into out (and keep it
+        for frame stacking / differencing).
+        out: float32 array of layout.size values (C-contiguous).
+        """
+        return self.preprocessor.process(bgra, out)
+
+    def reset_history(self):
+        """Forgets earlier frames; the next one starts a new episode."""
+        self.preprocessor.reset()
+
+    def grab_into(self, geometry, out):
+        """
+        Captures the game screen straight into out as normalized network inputs.
+        Returns out, or None if the capture failed.
+        """
+        start = time.perf_counter()
+        try:
+            self.set_geometry(geometry)
+            frame = self._grab()
+            self.last_grab = time.perf_counter() - start
+            self.process(frame, out)
+        except Exception as e:
+            print(f"Error capturing screen: {e}")
+            return None
+        self._record(time.perf_counter() - start)
+        return out
+
+    def tiles_into(self, tiles, out):
+        """Tile observations: maps the bridge's tile grid into out. Nothing is grabbed."""
+        start = time.perf_counter()
+        self.last_grab = 0.0
+        self.preprocessor.process_tiles(tiles, out)
+        self._record(time.perf_counter() - start)
+        return out
+
+    def grab_bgr(self, geometry):
+        """Captures the game screen as a 128x112 BGR image (for previews and tests)."""
+        start = time.perf_counter()
+        try:
+            self.set_geometry(geometry)
+            cv2.resize(self._grab(), (self.width, self.height), dst=self.small_bgra)
+        except Exception as e:
+            print(f"Error capturing screen: {e}")
+            return None
+        self._record(time.perf_counter() - start)
+        # Drop alpha channel (BGRA -> BGR); the copy is what the caller keeps
+        return self.small_bgra[:, :, :3].copy()
+
+    def _record(self, latency):
+        self.last_latency = latency
+        self.latencies.append(latency)
+
+    def latency_stats(self):
+        """Mean / p95 / max capture latency (seconds) and the share of the 60 fps budget used."""
+        if not self.latencies:
+            return None
+        samples = np.fromiter(self.latencies, dtype=np.float64)
+        mean = float(samples.mean())
+        return {
+            'mean': mean,
+            'p95': float(np.percentile(samples, 95)),
+            'max': float(samples.max()),
+            'budget_used': mean / FRAME_BUDGET,
+        }
+
+    def close(self):
+        if self.sct is not None:
+            self.sct.close()
+            self.sct = None
@@ -0,0 +1,310 @@
+"""
+Asynchronous, incremental checkpoints.
+
+neat.Checkpointer pickles the whole population in the training thread, and
+resuming meant listing the working directory for neat-checkpoint-* names.
+CheckpointStore is a neat reporter that keeps everything in one directory:
+
+    <dir>/manifest.json          every complete checkpoint, oldest first
+    <dir>/gen-00012.full.gz      every genome of generation 12, plus the run state
+    <dir>/gen-00013.delta.gz     only the genomes not stored since the last full one
+    <dir>/partial.json           fitness of the genomes the current generation already played
+
+Genomes never change once created (only their fitness is reassigned), so a
+genome is stored once per chain of full + delta files, under its key.
+Elites are not stored again until the next full snapshot. The run state
+(generation, config with its innovation tracker, species, random state, and
+every genome's fitness) is pickled with genomes replaced by their keys, so it
+stays small.
+
+Only that small state is pickled in the training thread. Genomes are
+pickled, compressed and written by a background thread. The manifest is
+replaced atomically, and only after the file it points at is complete, so a
+crash mid-write leaves the previous checkpoint as the latest. Resuming
+reads the manifest and loads the chain behind its last entry; no
+directory listing.
+
+Mid-generation: record_fitness() notes each genome as its episode finishes
+(with its novelty descriptor, if any), and the writer keeps partial.json up
+to date. A run restored at that generation gets those fitnesses and
+descriptors back from take_resumed() and doesn't replay them.
+"""
+import gzip
+import io
+import json
+import os
+import pickle
+import queue
+import random
+import threading
+import time
+
+import neat
+
+MANIFEST_NAME = "manifest.json"
+PARTIAL_NAME = "partial.json"
+
+
+def _write_json(path, data):
+    with open(path + ".tmp", 'w') as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+class _StatePickler(pickle.Pickler):
+    """
+    Pickles genomes as ('genome', key) references. The species set's
+    reporters (this store among them) are left out; the restored
+    Population puts its own back.
+    """
+    def __init__(self, file, genomes):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.genome_keys = {id(genome): key for key, genome in genomes.items()}
+
+    def persistent_id(self, obj):
+        if isinstance(obj, neat.reporting.ReporterSet):
+            return ('reporters', None)
+        key = self.genome_keys.get(id(obj))
+        return None if key is None else ('genome', key)
+
+
+class _StateUnpickler(pickle.Unpickler):
+    def __init__(self, file, genomes):
+        super().__init__(file)
+        self.genomes = genomes
+
+    def persistent_load(self, pid):
+        kind, key = pid
+        return self.genomes[key] if kind == 'genome' else None
+
+
+class CheckpointStore(neat.reporting.BaseReporter):
+    def __init__(self, directory='checkpoints', generation_interval=1, full_every=10, compresslevel=5,
+                 keep_chains=2):
+        """
+        generation_interval: generations between checkpoints.
+        full_every: checkpoints per chain (one full snapshot, then deltas).
+        keep_chains: older chains are deleted once this many newer ones exist.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.generation_interval = max(1, int(generation_interval))
+        self.full_every = max(1, int(full_every))
+        self.compresslevel = compresslevel
+        self.keep_chains = max(1, int(keep_chains))
+
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.partial_path = os.path.join(directory, PARTIAL_NAME)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            self.manifest = {'entries': []}
+
+        self.generation = None
+        self.last_saved = None
+        # Genome keys stored in the current chain; a new chain starts with a full snapshot
+        self.chain_keys = set()
+        self.chain_length = 0
+
+        # Mid-generation fitness, and what a restore brought back
+        self.lock = threading.Lock()
+        self.partial = {'generation': None, 'fitness': {}, 'behavior': {}}
+        self.partial_dirty = False
+        self.resumed = {'generation': None, 'fitness': {}, 'behavior': {}}
+
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+        # Time the training thread spent handing checkpoints over
+        self.handoff_seconds = 0.0
+
+    # Reporter hooks
+
+    def start_generation(self, generation):
+        self.generation = generation
+        with self.lock:
+            self.partial = {'generation': generation, 'fitness': {}, 'behavior': {}}
+
+    def end_generation(self, config, population, species_set):
+        # population and species are already those of the next generation
+        next_generation = self.generation + 1
+        if self.last_saved is None or next_generation - self.last_saved >= self.generation_interval:
+            self.save(config, population, species_set, next_generation)
+
+    # Saving
+
+    def save(self, config, population, species_set, generation):
+        """Queues a checkpoint that resumes at the start of generation."""
+        start = time.perf_counter()
+        full = self.chain_length == 0 or self.chain_length >= self.full_every
+        if full:
+            self.chain_keys = set()
+            self.chain_length = 0
+        new_genomes = {key: genome for key, genome in population.items() if key not in self.chain_keys}
+        self.chain_keys.update(new_genomes)
+        self.chain_length += 1
+
+        # The small run state is pickled now, before the next generation changes it
+        fitness = {key: genome.fitness for key, genome in population.items()}
+        state = _dumps_state((generation, config, population, species_set, random.getstate(), fitness),
+                             population)
+        self.queue.put(('checkpoint', generation, full, new_genomes, state))
+        self.last_saved = generation
+        self.handoff_seconds += time.perf_counter() - start
+
+    def record_fitness(self, genome_id, fitness, behavior=None):
+        """
+        Notes a genome of the current generation as played (called from pool
+        threads). fitness is the raw episode fitness; behavior its novelty
+        descriptor, so a resumed generation can blend it like the others.
+        """
+        with self.lock:
+            self.partial['fitness'][genome_id] = fitness
+            if behavior is not None:
+                self.partial['behavior'][genome_id] = [float(v) for v in behavior]
+            self.partial_dirty = True
+        self.queue.put(('partial',))
+
+    def flush(self):
+        """Waits until everything queued is on disk."""
+        self.queue.join()
+
+    def close(self):
+        self.queue.put(None)
+        self.writer.join()
+
+    def _write_loop(self):
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    return
+                if task[0] == 'checkpoint':
+                    self._write_checkpoint(*task[1:])
+                else:
+                    self._write_partial()
+            except Exception as e:
+                print(f"Error writing checkpoint: {e}")
+            finally:
+                self.queue.task_done()
+
+    def _write_checkpoint(self, generation, full, genomes, state):
+        name = f"gen-{generation:05d}.{'full' if full else 'delta'}.gz"
+        path = os.path.join(self.directory, name)
+        with gzip.open(path + ".tmp", 'wb', compresslevel=self.compresslevel) as f:
+            pickle.dump({'genomes': genomes, 'state': state}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+
+        entries = self.manifest['entries']
+        entries.append({'generation': generation, 'file': name, 'full': full, 'genomes': len(genomes),
+                        'bytes': os.path.getsize(path), 'written': time.time()})
+        stale = self._stale_entries()
+        self.manifest['entries'] = entries = entries[len(stale):]
+        _write_json(self.manifest_path, self.manifest)
+        # Files go only once the manifest no longer points at them
+        for entry in stale:
+            try:
+                os.remove(os.path.join(self.directory, entry['file']))
+            except OSError:
+                pass
+
+    def _stale_entries(self):
+        """Entries of chains older than the keep_chains newest ones."""
+        fulls = [i for i, entry in enumerate(self.manifest['entries']) if entry['full']]
+        if len(fulls) <= self.keep_chains:
+            return []
+        return self.manifest['entries'][:fulls[-self.keep_chains]]
+
+    def _write_partial(self):
+        with self.lock:
+            # Genomes that finished while the last write was going on share one write
+            if not self.partial_dirty:
+                return
+            self.partial_dirty = False
+            data = {'generation': self.partial['generation'],
+                    'fitness': {str(key): value for key, value in self.partial['fitness'].items()},
+                    'behavior': {str(key): value for key, value in self.partial['behavior'].items()}}
+        _write_json(self.partial_path, data)
+
+    # Resuming
+
+    def latest(self):
+        """The manifest entry of the newest complete checkpoint, or None."""
+        entries = self.manifest['entries']
+        return entries[-1] if entries else None
+
+    def restore(self, new_config=None):
+        """
+        The population of the newest checkpoint, or None if there is none.
+        Like neat.Checkpointer.restore_checkpoint, the saved innovation tracker
+        carries over to the new population. The next checkpoint starts a new chain.
+        """
+        entries = self.manifest['entries']
+        if not entries:
+            return None
+        last = len(entries) - 1
+        first = max(i for i in range(last + 1) if entries[i]['full'])
+
+        genomes = {}
+        state = None
+        for entry in entries[first:last + 1]:
+            with gzip.open(os.path.join(self.directory, entry['file'])) as f:
+                data = pickle.load(f)
+            genomes.update(data['genomes'])
+            state = data['state']
+
+        generation, saved_config, population, species_set, rndstate, fitness = _loads_state(state, genomes)
+        random.setstate(rndstate)
+        for key, genome in population.items():
+            genome.fitness = fitness[key]
+
+        tracker = getattr(saved_config.genome_config, 'innovation_tracker', None)
+        config = new_config if new_config is not None else saved_config
+        restored = neat.Population(config, (population, species_set, generation))
+        if tracker is not None:
+            restored.reproduction.innovation_tracker = tracker
+            config.genome_config.innovation_tracker = tracker
+
+        self.last_saved = generation
+        self.chain_length = 0
+        self._load_partial(generation, population)
+        return restored
+
+    def _load_partial(self, generation, population):
+        if not os.path.exists(self.partial_path):
+            return
+        with open(self.partial_path) as f:
+            partial = json.load(f)
+        if partial['generation'] != generation:
+            return
+        fitness = {int(key): value for key, value in partial['fitness'].items() if int(key) in population}
+        behavior = {int(key): value for key, value in partial.get('behavior', {}).items() if int(key) in fitness}
+        with self.lock:
+            self.resumed = {'generation': generation, 'fitness': fitness, 'behavior': behavior}
+
+    def take_resumed(self):
+        """
+        ({genome_id: fitness}, {genome_id: novelty descriptor}) of the genomes
+        already played in the generation being evaluated (once, then empty).
+        """
+        with self.lock:
+            if self.resumed['generation'] != self.generation:
+                return {}, {}
+            fitness, behavior = self.resumed['fitness'], self.resumed['behavior']
+            self.resumed = {'generation': None, 'fitness': {}, 'behavior': {}}
+            self.partial['fitness'].update(fitness)
+            self.partial['behavior'].update(behavior)
+            self.partial_dirty = True
+        return fitness, behavior
+
+
+def _dumps_state(state, genomes):
+    buffer = io.BytesIO()
+    _StatePickler(buffer, genomes).dump(state)
+    return buffer.getvalue()
+
+
+def _loads_state(data, genomes):
+    return _StateUnpickler(io.BytesIO(data), genomes).load()
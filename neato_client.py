@@ -1,13 +1,74 @@
 import socket
+import struct
 import time
-import mss
-import cv2
+
 import numpy as np
 
+import neato_capture
+
+# Binary protocol (see neato_bridge.lua)
+# After a text "HELLO <version>" answered with the same "NEATO_BIN <version>",
+# every message is a u16 little-endian length followed by that many payload
+# bytes. The first payload byte is the opcode. A script of another version
+# answers with its own and the connection stays on text.
+PROTOCOL_VERSION = 3
+OP_STEP = 1        # u16 button mask, u8 repeat -> STATE after the frames advance
+OP_GET_STATE = 2   # -> STATE
+OP_RESET = 3       # -> STATE after the start state is restored
+OP_SAVE = 4        # u16 handle -> STATE, snapshot kept in emulator memory
+OP_LOAD = 5        # u16 handle -> STATE after the snapshot is restored
+OP_DROP = 6        # u16 handle -> STATE, snapshot freed
+OP_TILES = 7       # u8 width, u8 height -> STATE; later STATEs carry the tile grid (0 x 0 = off)
+OP_TURBO = 8       # u8 mode (TURBO_* bits) -> STATE; 0 = back to normal
+OP_STATE = 0x81
+
+# STATE reply: opcode, flags, frame, mario_x, mario_y, game_mode, level_index,
+# end_level_timer, anim_state. FLAG_GEOMETRY means the window geometry
+# (x, y, w, h, bx, by as signed 32-bit) follows; it is only sent when it changed.
+STATE_STRUCT = struct.Struct('<BBIHHBBBB')
+GEOMETRY_STRUCT = struct.Struct('<6i')
+FLAG_GEOMETRY = 1
+FLAG_ERROR = 2  # The request failed (e.g. unknown savestate handle)
+FLAG_TILES = 4  # width * height u8 tile cells (row-major) follow the geometry
+HEADER_STRUCT = struct.Struct('<H')
+STEP_STRUCT = struct.Struct('<HBHB')
+MAX_REPEAT = 255
+REQUEST_STRUCT = struct.Struct('<HB')
+HANDLE_STRUCT = struct.Struct('<HBH')
+TILES_STRUCT = struct.Struct('<HBBB')
+TURBO_STRUCT = struct.Struct('<HBB')
+
+# Turbo training mode: what the emulator stops doing while genomes are evaluated
+TURBO_UNTHROTTLED = 1  # Run as fast as the host allows
+TURBO_NO_RENDER = 2    # Stop drawing the screen (tile observations only; a grab needs it)
+TURBO_MUTE = 4
+
+# Bit i of a button mask is BUTTON_BITS[i] (BizHawk names)
+BUTTON_BITS = ['B', 'Y', 'Select', 'Start', 'Up', 'Down', 'Left', 'Right', 'A', 'X', 'L', 'R']
+BUTTON_MASKS = {name.lower(): 1 << i for i, name in enumerate(BUTTON_BITS)}
+
+
+def buttons_to_mask(buttons):
+    """dict of 'BUTTON_NAME': boolean -> button bitmask"""
+    mask = 0
+    for name, pressed in buttons.items():
+        if pressed:
+            mask |= BUTTON_MASKS[name.lower()]
+    return mask
+
+
+def mask_to_buttons(mask):
+    """button bitmask -> dict of pressed BizHawk button names"""
+    return {name: True for i, name in enumerate(BUTTON_BITS) if mask & (1 << i)}
+
+
 class NeatoBridge:
-    def __init__(self, host='127.0.0.1', port=8086):
+    def __init__(self, host='127.0.0.1', port=8086, timeout=None, binary=True, frame_source=None, layout=None):
         self.host = host
         self.port = port
+        self.timeout = timeout  # Seconds to wait for a reply (None = forever)
+        self.binary = binary  # Try the binary protocol when connecting
+        self.protocol = 'text'
         self.sock = None
         self.mario_x = 0
         self.mario_y = 0
@@ -15,95 +76,305 @@ class NeatoBridge:
         self.level_index = 0
         self.end_level_timer = 0
         self.anim_state = 0
+        self.frame = 0
+        self.geometry = None  # Last known window geometry (x, y, w, h, bx, by)
+        # Tile grid around Mario from the last STATE reply ((height, width) uint8,
+        # see neato_observation.TILE_*), or None when tile observations are off
+        self.tiles = None
+        self.turbo = 0  # TURBO_* bits asked for with set_turbo(), re-applied on reconnect
+        self.saved_states = {}  # name -> savestate handle
+        self._next_handle = 1
+        # frame_source replaces the screen grab (see neato_capture.CaptureSession), and
+        # layout is the neato_observation.ObservationLayout capture_into() fills
+        self.capture_session = neato_capture.CaptureSession(source=frame_source, layout=layout)
+        # Optional neato_timing.StageTimes for the running episode: reset,
+        # grab, preprocess and step durations are added to it
+        self.timings = None
+
+        # Preallocated I/O buffers, reused for every message
+        self._text_pending = b''
+        self._send_buf = bytearray(STEP_STRUCT.size)
+        self._recv_buf = bytearray(STATE_STRUCT.size + GEOMETRY_STRUCT.size + 64)
+        self._recv_view = memoryview(self._recv_buf)
 
     def connect(self):
         """Connects to the Bizhawk Lua server."""
+        if not self._open():
+            return False
+        if self.binary:
+            # The script only switches when our versions match, and answers with its
+            # own version otherwise. Older scripts answer UNKNOWN_CMD; both stay on text.
+            response = self.send_command(f"HELLO {PROTOCOL_VERSION}")
+            if response == f"NEATO_BIN {PROTOCOL_VERSION}":
+                self.protocol = 'binary'
+            elif response is None:
+                return False
+            elif response.startswith("NEATO_BIN"):
+                # Scripts from before the version check switch on any HELLO, so this
+                # connection may be binary on their side: start over on text
+                print(f"Bridge on port {self.port} answered {response}, not version {PROTOCOL_VERSION}; "
+                      f"using the text protocol")
+                self._drop()
+                if not self._open():
+                    return False
+        layout = self.capture_session.preprocessor.layout
+        if layout.source == 'tiles' and not self.set_tiles(layout.width, layout.height):
+            print(f"Bridge on port {self.port} can't send tile observations")
+            self._drop()
+            return False
+        # A new connection starts in normal mode (the Lua script leaves turbo mode
+        # when its client goes away)
+        if self.turbo and not self._send_turbo():
+            if not self.sock:
+                return False
+            print(f"Bridge on port {self.port} has no turbo mode, running at normal speed")
+            self.turbo = 0
+        return True
+
+    def turbo_mode(self, enabled):
+        """The TURBO_* bits set_turbo(enabled) asks for with this bridge's observations."""
+        if not enabled:
+            return 0
+        mode = TURBO_UNTHROTTLED | TURBO_MUTE
+        # Only a screen grab needs the emulator to keep drawing
+        if self.capture_session.preprocessor.layout.source != 'screen':
+            mode |= TURBO_NO_RENDER
+        return mode
+
+    def set_turbo(self, enabled):
+        """
+        Enters (or leaves) turbo training mode: unthrottled, muted and, unless
+        observations are screen grabs, not rendering. Leaving restores the
+        emulator's own throttle and sound settings. A disconnected bridge
+        enters the mode when it connects. Returns True on success.
+        """
+        mode = self.turbo_mode(enabled)
+        if mode == self.turbo:
+            return True
+        self.turbo = mode
+        return self.sock is None or self._send_turbo()
+
+    def _send_turbo(self):
+        if self.protocol == 'binary':
+            TURBO_STRUCT.pack_into(self._send_buf, 0, TURBO_STRUCT.size - 2, OP_TURBO, self.turbo)
+            return self._request(TURBO_STRUCT.size)
+        return self.send_command(f"TURBO:{self.turbo}") == "TURBO_OK"
+
+    def _open(self):
+        """Opens the socket. Every connection starts on the text protocol."""
         try:
             self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.sock.settimeout(self.timeout)
             self.sock.connect((self.host, self.port))
             print(f"Connected to Bizhawk at {self.host}:{self.port}")
-            return True
         except ConnectionRefusedError:
             print("Connection refused. Is Bizhawk running with neato_bridge.lua?")
+            self.sock = None
+            return False
+        except OSError as e:
+            print(f"Could not connect to {self.host}:{self.port}: {e}")
+            self.sock = None
             return False
 
+        self._text_pending = b''
+        self.protocol = 'text'
+        self.geometry = None
+        # Savestates live in the emulator and are tied to the connection
+        self.saved_states = {}
+        return True
+
+    def set_tiles(self, width, height):
+        """
+        Asks for the width x height tile grid around Mario with every STATE
+        reply, kept in self.tiles (0 x 0 turns it off). Binary protocol only.
+        Returns True on success.
+        """
+        self.tiles = None
+        if self.protocol != 'binary':
+            return width == 0 and height == 0
+        TILES_STRUCT.pack_into(self._send_buf, 0, TILES_STRUCT.size - 2, OP_TILES, width, height)
+        if width and height:
+            size = STATE_STRUCT.size + GEOMETRY_STRUCT.size + width * height + 64
+            if size > len(self._recv_buf):
+                self._recv_buf = bytearray(size)
+                self._recv_view = memoryview(self._recv_buf)
+            self.tiles = np.zeros((height, width), dtype=np.uint8)
+        if not self._request(TILES_STRUCT.size):
+            self.tiles = None
+            return False
+        return True
+
     def send_command(self, command):
-        """Sends a command to the server and waits for a response."""
+        """Sends a text command to the server and waits for a one-line response."""
         if not self.sock:
             print("Not connected.")
             return None
 
         try:
             self.sock.sendall((command + "\r\n").encode('utf-8'))
-            response = self.sock.recv(4096).decode('utf-8').strip()
-            return response
+            # Replies end with a newline; keep reading until we have a whole one
+            while b'\n' not in self._text_pending:
+                data = self.sock.recv(4096)
+                if not data:
+                    # Empty read means the emulator closed the connection
+                    print("Connection closed by Bizhawk.")
+                    self._drop()
+                    return None
+                self._text_pending += data
+            line, _, self._text_pending = self._text_pending.partition(b'\n')
+            return line.decode('utf-8').strip()
         except Exception as e:
             print(f"Error sending command: {e}")
-            self.sock.close()
-            self.sock = None
+            self._drop()
             return None
 
-    def get_state(self):
+    def _drop(self):
+        if self.sock:
+            self.sock.close()
+        self.sock = None
+
+    def _recv_exact(self, n):
+        view = self._recv_view[:n]
+        while n:
+            got = self.sock.recv_into(view, n)
+            if not got:
+                raise ConnectionError("Connection closed by Bizhawk.")
+            view = view[got:]
+            n -= got
+
+    def _request(self, size):
         """
-        Returns the current game screen as a numpy array.
+        Sends the first size bytes of the send buffer as one binary message and
+        decodes the STATE reply. Returns True on success.
         """
+        return self._send(size) and self._receive()
+
+    def _send(self, size):
+        if not self.sock:
+            print("Not connected.")
+            return False
+        try:
+            self.sock.sendall(memoryview(self._send_buf)[:size])
+        except Exception as e:
+            print(f"Error in binary request: {e}")
+            self._drop()
+            return False
+        return True
+
+    def _receive(self):
+        """Reads one STATE reply and updates the game variables. Returns True on success."""
+        if not self.sock:
+            return False
+        try:
+            self._recv_exact(HEADER_STRUCT.size)
+            length, = HEADER_STRUCT.unpack_from(self._recv_buf)
+            if length > len(self._recv_buf):
+                raise ValueError(f"Reply of {length} bytes is too large")
+            self._recv_exact(length)
+        except Exception as e:
+            print(f"Error in binary request: {e}")
+            self._drop()
+            return False
+
+        (opcode, flags, self.frame, self.mario_x, self.mario_y, self.game_mode,
+         self.level_index, self.end_level_timer, self.anim_state) = STATE_STRUCT.unpack_from(self._recv_buf)
+        if opcode != OP_STATE:
+            print(f"Unexpected binary reply opcode: {opcode}")
+            self._drop()
+            return False
+        offset = STATE_STRUCT.size
+        if flags & FLAG_GEOMETRY:
+            self.geometry = GEOMETRY_STRUCT.unpack_from(self._recv_buf, offset)
+            offset += GEOMETRY_STRUCT.size
+        if flags & FLAG_TILES and self.tiles is not None:
+            if length < offset + self.tiles.size:
+                print(f"Tile grid of {length - offset} bytes is too small")
+                self._drop()
+                return False
+            self.tiles.reshape(-1)[:] = self._recv_view[offset:offset + self.tiles.size]
+        return not flags & FLAG_ERROR
+
+    def _simple_request(self, opcode):
+        REQUEST_STRUCT.pack_into(self._send_buf, 0, 1, opcode)
+        return self._request(REQUEST_STRUCT.size)
+
+    def read_state(self):
+        """
+        Sends GET_STATE and updates the game variables (mario_x, anim_state, ...).
+        Returns the window geometry (x, y, w, h, bx, by), or None on failure.
+        """
+        if self.protocol == 'binary':
+            if not self._simple_request(OP_GET_STATE):
+                return None
+            return self.geometry
+
         response = self.send_command("GET_STATE")
         if not response:
             return None
-            
+
         try:
             # Parse coordinates: x, y, w, h, bx, by, mx, my, mode, level, timer, anim
             parts = list(map(int, response.split(',')))
             x, y, w, h, bx, by, mx, my, mode, level, timer, anim = parts
-            
-            # Update game state
-            self.mario_x = mx
-            self.mario_y = my
-            self.game_mode = mode
-            self.level_index = level
-            self.end_level_timer = timer
-            self.anim_state = anim
-            
-            # Calculate capture region
-            # These values might need tuning based on the user's OS/theme.
-            TITLE_BAR_HEIGHT = 25
-            MENU_BAR_HEIGHT = 20
-            BORDER_WIDTH = 8
-            
-            # If the API returned valid border info, use it, otherwise use defaults
-            offset_y = by if by > 0 else (TITLE_BAR_HEIGHT + MENU_BAR_HEIGHT + BORDER_WIDTH)
-            offset_x = bx if bx > 0 else BORDER_WIDTH
-            
-            monitor = {
-                "top": y + offset_y, 
-                "left": x + offset_x, 
-                "width": w,
-                "height": h
-            }
-            
-            with mss.mss() as sct:
-                # Capture the screen
-                img = np.array(sct.grab(monitor))
-                
-                # Drop alpha channel (BGRA -> BGR)
-                img = img[:, :, :3]
-                
-                # Resize to a standard input size (e.g., 128x112 - half SNES)
-                # This keeps the neural network input manageable
-                img_small = cv2.resize(img, (128, 112))
-                
-                return img_small
-                
-                
-        except Exception as e:
-            print(f"Error capturing screen: {e}")
+        except ValueError:
+            print(f"Bad GET_STATE reply: {response}")
+            return None
+
+        # Update game state
+        self.mario_x = mx
+        self.mario_y = my
+        self.game_mode = mode
+        self.level_index = level
+        self.end_level_timer = timer
+        self.anim_state = anim
+        self.geometry = (x, y, w, h, bx, by)
+        return self.geometry
+
+    def get_state(self):
+        """
+        Returns the current game screen as a numpy array.
+        """
+        if self.read_state() is None:
             return None
+        return self.capture()
+
+    def capture(self):
+        """
+        Grabs the game screen at the last known window geometry, without
+        asking the emulator for anything. Returns a 128x112 BGR image.
+        """
+        if self.geometry is None:
+            return None
+        return self.capture_session.grab_bgr(self.geometry)
+
+    def capture_into(self, out):
+        """
+        Grabs the game screen straight into out (float32, 128*112 values by
+        default, layout.size with an observation layout) as grayscale inputs
+        normalized to -1..1. Returns out, or None on failure.
+        With tile observations the last tile grid is used instead, and nothing
+        is grabbed.
+        """
+        if self.tiles is not None:
+            result = self.capture_session.tiles_into(self.tiles, out)
+        elif self.geometry is None:
+            return None
+        else:
+            result = self.capture_session.grab_into(self.geometry, out)
+        if self.timings is not None and result is not None:
+            session = self.capture_session
+            self.timings.add('grab', session.last_grab)
+            self.timings.add('preprocess', session.last_latency - session.last_grab)
+        return result
 
     def act(self, buttons):
         """
         Sends button states to the Lua script.
         buttons: dict of 'BUTTON_NAME': boolean
         """
+        if self.protocol == 'binary':
+            return self.step(buttons)
+
         # Format: "ACT:A,B,Up" (comma separated list of pressed buttons)
         pressed = [k for k, v in buttons.items() if v]
         if pressed:
@@ -114,12 +385,110 @@ class NeatoBridge:
         response = self.send_command(cmd)
         return response == "ACT_OK"
 
+    def step(self, buttons, repeat=1):
+        """
+        Holds the buttons for repeat frames, then updates the game variables.
+        buttons: dict of 'BUTTON_NAME': boolean, or a button bitmask.
+        One round trip on the binary protocol however many frames are held.
+        The text protocol needs an ACT per frame plus a GET_STATE.
+        """
+        start = time.perf_counter()
+        if self.protocol == 'binary':
+            ok = self.send_step(buttons, repeat) and self._receive()
+        else:
+            ok = self._text_step(buttons, repeat)
+        if self.timings is not None:
+            self.timings.add('step', time.perf_counter() - start)
+        return ok
+
+    def _text_step(self, buttons, repeat):
+        repeat = max(1, min(MAX_REPEAT, int(repeat)))
+        if isinstance(buttons, int):
+            buttons = mask_to_buttons(buttons)
+        for _ in range(repeat):
+            if not self.act(buttons):
+                return False
+        return self.read_state() is not None
+
+    def send_step(self, buttons, repeat=1):
+        """
+        First half of step() on the binary protocol: sends STEP without
+        waiting. Each send_step() must be matched by one receive_state(), in
+        order. Returns False if the message couldn't be sent.
+        """
+        repeat = max(1, min(MAX_REPEAT, int(repeat)))
+        mask = buttons if isinstance(buttons, int) else buttons_to_mask(buttons)
+        STEP_STRUCT.pack_into(self._send_buf, 0, STEP_STRUCT.size - 2, OP_STEP, mask, repeat)
+        return self._send(STEP_STRUCT.size)
+
+    def receive_state(self):
+        """Second half of step(): waits for the oldest outstanding STATE reply."""
+        return self._receive()
+
     def reset(self):
-        return self.send_command("RESET")
+        """
+        Restores the start state. The bridge only answers once the state has
+        been applied, and the game variables are refreshed on return, so no
+        sleep is needed afterwards.
+        """
+        start = time.perf_counter()
+        if self.protocol == 'binary':
+            response = "RESET_OK" if self._simple_request(OP_RESET) else None
+        else:
+            response = self.send_command("RESET")
+            if response != "RESET_OK" or self.read_state() is None:
+                response = None
+        if response is not None:
+            # Frame stacking / differencing start over with the episode
+            self.capture_session.reset_history()
+        if self.timings is not None:
+            self.timings.add('reset', time.perf_counter() - start)
+        return response
+
+    def _handle_request(self, opcode, text_command, handle):
+        if self.protocol == 'binary':
+            HANDLE_STRUCT.pack_into(self._send_buf, 0, HANDLE_STRUCT.size - 2, opcode, handle)
+            return self._request(HANDLE_STRUCT.size)
+        response = self.send_command(f"{text_command}:{handle}")
+        return response is not None and response.endswith("_OK")
+
+    def save_state(self, name=None):
+        """
+        Snapshots the emulator into its memory (no disk access).
+        Returns a handle for load_state(), or None on failure. A name can be
+        used instead of the handle; saving under an existing name replaces it.
+        """
+        handle = self.saved_states.get(name) if name is not None else None
+        if handle is None:
+            handle = self._next_handle
+            self._next_handle = self._next_handle % 0xFFFF + 1
+        if not self._handle_request(OP_SAVE, "SAVE", handle):
+            return None
+        if name is not None:
+            self.saved_states[name] = handle
+        return handle
+
+    def load_state(self, handle):
+        """
+        Restores a snapshot by handle or name. The game variables reflect the
+        restored state on return.
+        """
+        handle = self.saved_states.get(handle, handle)
+        if not self._handle_request(OP_LOAD, "LOAD", handle):
+            return False
+        return self.protocol == 'binary' or self.read_state() is not None
+
+    def drop_state(self, handle):
+        """Frees a snapshot in the emulator."""
+        for name, value in list(self.saved_states.items()):
+            if handle in (name, value):
+                del self.saved_states[name]
+                handle = value
+        return self._handle_request(OP_DROP, "DROP", handle)
 
     def close(self):
-        if self.sock:
-            self.sock.close()
+        self._drop()
+        self.capture_session.close()
 
 if __name__ == "__main__":
     # Simple test
@@ -127,5 +496,6 @@ if __name__ == "__main__":
     if bridge.connect():
         print("Response from GET_STATE:", bridge.get_state())
         time.sleep(1)
-        print("Response from ACT:", bridge.act("A"))
+        print("Protocol:", bridge.protocol)
+        print("Response from ACT:", bridge.act({'A': True}))
         bridge.close()
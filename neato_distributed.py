@@ -0,0 +1,469 @@
+"""
+Evaluation across machines.
+
+One box can only host a few emulators. With coordinator_port set, the
+training process keeps running neat.Population.run and building phenotypes
+as usual. Episodes don't go to its own EvaluationPool. A Coordinator
+listens on that port and hands them to remote workers:
+
+    training box     python main.py run2              (coordinator_port = 8100)
+    emulator boxes   python neato_distributed.py trainer:8100 --config <run config>
+
+Each worker is a brain of its own. Its config's bridge_port / bridge_count
+name its local emulators. It plays whatever it's sent on whichever of its
+bridges is free, and sends back the fitness plus the episode's telemetry:
+stage timings, wall time, termination reason, frames played and saved, and
+the behavior descriptor when novelty search is on. The coordinator merges that
+into its own GenerationTimes / TerminationPolicy / novelty archive, so the
+reports read the same as with local emulators.
+
+Messages are pickled tuples behind a 4-byte length, one TCP connection per
+worker. Pickle runs whatever it's given, so only use this on a network you
+trust.
+
+    worker -> coordinator   ('hello', name, slots)        once, slots = live emulators
+    coordinator -> worker   ('welcome', heartbeat_interval)
+    coordinator -> worker   ('job', job_id, job)          job = (genome_id, weights, horizon, samples)
+    worker -> coordinator   ('result', job_id, fitness, telemetry)   fitness 0 if the episode raised
+    worker -> coordinator   ('lost', job_id)              its emulator died; the job goes back
+    worker -> coordinator   ('heartbeat',)                every heartbeat_interval seconds
+    coordinator -> worker   ('bye',)
+
+A worker never has more jobs in flight than it has slots. A worker that
+disconnects, or sends nothing (not even a heartbeat) for worker_timeout
+seconds, is dropped. Its unfinished jobs go back in the queue for the
+others, like a lost bridge's job in EvaluationPool.
+
+With --standins N a worker starts N stand-in bridges (neato_standin) in its
+own process and plays on those, so the whole thing runs on one host without
+BizHawk.
+"""
+import argparse
+import importlib
+import os
+import pickle
+import socket
+import struct
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+import neato_novelty
+import neato_timing
+
+HEADER = struct.Struct('>I')
+
+
+def send_message(sock, message):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(HEADER.pack(len(data)) + data)
+
+
+def recv_message(sock):
+    """The next message, or None once the connection is closed."""
+    header = _recv_exact(sock, HEADER.size)
+    if header is None:
+        return None
+    data = _recv_exact(sock, HEADER.unpack(header)[0])
+    if data is None:
+        return None
+    return pickle.loads(data)
+
+
+def _recv_exact(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    while n:
+        got = sock.recv_into(view, n)
+        if got == 0:
+            return None
+        view = view[got:]
+        n -= got
+    return bytes(buf)
+
+
+class _RemoteWorker:
+    def __init__(self, sock, name, slots):
+        self.sock = sock
+        self.name = name
+        self.slots = slots
+        # job_id -> (index, job) sent and not answered yet
+        self.inflight = {}
+        self.send_lock = threading.Lock()
+
+
+class Coordinator:
+    def __init__(self, host='0.0.0.0', port=8100, heartbeat_timeout=5.0, join_timeout=30.0):
+        """
+        heartbeat_timeout: seconds of silence after which a worker is dropped.
+        join_timeout: how long evaluate() waits for a worker when none is connected.
+        """
+        self.heartbeat_timeout = heartbeat_timeout
+        self.join_timeout = join_timeout
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+
+        self.condition = threading.Condition()
+        self.workers = []
+        self.next_job_id = 0
+        self.requeued = 0
+        self.closed = False
+
+        # The evaluate() call in progress
+        self.pending = []
+        self.results = {}
+        self.received = None
+        # Episodes each worker finished this generation
+        self.episodes = Counter()
+
+        self.acceptor = threading.Thread(target=self._accept_loop, daemon=True)
+        self.acceptor.start()
+
+    # Connections
+
+    def _accept_loop(self):
+        while True:
+            try:
+                sock, address = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_worker, args=(sock, address), daemon=True).start()
+
+    def _serve_worker(self, sock, address):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(self.heartbeat_timeout)
+        try:
+            hello = recv_message(sock)
+            if hello is None or hello[0] != 'hello':
+                sock.close()
+                return
+            worker = _RemoteWorker(sock, hello[1] or f"{address[0]}:{address[1]}", hello[2])
+            send_message(sock, ('welcome', self.heartbeat_timeout / 4))
+        except (OSError, pickle.UnpicklingError):
+            sock.close()
+            return
+
+        with self.condition:
+            self.workers.append(worker)
+            self.condition.notify_all()
+        print(f"Worker {worker.name} joined with {worker.slots} emulator(s)")
+        self._dispatch()
+
+        try:
+            while True:
+                message = recv_message(sock)
+                if message is None:
+                    break
+                if message[0] == 'result':
+                    self._finish(worker, *message[1:])
+                elif message[0] == 'lost':
+                    self._requeue_lost(worker, message[1])
+        except (OSError, pickle.UnpicklingError, EOFError):
+            # Includes socket.timeout: no heartbeat within heartbeat_timeout
+            pass
+        self._drop(worker)
+
+    def _drop(self, worker):
+        with self.condition:
+            if worker not in self.workers:
+                return
+            self.workers.remove(worker)
+            lost = list(worker.inflight.values())
+            worker.inflight.clear()
+            self.pending[:0] = lost
+            self.requeued += len(lost)
+            self.condition.notify_all()
+        try:
+            worker.sock.close()
+        except OSError:
+            pass
+        if not self.closed:
+            print(f"Worker {worker.name} lost, reassigning {len(lost)} genome(s)")
+        self._dispatch()
+
+    def wait_for_workers(self, count=1, timeout=None):
+        """Blocks until count workers are connected. Returns whether they are."""
+        with self.condition:
+            return self.condition.wait_for(lambda: len(self.workers) >= count, timeout)
+
+    # Jobs
+
+    def evaluate(self, jobs, received=None):
+        """
+        Plays every (genome_id, weights, horizon, samples) job on a remote
+        worker, like EvaluationPool.evaluate. received(job, fitness, telemetry) is
+        called for every finished job, from a connection thread. Returns the
+        fitnesses in job order. Jobs still unplayed once no worker has been
+        connected for join_timeout seconds score 0.
+        """
+        with self.condition:
+            self.pending = []
+            self.results = {}
+            self.received = received
+        count = 0
+        for job in jobs:
+            with self.condition:
+                self.pending.append((count, job))
+            count += 1
+            self._dispatch()
+
+        with self.condition:
+            while len(self.results) < count:
+                if self.workers:
+                    self.condition.wait(0.5)
+                elif not self.condition.wait_for(lambda: self.workers, self.join_timeout):
+                    break
+            results, self.results = self.results, {}
+            self.pending = []
+            self.received = None
+
+        missing = count - len(results)
+        if missing:
+            print(f"No worker left to run {missing} genome(s), scoring them 0")
+        return [results.get(i, 0) for i in range(count)]
+
+    def _dispatch(self):
+        """Sends pending jobs to workers with a free slot."""
+        while True:
+            with self.condition:
+                worker = next((w for w in self.workers if len(w.inflight) < w.slots), None)
+                if worker is None or not self.pending:
+                    return
+                index, job = self.pending.pop(0)
+                job_id = self.next_job_id
+                self.next_job_id += 1
+                worker.inflight[job_id] = (index, job)
+            try:
+                with worker.send_lock:
+                    send_message(worker.sock, ('job', job_id, job))
+            except OSError:
+                self._drop(worker)
+
+    def _finish(self, worker, job_id, fitness, telemetry):
+        with self.condition:
+            entry = worker.inflight.pop(job_id, None)
+            received = self.received
+        if entry is None:
+            return
+        index, job = entry
+        # Telemetry first, so it's all in by the time evaluate() returns
+        if received is not None:
+            received(job, fitness, telemetry)
+        with self.condition:
+            self.results[index] = fitness
+            self.episodes[worker.name] += 1
+            self.condition.notify_all()
+        self._dispatch()
+
+    def _requeue_lost(self, worker, job_id):
+        with self.condition:
+            entry = worker.inflight.pop(job_id, None)
+            # The worker retired that emulator
+            worker.slots -= 1
+            if entry is not None:
+                self.pending.insert(0, entry)
+                self.requeued += 1
+            self.condition.notify_all()
+        print(f"Worker {worker.name} lost an emulator, requeueing its genome")
+        if worker.slots <= 0:
+            self._drop(worker)
+        else:
+            self._dispatch()
+
+    def end_generation(self):
+        """Returns {worker name: episodes finished} for the generation and resets it."""
+        with self.condition:
+            episodes, self.episodes = self.episodes, Counter()
+        return episodes
+
+    def close(self):
+        self.closed = True
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.server.close()
+        with self.condition:
+            workers = list(self.workers)
+        for worker in workers:
+            try:
+                with worker.send_lock:
+                    send_message(worker.sock, ('bye',))
+            except OSError:
+                pass
+            self._drop(worker)
+
+
+class Worker:
+    """Plays a coordinator's jobs on a brain's local bridges."""
+    def __init__(self, brain, host, port, name=None):
+        self.brain = brain
+        self.host = host
+        self.port = port
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.sock = None
+        self.send_lock = threading.Lock()
+        self.jobs = []
+        self.condition = threading.Condition()
+        self.running = False
+        self.played = 0
+
+    def connect(self, timeout=60.0):
+        """Connects to the coordinator, retrying until timeout. Returns whether it did."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.sock = socket.create_connection((self.host, self.port))
+                self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                return True
+            except OSError:
+                if time.monotonic() >= deadline:
+                    return False
+                time.sleep(0.5)
+
+    def run(self, timeout=60.0):
+        """Serves jobs until the coordinator says bye or goes away."""
+        self.brain.pool.set_turbo(self.brain.settings.turbo)
+        live = self.brain.pool.connect()
+        if not live:
+            print("Could not connect to any bridge!")
+            return
+        if not self.connect(timeout):
+            print(f"Could not reach the coordinator at {self.host}:{self.port}")
+            return
+
+        self.running = True
+        try:
+            self._send(('hello', self.name, len(live)))
+            welcome = recv_message(self.sock)
+            if welcome is None:
+                return
+            threading.Thread(target=self._heartbeat, args=(welcome[1],), daemon=True).start()
+            for bridge in live:
+                threading.Thread(target=self._play_loop, args=(bridge,), daemon=True).start()
+            print(f"Worker {self.name}: serving {self.host}:{self.port} with {len(live)} emulator(s)")
+
+            while True:
+                message = recv_message(self.sock)
+                if message is None or message[0] == 'bye':
+                    break
+                if message[0] == 'job':
+                    with self.condition:
+                        self.jobs.append(message[1:])
+                        self.condition.notify()
+        except OSError:
+            pass
+        finally:
+            with self.condition:
+                self.running = False
+                self.condition.notify_all()
+            self.sock.close()
+
+    def _send(self, message):
+        with self.send_lock:
+            send_message(self.sock, message)
+
+    def _heartbeat(self, interval):
+        while self.running:
+            time.sleep(interval)
+            try:
+                self._send(('heartbeat',))
+            except OSError:
+                return
+
+    def _play_loop(self, bridge):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.jobs or not self.running)
+                if not self.running:
+                    return
+                job_id, job = self.jobs.pop(0)
+            try:
+                fitness, telemetry = self.play(bridge, job)
+            except Exception:
+                # Answer the job anyway, or the coordinator waits on it forever. An
+                # empty outcome marks the episode as never played (nothing memoized).
+                print(f"Genome {job[0]} failed on the bridge on port {bridge.port}, scoring it 0")
+                traceback.print_exc()
+                fitness, telemetry = 0, {'worker': self.name, 'seconds': 0.0, 'timings': {},
+                                         'outcome': {}, 'behavior': None}
+            try:
+                if bridge.sock is None:
+                    # Emulator gone: the coordinator gives the job to someone else
+                    print(f"Bridge on port {bridge.port} lost, handing its genome back")
+                    self._send(('lost', job_id))
+                    return
+                self._send(('result', job_id, fitness, telemetry))
+                self.played += 1
+            except OSError:
+                return
+
+    def play(self, bridge, job):
+        """Plays one job on bridge. Returns (fitness, telemetry)."""
+        genome_id, weights, horizon, samples = job
+        timings = neato_timing.StageTimes()
+        behavior = neato_novelty.BehaviorTracker(samples, self.brain.max_frames) if samples else None
+        outcome = {}
+        start = time.perf_counter()
+        fitness = self.brain.play_episode(bridge, genome_id, weights, horizon, timings, behavior, outcome)
+        telemetry = {
+            'worker': self.name,
+            'seconds': time.perf_counter() - start,
+            'timings': timings.samples,
+            'outcome': outcome,
+            'behavior': behavior.descriptor() if behavior is not None else None,
+        }
+        return fitness, telemetry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('coordinator', help="host:port of the training process")
+    parser.add_argument('--config', default='config-feedforward',
+                        help="run config whose [Neato] section describes this worker's emulators")
+    parser.add_argument('--run', default=None,
+                        help="play with runs/<RUN>.py's brain (e.g. run2_runner) instead of neato_brain's")
+    parser.add_argument('--name', default=None, help="worker name in the coordinator's reports")
+    parser.add_argument('--standins', type=int, default=0,
+                        help="play on this many stand-in bridges started here instead of emulators")
+    parser.add_argument('--wait', type=float, default=60.0, help="seconds to keep trying to reach the coordinator")
+    args = parser.parse_args()
+
+    host, port = args.coordinator.rsplit(':', 1)
+    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+    import neato_settings
+    if args.run:
+        brain_module = importlib.import_module(f"runs.{args.run}")
+    else:
+        import neato_brain as brain_module
+
+    settings = neato_settings.NeatoSettings.from_file(args.config)
+    # Workers are started with the trainer's run config: its coordinator is the one
+    # we join, not one for this brain to start
+    settings.coordinator_port = 0
+    servers = []
+    if args.standins > 0:
+        import neato_standin
+        servers = [neato_standin.StandInBridge().start() for _ in range(args.standins)]
+        settings.bridge_count = args.standins
+    brain = brain_module.NeatoBrain(settings)
+    for bridge, server in zip(brain.pool.bridges, servers):
+        bridge.port = server.port
+        bridge.capture_session.source = server.render
+
+    try:
+        Worker(brain, host, int(port), args.name).run(args.wait)
+    finally:
+        brain.close()
+        for server in servers:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Lockstep inference across concurrent episodes.
+
+With several emulators every pool thread used to run its own
+np.dot(inputs, weights) per frame. In lockstep mode each episode takes a seat
+in a LockstepBatch instead. A seat looks like a phenotype to run_simulation
+(neato_sparse.forward calls seat.forward), but forward() only drops the
+frame into the batch and waits. Once every seated episode has handed in its
+frame, all outputs are computed with one batched matmul and every episode
+carries on with its own row.
+
+Capture and bridge I/O still happen in the pool threads, so emulators keep
+running in parallel; only the inference is gathered. An episode that ends
+leaves its seat, and the batch stops waiting for it straight away.
+
+Weights are kept as float32, transposed to (outputs, inputs) per seat: that
+layout makes the batched product a row-contiguous matrix-vector product,
+which is several times faster than the (inputs, outputs) one.
+"""
+import threading
+
+import numpy as np
+
+
+class Seat:
+    """One episode's place in a LockstepBatch. Use as a context manager."""
+    def __init__(self, batch, weights):
+        self.batch = batch
+        self.weights = weights
+        self.slot = None
+        self.joined = False
+
+    def __enter__(self):
+        self.slot = self.batch._take_slot(self.weights)
+        return self
+
+    def __exit__(self, *exc):
+        self.batch._leave(self)
+
+    def join(self):
+        """
+        Makes the batch wait for this episode from now on. forward() does this
+        on the first frame, so other episodes don't wait on this one's reset.
+        """
+        self.batch._join(self)
+
+    def forward(self, inputs):
+        """Output pre-activations for this episode's frame, computed with the rest of the batch."""
+        return self.batch._forward(self, inputs)
+
+
+class LockstepBatch:
+    def __init__(self, capacity, n_inputs, n_outputs):
+        self.capacity = capacity
+        # Preallocated per-slot buffers. Idle slots keep whatever they had;
+        # their rows are computed but never read.
+        self.inputs = np.zeros((capacity, n_inputs, 1), dtype=np.float32)
+        self.weights = np.zeros((capacity, n_outputs, n_inputs), dtype=np.float32)
+        self.outputs = np.zeros((capacity, n_outputs, 1), dtype=np.float32)
+
+        self.cond = threading.Condition()
+        self.free = list(range(capacity))
+        self.active = set()
+        self.submitted = set()
+        self.tick = 0
+
+        # Number of batched products and the rows they served, for the mean batch size
+        self.batches = 0
+        self.rows = 0
+
+    def seat(self, weights):
+        """Seat for a dense (inputs, outputs) weight matrix: `with batch.seat(weights) as seat:`."""
+        return Seat(self, weights)
+
+    def mean_batch_size(self):
+        return self.rows / self.batches if self.batches else 0.0
+
+    def _take_slot(self, weights):
+        with self.cond:
+            if not self.free:
+                raise RuntimeError("LockstepBatch is full")
+            slot = self.free.pop()
+        # The slot is ours alone until it's joined, so fill it outside the lock
+        self.weights[slot] = weights.T
+        return slot
+
+    def _join(self, seat):
+        with self.cond:
+            seat.joined = True
+            self.active.add(seat.slot)
+
+    def _forward(self, seat, inputs):
+        slot = seat.slot
+        if not seat.joined:
+            self._join(seat)
+        with self.cond:
+            self.inputs[slot, :, 0] = inputs
+            self.submitted.add(slot)
+            tick = self.tick
+            if self.submitted >= self.active:
+                self._run()
+            else:
+                while self.tick == tick:
+                    self.cond.wait()
+            return self.outputs[slot, :, 0].copy()
+
+    def _leave(self, seat):
+        with self.cond:
+            self.active.discard(seat.slot)
+            self.submitted.discard(seat.slot)
+            self.free.append(seat.slot)
+            # The others may have only been waiting on this episode
+            if self.submitted and self.submitted >= self.active:
+                self._run()
+
+    def _run(self):
+        # Called with the lock held, once every active episode has submitted
+        np.matmul(self.weights, self.inputs, out=self.outputs)
+        self.batches += 1
+        self.rows += len(self.submitted)
+        self.submitted.clear()
+        self.tick += 1
+        self.cond.notify_all()
@@ -0,0 +1,165 @@
+"""
+Memoized episode results.
+
+Every episode starts from the same savestate and the policy is a
+deterministic function of its weights, so an unchanged genome (an elite, a
+carry-over of a stagnant species) scores exactly what it scored last
+generation. FitnessMemo remembers each episode's result and hands it back
+instead of playing it again:
+
+    key      sha1 of the phenotype digest (neato_cache.cppn_digest: the CPPN
+             plus the substrate geometry), the horizon, and the episode
+             context: the brain's fitness_version, savestate_id, and every
+             setting that changes what an episode does (EPISODE_SETTINGS)
+    entry    fitness, termination reason, frames played and saved, the
+             novelty descriptor, and how long the episode took
+
+A genome whose every rung is memoized isn't built either. With
+fitness_memo_file set the entries are kept in that JSON file, so a resumed
+run doesn't replay its elites. Bump the brain's fitness_version, or change
+savestate_id, whenever the fitness function or the start state changes.
+Old entries then just stop matching.
+
+fitness_memo_verify replays that fraction of the memoized genomes anyway
+and compares. A different fitness means the emulator (or something in the
+loop) isn't deterministic. It's counted and printed, and the new result
+replaces the old one.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+
+import neato_cache
+
+# Settings that change an episode's outcome for the same phenotype
+EPISODE_SETTINGS = ('savestate_id', 'observation_source', 'action_repeat', 'pipeline_depth', 'lockstep',
+                    'terminate_on_death', 'terminate_on_level_clear', 'pit_y',
+                    'terminate_on_mode_change', 'stagnation_frames', 'novelty_samples')
+
+
+class FitnessMemo:
+    def __init__(self, context='', verify=0.0, path=None, seed=None):
+        self.context = context
+        self.verify = verify
+        self.path = path or None
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.entries = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                pass  # Half-written file from a crash, start empty
+
+        # This generation: phenotype digests, genomes being verified, keys used
+        self.digests = {}
+        self.verifying = set()
+        self.used = set()
+        self.skipped = self.frames = self.verified = self.mismatched = 0
+        self.seconds = 0.0
+
+    @classmethod
+    def from_settings(cls, settings, fitness_version):
+        if not settings.fitness_memo:
+            return None
+        context = "|".join([str(fitness_version)] + [f"{name}={getattr(settings, name)!r}"
+                                                     for name in EPISODE_SETTINGS])
+        return cls(context, settings.fitness_memo_verify, settings.fitness_memo_file)
+
+    def key(self, digest, horizon):
+        return hashlib.sha1(f"{self.context}|{digest}|{horizon}".encode('utf-8')).hexdigest()
+
+    def plan(self, genome_id, genome, geometry, horizons):
+        """
+        Notes genome_id's phenotype for this generation. Returns True when
+        every horizon is memoized and it isn't picked for verification, i.e.
+        it doesn't need building.
+        """
+        digest = neato_cache.cppn_digest(genome, geometry)
+        self.digests[genome_id] = digest
+        if not all(self.key(digest, horizon) in self.entries for horizon in horizons):
+            return False
+        if self.verify > 0 and self.random.random() < self.verify:
+            self.verifying.add(genome_id)
+            return False
+        return True
+
+    def play(self, jobs, horizon, play, recalled):
+        """
+        Like play(jobs, horizon) for SuccessiveHalving.run, but memoized
+        (genome_id, weights) jobs aren't played: recalled(genome_id, fitness,
+        behavior) is called for them instead. Returns fitnesses in job order.
+        """
+        order = []
+
+        def unplayed():
+            for genome_id, weights in jobs:
+                entry = None
+                if genome_id not in self.verifying:
+                    entry = self._recall(genome_id, horizon)
+                order.append(entry)
+                if entry is None:
+                    yield genome_id, weights
+                else:
+                    recalled(genome_id, entry['fitness'], entry['behavior'])
+
+        played = iter(play(unplayed(), horizon))
+        return [next(played) if entry is None else entry['fitness'] for entry in order]
+
+    def _recall(self, genome_id, horizon):
+        key = self.key(self.digests[genome_id], horizon)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.used.add(key)
+                self.skipped += 1
+                self.frames += entry['frames']
+                self.seconds += entry['seconds']
+        return entry
+
+    def store(self, genome_id, horizon, fitness, outcome, behavior, seconds):
+        """Remembers a played episode (called from pool threads). outcome as filled by run_simulation."""
+        key = self.key(self.digests[genome_id], horizon)
+        entry = {
+            'fitness': fitness,
+            'reason': outcome['reason'],
+            'frames': outcome['frames'],
+            'saved': outcome['saved'],
+            'behavior': None if behavior is None else [float(value) for value in behavior],
+            'seconds': seconds,
+        }
+        with self.lock:
+            old = self.entries.get(key)
+            if genome_id in self.verifying and old is not None:
+                self.verified += 1
+                if old['fitness'] != fitness:
+                    self.mismatched += 1
+                    print(f"Fitness memo: genome {genome_id} scored {fitness} over {horizon} frames, "
+                          f"{old['fitness']} when memoized; the episode isn't deterministic")
+            self.entries[key] = entry
+            self.used.add(key)
+
+    def end_generation(self):
+        """
+        Returns (episodes skipped, frames skipped, seconds saved, verified,
+        mismatched) for the generation and resets them. Entries the generation
+        didn't use are dropped (their genomes are gone), and the file is
+        rewritten.
+        """
+        with self.lock:
+            totals = self.skipped, self.frames, self.seconds, self.verified, self.mismatched
+            self.entries = {key: entry for key, entry in self.entries.items() if key in self.used}
+            entries = dict(self.entries)
+            self.digests = {}
+            self.verifying = set()
+            self.used = set()
+            self.skipped = self.frames = self.verified = self.mismatched = 0
+            self.seconds = 0.0
+        if self.path:
+            with open(self.path + ".tmp", 'w') as f:
+                json.dump(entries, f)
+            os.replace(self.path + ".tmp", self.path)
+        return totals
@@ -0,0 +1,149 @@
+"""
+Live metrics for long runs, in the Prometheus text format.
+
+StdOutReporter only prints, so a stalled emulator or a throughput drop
+shows up in nobody's dashboard. MetricsReporter is a neat reporter that
+serves http://<metrics_host>:<metrics_port>/metrics from a background thread:
+
+    neato_generation                      generation being evaluated
+    neato_generation_elapsed_seconds      time since it started (keeps growing on a stall)
+    neato_generation_episodes             episodes it finished so far
+    neato_genomes_per_minute              genomes evaluated per minute, last generation
+    neato_frames_per_second               emulated frames per second, last generation
+    neato_step_rtt_seconds{quantile=...}  STEP round trips, last generation (summary)
+    neato_reset_seconds{quantile=...}     RESET round trips, last generation (summary)
+    neato_fitness_best / _mean            fitness of the last generation
+    neato_species                         species after the last generation
+    neato_checkpoint_age_seconds          time since the newest checkpoint was written
+
+The per-generation values are rendered once, in post_evaluate(), from what
+the brain already collects (neato_timing.GenerationTimes.last and
+neato_termination.TerminationPolicy.last). A scrape only reads that text,
+a couple of counters and the clock, so the evaluation loop never waits on
+it. Settings metrics_port (0 = off) and metrics_host turn it on:
+
+    metrics = neato_metrics.MetricsReporter.from_settings(settings, brain)
+    if metrics is not None:
+        p.add_reporter(metrics)
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import neat
+import numpy as np
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def gauge(name, help_text, value):
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value:.6g}"]
+
+
+def summary(name, help_text, samples):
+    """Prometheus summary lines (quantiles, _sum, _count) for durations in seconds."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+    values = np.asarray(samples, dtype=np.float64)
+    if len(values):
+        for q, value in zip(QUANTILES, np.percentile(values, [q * 100 for q in QUANTILES])):
+            lines.append(f'{name}{{quantile="{q}"}} {value:.6g}')
+    lines.append(f"{name}_sum {values.sum():.6g}")
+    lines.append(f"{name}_count {len(values)}")
+    return lines
+
+
+class MetricsReporter(neat.reporting.BaseReporter):
+    def __init__(self, brain, host='127.0.0.1', port=0):
+        self.brain = brain
+        self.lock = threading.Lock()
+        self.generation = None
+        self.generation_start = None
+        # Text of the metrics that only change once per generation
+        self.generation_text = ""
+
+        reporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = reporter.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        print(f"Metrics on http://{host}:{self.port}/metrics")
+
+    @classmethod
+    def from_settings(cls, settings, brain):
+        if settings.metrics_port <= 0:
+            return None
+        return cls(brain, settings.metrics_host, settings.metrics_port)
+
+    def start_generation(self, generation):
+        with self.lock:
+            self.generation = generation
+            self.generation_start = time.monotonic()
+
+    def post_evaluate(self, config, population, species, best_genome):
+        with self.lock:
+            start = self.generation_start
+        seconds = time.monotonic() - start if start is not None else 0.0
+        fitnesses = [genome.fitness for genome in population.values() if genome.fitness is not None]
+        _, _, played = self.brain.termination.last
+        step, reset = [], []
+        for times in self.brain.timings.last.values():
+            step.extend(times.samples.get('step', ()))
+            reset.extend(times.samples.get('reset', ()))
+
+        lines = []
+        if seconds > 0:
+            lines += gauge('neato_genomes_per_minute', "Genomes evaluated per minute in the last generation.",
+                           len(population) * 60.0 / seconds)
+            lines += gauge('neato_frames_per_second', "Emulated frames per second in the last generation.",
+                           played / seconds)
+        lines += summary('neato_step_rtt_seconds', "STEP round trips in the last generation.", step)
+        lines += summary('neato_reset_seconds', "RESET round trips in the last generation.", reset)
+        if fitnesses:
+            lines += gauge('neato_fitness_best', "Best fitness of the last generation.", max(fitnesses))
+            lines += gauge('neato_fitness_mean', "Mean fitness of the last generation.", float(np.mean(fitnesses)))
+        lines += gauge('neato_species', "Species after the last generation.", len(species.species))
+        with self.lock:
+            self.generation_text = "\n".join(lines) + "\n"
+
+    def render(self):
+        """The whole /metrics page. Called from the HTTP thread."""
+        with self.lock:
+            generation, start, text = self.generation, self.generation_start, self.generation_text
+        lines = []
+        if generation is not None:
+            termination = self.brain.termination
+            with termination.lock:
+                episodes = sum(termination.reasons.values())
+            lines += gauge('neato_generation', "Generation being evaluated.", generation)
+            lines += gauge('neato_generation_elapsed_seconds', "Seconds since the generation started.",
+                           time.monotonic() - start)
+            lines += gauge('neato_generation_episodes', "Episodes the generation finished so far.", episodes)
+        checkpoints = self.brain.checkpoints
+        latest = checkpoints.latest() if checkpoints is not None else None
+        if latest is not None and 'written' in latest:
+            lines += gauge('neato_checkpoint_age_seconds', "Seconds since the newest checkpoint was written.",
+                           time.time() - latest['written'])
+        return "\n".join(lines) + ("\n" if lines else "") + text
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join(timeout=2)
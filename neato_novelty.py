@@ -0,0 +1,235 @@
+"""
+Novelty search over Mario's trajectories.
+
+Fitness alone (max mario_x plus bonuses) rewards "hold Right" so strongly
+that populations converge on it early. With novelty_weight > 0 every episode
+also gets a behavior descriptor, and its fitness is blended with how far
+that behavior is from what has been seen before:
+
+    descriptor   (x - x0, y0 - y) at `samples` evenly spaced frames of the
+                 episode, in pixels. An episode that ends early keeps its
+                 last position for the remaining samples (a death is a
+                 behavior too).
+    novelty      mean distance to the k nearest descriptors among the
+                 archive and the rest of the current population
+    fitness      (1 - novelty_weight) * fitness + novelty_weight * novelty
+
+Both terms are in pixels, so the weight means what it says. After every
+generation the add_per_generation most novel descriptors join the archive.
+
+The archive grows to tens of thousands of descriptors, so it is not
+searched by brute force. NoveltyArchive keeps its points in static KD-trees
+of doubling sizes, plus a small buffer (the logarithmic method): inserting
+only ever rebuilds the small trees, and a batch query asks every tree for
+its k nearest and keeps the best k overall.
+"""
+import numpy as np
+
+
+class BehaviorTracker:
+    """Samples (x, y) at evenly spaced frames. record() is called after every step."""
+    def __init__(self, samples=10, max_frames=600):
+        self.samples = samples
+        # Frames at which a position is taken (the last at max_frames)
+        self.frames = [max_frames * (i + 1) // samples for i in range(samples)]
+        self.positions = np.zeros((samples, 2), dtype=np.float64)
+        self.count = 0
+        self.origin = None
+        self.last = (0, 0)
+
+    def start(self, x, y):
+        self.origin = (x, y)
+        self.last = (x, y)
+        self.count = 0
+
+    def record(self, frame, x, y):
+        self.last = (x, y)
+        while self.count < self.samples and frame >= self.frames[self.count]:
+            self.positions[self.count] = x, y
+            self.count += 1
+
+    def descriptor(self):
+        """Flat (x - x0, y0 - y, ...) vector, padded with the last position."""
+        self.positions[self.count:] = self.last
+        x0, y0 = self.origin if self.origin is not None else (0, 0)
+        out = np.empty(self.samples * 2, dtype=np.float64)
+        out[0::2] = self.positions[:, 0] - x0
+        out[1::2] = y0 - self.positions[:, 1]  # SMW's Y grows downwards; up is positive here
+        return out
+
+
+class KDTree:
+    """Static KD-tree with leaf buckets. Points are copied, reordered so every leaf is one slice."""
+    def __init__(self, points, leaf_size=128):
+        points = np.asarray(points, dtype=np.float64)
+        self.leaf_size = max(1, int(leaf_size))
+        order = np.arange(len(points))
+
+        # Node arrays (Python lists: they're only ever read one node at a time)
+        self.split_dim = []
+        self.split_val = []
+        self.children = []
+        self.bounds = []
+        stack = [(self._new_node(0, len(points)), 0, len(points))]
+        while stack:
+            node, start, end = stack.pop()
+            if end - start <= self.leaf_size:
+                continue
+            block = points[order[start:end]]
+            dim = int(np.argmax(block.max(axis=0) - block.min(axis=0)))
+            mid = (end - start) // 2
+            part = np.argpartition(block[:, dim], mid)
+            order[start:end] = order[start:end][part]
+            self.split_dim[node] = dim
+            self.split_val[node] = float(points[order[start + mid], dim])
+            left = self._new_node(start, start + mid)
+            right = self._new_node(start + mid, end)
+            self.children[node] = (left, right)
+            stack.append((left, start, start + mid))
+            stack.append((right, start + mid, end))
+
+        self.points = points[order]
+
+    def _new_node(self, start, end):
+        self.split_dim.append(-1)
+        self.split_val.append(0.0)
+        self.children.append(None)
+        self.bounds.append((start, end))
+        return len(self.children) - 1
+
+    def __len__(self):
+        return len(self.points)
+
+    def query(self, queries, k):
+        """Squared distances to the k nearest points, sorted, shape (len(queries), min(k, len(self)))."""
+        queries = np.asarray(queries, dtype=np.float64)
+        k = min(k, len(self.points))
+        out = np.empty((len(queries), k))
+        for i, x in enumerate(queries):
+            out[i] = self._query_one(x, k)
+        return out
+
+    def _query_one(self, x, k):
+        best = np.full(k, np.inf)
+        worst = np.inf
+        stack = [(0, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if bound >= worst:
+                continue
+            children = self.children[node]
+            if children is None:
+                start, end = self.bounds[node]
+                diff = self.points[start:end] - x
+                dist = np.einsum('ij,ij->i', diff, diff)
+                merged = np.concatenate((best, dist))
+                best = merged[np.argpartition(merged, k - 1)[:k]] if len(merged) > k else merged
+                worst = best.max()
+                continue
+            gap = x[self.split_dim[node]] - self.split_val[node]
+            near, far = (children[0], children[1]) if gap < 0 else (children[1], children[0])
+            # Far side last in, so the near side is searched first
+            stack.append((far, max(bound, gap * gap)))
+            stack.append((near, bound))
+        return np.sort(best)
+
+
+class NoveltyArchive:
+    """Incrementally growing point set with batch k-nearest-neighbour distances."""
+    def __init__(self, dim, leaf_size=128, buffer_size=256):
+        self.dim = dim
+        self.leaf_size = leaf_size
+        self.buffer_size = buffer_size
+        # Level i holds buffer_size * 2**i points, or None
+        self.trees = []
+        self.buffer = np.empty((0, dim))
+
+    def __len__(self):
+        return len(self.buffer) + sum(len(tree) for tree in self.trees if tree is not None)
+
+    def add(self, points):
+        points = np.asarray(points, dtype=np.float64).reshape(-1, self.dim)
+        self.buffer = np.concatenate((self.buffer, points))
+        while len(self.buffer) >= self.buffer_size:
+            block, self.buffer = self.buffer[:self.buffer_size], self.buffer[self.buffer_size:]
+            self._insert(block)
+
+    def _insert(self, block):
+        # Like a binary counter: merge full levels into the first empty one
+        level = 0
+        while level < len(self.trees) and self.trees[level] is not None:
+            block = np.concatenate((self.trees[level].points, block))
+            self.trees[level] = None
+            level += 1
+        if level == len(self.trees):
+            self.trees.append(None)
+        self.trees[level] = KDTree(block, self.leaf_size)
+
+    def knn_distances(self, queries, k):
+        """Distances to the k nearest archived points, sorted; (len(queries), min(k, len(self)))."""
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, self.dim)
+        parts = [tree.query(queries, k) for tree in self.trees if tree is not None]
+        if len(self.buffer):
+            diff = queries[:, None, :] - self.buffer[None, :, :]
+            parts.append(np.einsum('ijk,ijk->ij', diff, diff))
+        if not parts:
+            return np.empty((len(queries), 0))
+        return np.sqrt(_smallest(np.concatenate(parts, axis=1), k))
+
+
+def _smallest(dist, k):
+    """The k smallest values of every row, sorted."""
+    if dist.shape[1] > k:
+        dist = np.take_along_axis(dist, np.argpartition(dist, k - 1, axis=1)[:, :k], axis=1)
+    return np.sort(dist, axis=1)
+
+
+class NoveltySearch:
+    def __init__(self, weight=0.5, k=15, samples=10, add_per_generation=5, max_frames=600):
+        self.weight = weight
+        self.k = k
+        self.samples = samples
+        self.add_per_generation = add_per_generation
+        self.max_frames = max_frames
+        self.archive = NoveltyArchive(samples * 2)
+
+    @classmethod
+    def from_settings(cls, settings, max_frames=600):
+        if settings.novelty_weight <= 0:
+            return None
+        return cls(settings.novelty_weight, settings.novelty_k, settings.novelty_samples,
+                   settings.novelty_archive_add, max_frames)
+
+    def tracker(self):
+        return BehaviorTracker(self.samples, self.max_frames)
+
+    def novelty(self, descriptors):
+        """Novelty of every row: mean distance to its k nearest among the archive and the other rows."""
+        descriptors = np.asarray(descriptors, dtype=np.float64)
+        diff = descriptors[:, None, :] - descriptors[None, :, :]
+        population = np.einsum('ijk,ijk->ij', diff, diff)
+        np.fill_diagonal(population, np.inf)
+        nearest = np.sqrt(_smallest(population, self.k))
+        if len(self.archive):
+            nearest = _smallest(np.concatenate((nearest, self.archive.knn_distances(descriptors, self.k)),
+                                               axis=1), self.k)
+        nearest = np.where(np.isfinite(nearest), nearest, np.nan)
+        with np.errstate(invalid='ignore'):
+            scores = np.nanmean(nearest, axis=1) if nearest.shape[1] else np.zeros(len(descriptors))
+        return np.nan_to_num(scores)
+
+    def combine(self, behaviors, fitnesses):
+        """
+        behaviors: {genome_id: descriptor}; fitnesses: {genome_id: fitness}.
+        Returns the blended fitness of every genome with a descriptor and adds
+        the most novel descriptors to the archive.
+        """
+        ids = [genome_id for genome_id in fitnesses if genome_id in behaviors]
+        if not ids:
+            return {}
+        descriptors = np.array([behaviors[genome_id] for genome_id in ids])
+        scores = self.novelty(descriptors)
+        self.archive.add(descriptors[np.argsort(-scores, kind='stable')[:self.add_per_generation]])
+        self.last_mean = float(scores.mean())
+        return {genome_id: (1.0 - self.weight) * fitnesses[genome_id] + self.weight * float(score)
+                for genome_id, score in zip(ids, scores)}
@@ -0,0 +1,192 @@
+"""
+Observation layout and preprocessing.
+
+The network used to see exactly one 128x112 grayscale frame. ObservationLayout
+describes what it sees instead, and Preprocessor turns raw BGRA grabs into
+that, between the screen grab and the substrate:
+
+    crop          (left, top, right, bottom) of the 128x112 grid to keep
+                  (empty = the whole screen)
+    downsample    every input averages a downsample x downsample block of it
+    stack         the last `stack` frames, newest first
+    difference    one more plane: newest frame minus the one before, halved
+                  so it stays in -1..1
+
+The network inputs are those planes one after the other, each row-major.
+Substrate coordinates come from coords(), so they always match. A pixel keeps
+the (x, y) it has on the full 128x112 screen (-1..1), so a crop or a
+downsample doesn't move anything. Plane p is shifted right by p * PLANE_SPACING:
+the newest frame sits where the single frame always did, and the defaults give
+exactly the old coordinates.
+
+Frames go through a cv2.resize of the cropped grab to 128x112 grid pixels
+(what capture always did), a grayscale conversion, an area-averaging resize
+by the downsample factor and the normalizing lookup table, all into
+preallocated buffers. Averaging the small gray image costs a few
+microseconds; averaging the BGRA grab directly is several times slower
+(benchmarks/preprocess.py has the per-frame cost of each layout).
+History lives in a ring of `stack` planes (plus one for differencing with a
+single frame). The newest frame is written into its ring slot, and the input
+planes are copied out of the ring in order. Nothing is allocated per frame.
+With one plane and no differencing the frame goes straight into the inputs,
+as before.
+
+With source='tiles' there is no screen at all. neato_bridge.lua reads SMW's
+level tile map and sprite tables around Mario and sends a width x height grid
+of 16x16-pixel cells with every STATE reply (TILE_EMPTY, TILE_SOLID or
+TILE_SPRITE per byte; 16x14 is 224 bytes). process_tiles() maps the cells to
+0, 1 and -1 and keeps the same history as frames, so stacking and
+differencing still apply. Crop and downsample don't. The grid is centred on
+Mario, so its substrate coordinates are relative to him, not to the screen.
+"""
+import cv2
+import numpy as np
+
+# uint8 gray -> (gray / 127.5) - 1.0, the normalization run_simulation used
+NORMALIZE_LUT = (np.arange(256, dtype=np.float64) / 127.5 - 1.0).astype(np.float32)
+
+# Tile grid cells, as sent by neato_bridge.lua
+TILE_EMPTY = 0
+TILE_SOLID = 1
+TILE_SPRITE = 2
+# Cell code -> network input (256 entries so cv2.LUT can use it)
+TILE_LUT = np.zeros(256, dtype=np.float32)
+TILE_LUT[TILE_SOLID] = 1.0
+TILE_LUT[TILE_SPRITE] = -1.0
+
+SOURCES = ('screen', 'tiles')
+
+# x offset between planes in substrate coordinates (a screen is 2 wide)
+PLANE_SPACING = 2.5
+
+
+class ObservationLayout:
+    def __init__(self, width=128, height=112, downsample=1, crop=None, stack=1, difference=False,
+                 source='screen'):
+        if source not in SOURCES:
+            raise RuntimeError(f"Unknown observation source '{source}' (expected one of {', '.join(SOURCES)})")
+        if source == 'tiles' and (crop or downsample != 1):
+            raise RuntimeError("Observation crop and downsample only apply to screen observations")
+        self.source = source
+        self.screen_width = width
+        self.screen_height = height
+        self.downsample = max(1, int(downsample))
+        left, top, right, bottom = (int(v) for v in crop) if crop else (0, 0, width, height)
+        if not (0 <= left < right <= width and 0 <= top < bottom <= height):
+            raise RuntimeError(f"Observation crop {crop} is outside the {width}x{height} screen")
+        self.crop = (left, top, right, bottom)
+        self.stack = max(1, int(stack))
+        self.difference = bool(difference)
+
+        # One plane: the crop, downsampled (a partial block at the edge is dropped)
+        self.width = (right - left) // self.downsample
+        self.height = (bottom - top) // self.downsample
+        if self.width == 0 or self.height == 0:
+            raise RuntimeError(f"Observation crop {crop} is smaller than one {self.downsample}-pixel block")
+        self.plane_size = self.width * self.height
+        self.planes = self.stack + (1 if self.difference else 0)
+        self.size = self.planes * self.plane_size
+
+    @classmethod
+    def from_settings(cls, settings):
+        if settings.observation_source == 'tiles':
+            return cls(settings.observation_tile_width, settings.observation_tile_height,
+                       downsample=settings.observation_downsample,
+                       crop=tuple(int(v) for v in settings.observation_crop),
+                       stack=settings.observation_stack,
+                       difference=settings.observation_difference,
+                       source='tiles')
+        return cls(downsample=settings.observation_downsample,
+                   crop=tuple(int(v) for v in settings.observation_crop),
+                   stack=settings.observation_stack,
+                   difference=settings.observation_difference,
+                   source=settings.observation_source)
+
+    def coords(self):
+        """(size, 2) substrate coordinates of the inputs, in input order."""
+        left, top = self.crop[:2]
+        d = self.downsample
+        # Centre of each block on the full screen grid, mapped like np.linspace(-1, 1, width)
+        x = (left + np.arange(self.width) * d + (d - 1) / 2) * 2.0 / (self.screen_width - 1) - 1.0
+        y = (top + np.arange(self.height) * d + (d - 1) / 2) * 2.0 / (self.screen_height - 1) - 1.0
+        grid_x, grid_y = np.meshgrid(x, y)
+        plane = np.column_stack((grid_x.flatten(), grid_y.flatten()))
+        return np.vstack([plane + (p * PLANE_SPACING, 0.0) for p in range(self.planes)])
+
+
+class Preprocessor:
+    """Raw BGRA grabs -> network inputs for one layout. Used by one thread at a time."""
+    def __init__(self, layout=None):
+        self.layout = layout or ObservationLayout()
+        layout = self.layout
+        # The crop in grid pixels (whole blocks only), then downsampled
+        self.grid_size = (layout.width * layout.downsample, layout.height * layout.downsample)
+        self.grid_bgra = np.empty(self.grid_size[::-1] + (4,), dtype=np.uint8)
+        self.grid_gray = np.empty(self.grid_size[::-1], dtype=np.uint8)
+        self.small_gray = self.grid_gray
+        if layout.downsample > 1:
+            self.small_gray = np.empty((layout.height, layout.width), dtype=np.uint8)
+
+        # Frame history: ring[head] is the newest frame
+        self.direct = layout.planes == 1
+        slots = max(layout.stack, 2 if layout.difference else 1)
+        self.ring = np.zeros((slots, layout.height, layout.width), dtype=np.float32)
+        self.head = 0
+        self.filled = False
+        self.raw_shape = None
+        self.raw_crop = None
+
+    def reset(self):
+        """New episode: the next frame has no history, so it fills every slot (and differences are 0)."""
+        self.filled = False
+
+    def _crop(self, bgra):
+        if bgra.shape[:2] != self.raw_shape:
+            # The crop is in 128x112 grid units; scale it to whatever size was grabbed
+            self.raw_shape = bgra.shape[:2]
+            raw_h, raw_w = self.raw_shape
+            layout = self.layout
+            left, top = layout.crop[:2]
+            sx = raw_w / layout.screen_width
+            sy = raw_h / layout.screen_height
+            right = left + self.grid_size[0]
+            bottom = top + self.grid_size[1]
+            self.raw_crop = (slice(round(top * sy), round(bottom * sy)), slice(round(left * sx), round(right * sx)))
+        return bgra[self.raw_crop]
+
+    def process(self, bgra, out):
+        """Crop, resize, grayscale and normalize a BGRA frame, and update out (layout.size float32 values)."""
+        layout = self.layout
+        cv2.resize(self._crop(bgra), self.grid_size, dst=self.grid_bgra)
+        cv2.cvtColor(self.grid_bgra, cv2.COLOR_BGRA2GRAY, dst=self.grid_gray)
+        if self.small_gray is not self.grid_gray:
+            cv2.resize(self.grid_gray, (layout.width, layout.height), dst=self.small_gray,
+                       interpolation=cv2.INTER_AREA)
+        return self._planes(self.small_gray, NORMALIZE_LUT, out)
+
+    def process_tiles(self, tiles, out):
+        """Map a (layout.height, layout.width) uint8 tile grid to inputs and update out, like process()."""
+        return self._planes(tiles, TILE_LUT, out)
+
+    def _planes(self, small, lut, out):
+        layout = self.layout
+        planes = out.reshape(layout.planes, layout.height, layout.width)
+        if self.direct:
+            # cv2.LUT writes straight into out; np.take would first copy the
+            # uint8 pixels into a temporary index array
+            cv2.LUT(small, lut, dst=planes[0])
+            return out
+
+        slots = len(self.ring)
+        self.head = (self.head + 1) % slots
+        cv2.LUT(small, lut, dst=self.ring[self.head])
+        if not self.filled:
+            self.ring[:] = self.ring[self.head]
+            self.filled = True
+        for p in range(layout.stack):
+            np.copyto(planes[p], self.ring[(self.head - p) % slots])
+        if layout.difference:
+            diff = planes[layout.stack]
+            np.subtract(self.ring[self.head], self.ring[(self.head - 1) % slots], out=diff)
+            diff *= 0.5
+        return out
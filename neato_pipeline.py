@@ -0,0 +1,111 @@
+"""
+Pipelined episode stepping.
+
+The serial loop waits for every STEP reply before it grabs the next screen,
+so the CPU sits idle while the emulator advances and the emulator sits idle
+while we capture and infer. PipelinedBridge wraps a connected NeatoBridge
+and changes only when things happen:
+
+    serial:     capture k | infer k | send k ... wait k | capture k+1 | ...
+    pipelined:  capture k | infer k | send k | capture k+1 | wait k | infer k+1 | send k+1 | ...
+
+step() sends the STEP request, captures the next observation into the
+buffer capture_into() last filled while the emulator is busy, and only then
+reads the reply. The following capture_into() returns that prefetched frame
+without grabbing again.
+
+Semantics, with depth = the most STEP requests allowed on the wire at once:
+  - Observations lag by up to `depth` steps. The frame behind decision k+1
+    was grabbed after step k was sent, so it may not show step k's effect yet.
+  - Game variables (mario_x, ...) lag by depth - 1 steps. With depth=1 they
+    are exact: step() returns with the reply to the step it just sent, the
+    same as the serial loop, so fitness bookkeeping is unchanged.
+  - Replies still outstanding when an episode ends are drained, never read
+    as the answer to a later request. Any other bridge call (reset,
+    read_state, savestates, ...) drains first.
+
+Tile observations (NeatoBridge.tiles) arrive with the STEP reply itself, so
+there is nothing to grab early. step() doesn't prefetch then, and each
+observation is the latest tile grid read.
+
+Only the binary protocol can split a request. On the text protocol step()
+falls back to the serial NeatoBridge.step().
+
+The bridge's step timer (neato_timing) sees the whole pipelined step,
+including the prefetched grab; that grab is also timed on its own.
+"""
+import time
+
+
+class PipelinedBridge:
+    def __init__(self, bridge, depth=1):
+        self.bridge = bridge
+        self.depth = max(1, int(depth))
+        self.in_flight = 0
+        # Buffer the policy reads from, and whether it already holds the next frame
+        self.target = None
+        self.prefetched = False
+
+        # Frames whose capture ran while a step was in flight, out of all captures
+        self.overlapped = 0
+        self.captures = 0
+
+    def __getattr__(self, name):
+        # Everything not overridden goes to the bridge; calls drain first so a
+        # stale STEP reply is never mistaken for theirs
+        value = getattr(self.bridge, name)
+        if callable(value):
+            def drained(*args, **kwargs):
+                self.drain()
+                return value(*args, **kwargs)
+            return drained
+        return value
+
+    def capture_into(self, out):
+        """Like NeatoBridge.capture_into(), but returns the prefetched frame if step() grabbed one."""
+        if self.prefetched and out is self.target:
+            self.prefetched = False
+            return out
+        self.target = out
+        self.prefetched = False
+        self.captures += 1
+        return self.bridge.capture_into(out)
+
+    def step(self, buttons, repeat=1):
+        if self.bridge.protocol != 'binary':
+            return self.bridge.step(buttons, repeat)
+
+        start = time.perf_counter()
+        ok = self._step(buttons, repeat)
+        if self.bridge.timings is not None:
+            self.bridge.timings.add('step', time.perf_counter() - start)
+        return ok
+
+    def _step(self, buttons, repeat):
+        if not self.bridge.send_step(buttons, repeat):
+            return False
+        self.in_flight += 1
+
+        # The emulator is busy with the step: grab the next observation now
+        if self.target is not None and self.bridge.tiles is None:
+            self.prefetched = self.bridge.capture_into(self.target) is not None
+            self.captures += 1
+            self.overlapped += 1
+
+        while self.in_flight >= self.depth:
+            self.in_flight -= 1
+            if not self.bridge.receive_state():
+                self.in_flight = 0
+                return False
+        return True
+
+    def drain(self):
+        """Reads every outstanding reply. Returns False if the bridge was lost."""
+        self.prefetched = False
+        ok = True
+        while self.in_flight:
+            self.in_flight -= 1
+            if not self.bridge.receive_state():
+                self.in_flight = 0
+                ok = False
+        return ok
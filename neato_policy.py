@@ -0,0 +1,89 @@
+"""
+Compiled control policy.
+
+run_simulation used to turn network outputs into buttons with a fresh sigmoid
+array, a dict of buttons, a new feedback vector and two list.index() lookups
+every frame. Policy does that work once per genome. It keeps the weights as
+float32 in (outputs, inputs) layout, preallocates the input/output buffers and
+leaves the feedback slots at the end of the input buffer, updated in place.
+
+    policy = Policy(weights, active_buttons, feedback=True)
+    bridge.capture_into(policy.screen)
+    mask = policy.act()
+    bridge.step(mask)
+
+sigmoid(z) > 0.5 is the same test as z > 0, and comparing two sigmoids is
+the same as comparing the pre-activations, so the sigmoid itself is never
+computed.
+"""
+import numpy as np
+
+import neato_client
+
+
+class Policy:
+    def __init__(self, weights, active_buttons, n_inputs=None, feedback=False):
+        """
+        weights: dense (inputs, outputs) matrix, or anything with forward(inputs)
+        (sparse phenotypes, lockstep seats), in which case n_inputs is needed.
+        feedback: the last len(active_buttons) inputs are the previous frame's
+        buttons (run 2), written as 1.0 pressed / -1.0 not pressed.
+        """
+        if isinstance(weights, np.ndarray):
+            n_inputs = weights.shape[0]
+            self.weights = np.ascontiguousarray(weights.T, dtype=np.float32)
+            self.phenotype = None
+        else:
+            self.weights = None
+            self.phenotype = weights
+
+        n_outputs = len(active_buttons)
+        self.feedback = feedback
+        self.n_pixels = n_inputs - (n_outputs if feedback else 0)
+
+        # Screen pixels, then the feedback slots. capture_into() writes to screen.
+        self.inputs = np.empty(n_inputs, dtype=np.float32)
+        self.screen = self.inputs[:self.n_pixels]
+        self.feedback_slots = self.inputs[self.n_pixels:]
+        self.outputs = np.zeros(n_outputs, dtype=np.float32)
+        self.pressed = np.zeros(n_outputs, dtype=bool)
+        self.bits = np.array([neato_client.BUTTON_MASKS[name.lower()] for name in active_buttons],
+                             dtype=np.int64)
+
+        # Left/Right looked up once instead of every frame
+        self.left_right = 0
+        if 'Left' in active_buttons and 'Right' in active_buttons:
+            self.left = active_buttons.index('Left')
+            self.right = active_buttons.index('Right')
+            self.left_bit = int(self.bits[self.left])
+            self.right_bit = int(self.bits[self.right])
+            self.left_right = self.left_bit | self.right_bit
+        self.reset()
+
+    def reset(self):
+        """Start of an episode: no buttons were held on the previous frame."""
+        self.feedback_slots[:] = -1.0
+        self.pressed[:] = False
+
+    def act(self):
+        """Decides the buttons for the current inputs. Returns a button bitmask (int)."""
+        if self.weights is not None:
+            np.dot(self.weights, self.inputs, out=self.outputs)
+        else:
+            self.outputs[:] = self.phenotype.forward(self.inputs)
+        np.greater(self.outputs, 0.0, out=self.pressed)
+
+        # The network sees what it decided, before the Left/Right conflict is resolved
+        if self.feedback:
+            np.multiply(self.pressed, 2.0, out=self.feedback_slots)
+            self.feedback_slots -= 1.0
+
+        mask = int(np.bitwise_or.reduce(self.bits, where=self.pressed, initial=0))
+
+        # Left+Right cancel each other out in SNES: keep the stronger output
+        if self.left_right and mask & self.left_right == self.left_right:
+            if self.outputs[self.left] > self.outputs[self.right]:
+                mask &= ~self.right_bit
+            else:
+                mask &= ~self.left_bit
+        return mask
@@ -0,0 +1,101 @@
+"""
+Evaluation pool over several emulators.
+
+Each BizHawk instance runs neato_bridge.lua on its own port (NEATO_PORT), and
+EvaluationPool keeps one NeatoBridge per port. Every live bridge gets a worker
+thread that pulls the next job as soon as its emulator is free, so a
+generation runs as many episodes at once as there are emulators.
+
+A bridge that drops its connection or times out mid-episode is taken out of
+rotation for the rest of the generation and its job goes back in the queue
+for another emulator. It is reconnected at the start of the next generation.
+"""
+import queue
+import threading
+
+import neato_client
+
+
+class EvaluationPool:
+    def __init__(self, host='127.0.0.1', base_port=8086, count=1, timeout=None, layout=None):
+        self.bridges = [neato_client.NeatoBridge(host, base_port + i, timeout=timeout, layout=layout)
+                        for i in range(count)]
+        self.requeued = 0
+
+    def connect(self):
+        """Connects every bridge that isn't connected. Returns the live ones."""
+        live = []
+        for bridge in self.bridges:
+            if bridge.sock or bridge.connect():
+                live.append(bridge)
+        return live
+
+    def set_turbo(self, enabled):
+        """Turbo training mode on every emulator (see NeatoBridge.set_turbo())."""
+        for bridge in self.bridges:
+            bridge.set_turbo(enabled)
+
+    def evaluate(self, jobs, episode):
+        """
+        Runs episode(bridge, job) for every job on whichever emulator is free.
+        jobs can be a generator; jobs are dispatched as they arrive.
+        Returns the episode results in job order. Jobs that no emulator could
+        finish score 0.
+        """
+        live = self.connect()
+        if not live:
+            print("Could not connect to any bridge!")
+
+        work = queue.Queue()
+        results = {}
+        lock = threading.Lock()
+        state = {'submitted': 0, 'all_submitted': False}
+
+        def finished():
+            with lock:
+                return state['all_submitted'] and len(results) == state['submitted']
+
+        def worker(bridge):
+            while not finished():
+                try:
+                    index, job = work.get(timeout=0.05)
+                except queue.Empty:
+                    continue
+
+                result = episode(bridge, job)
+
+                if bridge.sock is None:
+                    # Bridge died or timed out: requeue the job, retire the bridge
+                    print(f"Bridge on port {bridge.port} lost, requeueing its genome")
+                    with lock:
+                        self.requeued += 1
+                    work.put((index, job))
+                    return
+
+                with lock:
+                    results[index] = result
+
+        threads = [threading.Thread(target=worker, args=(bridge,), daemon=True) for bridge in live]
+        for thread in threads:
+            thread.start()
+
+        count = 0
+        for job in jobs:
+            with lock:
+                state['submitted'] += 1
+            work.put((count, job))
+            count += 1
+        with lock:
+            state['all_submitted'] = True
+
+        for thread in threads:
+            thread.join()
+
+        missing = count - len(results)
+        if missing:
+            print(f"No emulator left to run {missing} genome(s), scoring them 0")
+        return [results.get(i, 0) for i in range(count)]
+
+    def close(self):
+        for bridge in self.bridges:
+            bridge.close()
@@ -0,0 +1,77 @@
+"""
+Successive-halving evaluation budget.
+
+Every genome used to get the full 600 frames, although most of a population
+is obviously bad within the first hundred. With racing_horizons set, a
+generation is played in rungs of growing horizon instead:
+
+    racing_horizons = 150 300    racing_keep = 0.5
+
+    rung 0: every genome plays 150 frames
+    rung 1: the best half of them plays 300 frames
+    rung 2: the best half of those plays max_frames (600)
+
+Each rung replays its genomes from the reset state. The emulator restarts
+from the same savestate, so the first frames of a longer run repeat the
+shorter one exactly, and the longer horizon only adds to them.
+
+Fitness stays comparable across rungs: a genome's fitness is the best score
+of any rung it played. A genome cut at rung k scored below every survivor of
+rung k on the same horizon, and a survivor never ends with less than its
+rung-k score. So nothing eliminated early can outrank a genome that beat it,
+and NEAT's selection sees the same order the race decided.
+"""
+import math
+
+
+class SuccessiveHalving:
+    def __init__(self, horizons=(), keep=0.5, max_frames=600):
+        # Shorter rungs first; the last rung always plays the full budget
+        self.horizons = sorted({int(h) for h in horizons if 0 < int(h) < max_frames}) + [max_frames]
+        self.keep = keep
+        self.max_frames = max_frames
+        # Genomes played in each rung of the last run()
+        self.rung_sizes = []
+
+    @classmethod
+    def from_settings(cls, settings, max_frames=600):
+        return cls(settings.racing_horizons, settings.racing_keep, max_frames)
+
+    def survivors(self, scores):
+        """The best keep fraction of {genome_id: score} (at least one), best first. Ties go to the lower id."""
+        count = max(1, math.ceil(len(scores) * self.keep))
+        ranked = sorted(scores, key=lambda genome_id: (-scores[genome_id], genome_id))
+        return ranked[:count]
+
+    def run(self, jobs, play):
+        """
+        Races the (genome_id, weights) jobs through every rung.
+        play(jobs, horizon) plays a list or generator of jobs for horizon
+        frames each and returns their fitnesses in job order (like
+        EvaluationPool.evaluate). The first rung is handed the jobs as they
+        arrive, so a streaming build keeps overlapping with play.
+        Returns {genome_id: fitness}.
+        """
+        weights = {}
+        order = []
+
+        def first_rung():
+            for genome_id, genome_weights in jobs:
+                weights[genome_id] = genome_weights
+                order.append(genome_id)
+                yield genome_id, genome_weights
+
+        fitness = {}
+        self.rung_sizes = []
+        rung_jobs = first_rung()
+        ids = order
+        for rung, horizon in enumerate(self.horizons):
+            scores = dict(zip(ids, play(rung_jobs, horizon)))
+            for genome_id, score in scores.items():
+                fitness[genome_id] = max(score, fitness.get(genome_id, score))
+            self.rung_sizes.append(len(scores))
+            if rung + 1 == len(self.horizons):
+                break
+            ids = self.survivors(scores)
+            rung_jobs = [(genome_id, weights[genome_id]) for genome_id in ids]
+        return fitness
@@ -0,0 +1,139 @@
+"""
+Neato-specific run settings.
+
+neat.Config only reads the sections it knows about, so each run config can
+carry an optional [Neato] section for our own knobs:
+
+    [Neato]
+    build_workers = 4
+
+Anything missing falls back to DEFAULTS.
+"""
+from configparser import ConfigParser
+
+SECTION = 'Neato'
+
+DEFAULTS = {
+    # Processes used to build phenotypes (1 = build in-process)
+    'build_workers': 1,
+    # Weight matrices kept in memory by the phenotype cache (0 = off)
+    'phenotype_cache_size': 0,
+    # Directory for the on-disk .npy tier of the cache (empty = memory only)
+    'phenotype_cache_dir': '',
+    # Emulators used for evaluation, on ports bridge_port .. bridge_port + bridge_count - 1
+    'bridge_port': 8086,
+    'bridge_count': 1,
+    # Seconds to wait for a bridge reply before taking it out of rotation
+    'bridge_timeout': 5.0,
+    # Frames each decision is held for (frame skip); counters stay in emulated frames
+    'action_repeat': 1,
+    # What the network sees (see neato_observation): 'screen' captures the emulator window,
+    # 'tiles' has neato_bridge.lua send a width x height grid of 16x16 level tiles and
+    # sprites around Mario instead (binary protocol only)
+    'observation_source': 'screen',
+    'observation_tile_width': 16,
+    'observation_tile_height': 14,
+    # A crop of the 128x112 screen as "left top right bottom" (empty = all of it) and a
+    # downsampling factor (screen only), how many recent frames are stacked, and whether
+    # a newest-minus-previous frame is added
+    'observation_downsample': 1,
+    'observation_crop': (),
+    'observation_stack': 1,
+    'observation_difference': False,
+    # Hidden grid between the screen and the buttons (0 x 0 = dense, screen wired straight to buttons)
+    'hidden_width': 0,
+    'hidden_height': 0,
+    # Hidden-layer connections with |weight| below this are pruned (HyperNEAT expression threshold)
+    'weight_threshold': 0.2,
+    # Batch inference of concurrent episodes into one product per frame (dense substrate only)
+    'lockstep': False,
+    # STEP requests kept in flight while the next screen is captured (0 = serial loop)
+    'pipeline_depth': 0,
+    # Turbo training mode while evaluating: emulators run unthrottled and muted, and stop
+    # rendering when observations don't need the screen. Winner replays run normally.
+    'turbo': True,
+    # Directory to record every episode to (observations, RAM, buttons); empty = off
+    'record_dir': '',
+    # Episode termination (see neato_termination): end on death, on level clear, below
+    # mario_y = pit_y (0 = off), when game_mode changes, and after this many frames without progress
+    'terminate_on_death': True,
+    'terminate_on_level_clear': True,
+    'pit_y': 0,
+    'terminate_on_mode_change': True,
+    'stagnation_frames': 60,
+    # Successive halving: horizons (frames) played before the full budget, best racing_keep
+    # fraction promoted after each (empty = every genome plays the full budget)
+    'racing_horizons': (),
+    'racing_keep': 0.5,
+    # Novelty search: weight of novelty in the fitness (0 = off), neighbours it's measured
+    # against, positions per trajectory descriptor, and descriptors archived per generation
+    'novelty_weight': 0.0,
+    'novelty_k': 15,
+    'novelty_samples': 10,
+    'novelty_archive_add': 5,
+    # Hand back the memoized result of an episode already played instead of replaying it,
+    # optionally kept in a JSON file across runs, and the fraction of memoized genomes
+    # replayed anyway to catch nondeterminism (see neato_memo)
+    'fitness_memo': False,
+    'fitness_memo_file': '',
+    'fitness_memo_verify': 0.0,
+    # Names the start state the bridges reset to; change it along with the savestate
+    'savestate_id': 'slot1',
+    # Port remote workers connect to (0 = play on the local bridges), the address it listens
+    # on, seconds of silence before a worker's genomes are reassigned, and seconds evaluate
+    # waits for a worker when none is connected (see neato_distributed)
+    'coordinator_port': 0,
+    'coordinator_host': '0.0.0.0',
+    'worker_timeout': 5.0,
+    'worker_wait': 30.0,
+    # Checkpoint directory (empty = off), generations between checkpoints, and checkpoints
+    # per chain (a full snapshot, then deltas of the genomes not stored yet)
+    'checkpoint_dir': '',
+    'checkpoint_interval': 1,
+    'checkpoint_full_every': 10,
+    # Prometheus metrics served on http://metrics_host:metrics_port/metrics (0 = off)
+    'metrics_port': 0,
+    'metrics_host': '127.0.0.1',
+    # Genome id whose episode is run under cProfile (0 = off), and where the stats go
+    # (empty = genome-<id>.prof in the working directory)
+    'profile_genome': 0,
+    'profile_output': '',
+}
+
+
+class NeatoSettings:
+    def __init__(self, **overrides):
+        for name, value in DEFAULTS.items():
+            setattr(self, name, value)
+        for name, value in overrides.items():
+            if name not in DEFAULTS:
+                raise RuntimeError(f"Unknown Neato setting: {name}")
+            setattr(self, name, value)
+
+    @classmethod
+    def from_file(cls, config_path):
+        """Reads the [Neato] section of a run config, if there is one."""
+        parameters = ConfigParser()
+        with open(config_path) as f:
+            parameters.read_file(f)
+
+        overrides = {}
+        if parameters.has_section(SECTION):
+            for name, raw in parameters.items(SECTION):
+                if name not in DEFAULTS:
+                    raise RuntimeError(f"Unknown ({SECTION} section) configuration item {name}")
+                overrides[name] = _parse(raw, DEFAULTS[name])
+        return cls(**overrides)
+
+
+def _parse(raw, default):
+    # Use the type of the default to decide how to read the value
+    if isinstance(default, bool):
+        return raw.strip().lower() in ('1', 'true', 'yes', 'on')
+    if isinstance(default, int):
+        return int(raw)
+    if isinstance(default, float):
+        return float(raw)
+    if isinstance(default, (list, tuple)):
+        return type(default)(raw.split())
+    return raw.strip()
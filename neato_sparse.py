@@ -0,0 +1,150 @@
+"""
+Sparse hidden-layer substrate.
+
+The dense substrate wires every pixel straight to every button. design_overview.md
+describes a Processing layer between the two, which is far too expensive as a
+dense matrix (14k pixels x hidden neurons every frame). Here the CPPN is queried
+for input -> hidden and hidden -> output pairs and, HyperNEAT style, any weight
+whose magnitude is below the expression threshold is not expressed at all. The
+survivors are stored in CSR form, so the per-frame cost follows the number of
+connections that survived rather than the size of the grids.
+"""
+import numpy as np
+
+import neato_cppn
+
+# Hidden neurons queried per CPPN pass, to bound the memory of the query arrays
+BUILD_CHUNK = 32
+
+
+def hidden_grid(width, height):
+    """Coordinates of a width x height hidden layer, spread over (-1, 1) like the input grid."""
+    x_range = np.linspace(-1, 1, width)
+    y_range = np.linspace(-1, 1, height)
+    hidden_x, hidden_y = np.meshgrid(x_range, y_range)
+    return np.column_stack((hidden_x.flatten(), hidden_y.flatten()))
+
+
+class CSRMatrix:
+    """
+    Compressed sparse rows: row i (a destination neuron) reads from
+    indices[indptr[i]:indptr[i + 1]] with weights data[indptr[i]:indptr[i + 1]].
+    """
+    def __init__(self, indptr, indices, data, shape):
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        # np.take is several times faster with native-width indices than with
+        # int32 ones it has to convert on every call
+        self.indices = np.asarray(indices, dtype=np.intp)
+        self.data = np.asarray(data, dtype=np.float32)
+        self.shape = tuple(int(n) for n in shape)
+
+        # Precomputed for dot(): reduceat only runs over rows with connections
+        # (each sum then ends where the next non-empty row starts), and the
+        # sums are scattered back so empty rows stay zero
+        self._rows = np.flatnonzero(self.indptr[:-1] != self.indptr[1:])
+        self._starts = self.indptr[:-1][self._rows]
+
+    @classmethod
+    def from_dense(cls, dense, threshold):
+        """dense: (rows, cols). Keeps entries with |w| >= threshold."""
+        keep = np.abs(dense) >= threshold
+        rows, cols = np.nonzero(keep)
+        indptr = np.zeros(dense.shape[0] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=dense.shape[0]), out=indptr[1:])
+        return cls(indptr, cols, dense[rows, cols], dense.shape)
+
+    @property
+    def nnz(self):
+        return len(self.data)
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes + self.data.nbytes
+
+    def dot(self, x):
+        """Matrix-vector product: one value per row."""
+        if self.nnz == 0:
+            return np.zeros(self.shape[0], dtype=np.float32)
+        # Indices are in range by construction, so skip take()'s bounds checking
+        products = np.take(x, self.indices, mode='clip')
+        products *= self.data
+        out = np.zeros(self.shape[0], dtype=products.dtype)
+        out[self._rows] = np.add.reduceat(products, self._starts)
+        return out
+
+
+class SparsePhenotype:
+    """
+    Input -> hidden (tanh) -> output network with CSR weights.
+    forward() returns the output pre-activations, the same thing
+    np.dot(inputs, weights) gives for a dense phenotype.
+    """
+    def __init__(self, hidden, output):
+        self.hidden = hidden
+        self.output = output
+
+    def forward(self, inputs):
+        hidden = np.tanh(self.hidden.dot(inputs))
+        return self.output.dot(hidden)
+
+    @property
+    def nnz(self):
+        return self.hidden.nnz + self.output.nnz
+
+    @property
+    def nbytes(self):
+        return self.hidden.nbytes + self.output.nbytes
+
+    def to_arrays(self):
+        """Flat dict of arrays, for np.savez. Indices are stored as int32."""
+        arrays = {}
+        for name, layer in (('hidden', self.hidden), ('output', self.output)):
+            arrays[name + '_indptr'] = layer.indptr
+            arrays[name + '_indices'] = layer.indices.astype(np.int32)
+            arrays[name + '_data'] = layer.data
+            arrays[name + '_shape'] = np.array(layer.shape)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        layers = []
+        for name in ('hidden', 'output'):
+            layers.append(CSRMatrix(arrays[name + '_indptr'], arrays[name + '_indices'],
+                                    arrays[name + '_data'], tuple(arrays[name + '_shape'])))
+        return cls(*layers)
+
+
+def forward(weights, inputs):
+    """
+    Output pre-activations for a dense weight matrix, or for anything with a
+    forward(inputs) method (SparsePhenotype, a neato_lockstep.Seat).
+    """
+    if isinstance(weights, np.ndarray):
+        return np.dot(inputs, weights)
+    return weights.forward(inputs)
+
+
+def build_layer(compiled, source_coords, target_coords, threshold):
+    """CPPN weights from source to target neurons, pruned and stored as CSR (rows = targets)."""
+    parts = []
+    for start in range(0, target_coords.shape[0], BUILD_CHUNK):
+        block = compiled.query_grid(source_coords, target_coords[start:start + BUILD_CHUNK])
+        parts.append(CSRMatrix.from_dense(block.T, threshold))
+
+    # Stitch the row blocks back together
+    indptr = [np.zeros(1, dtype=np.int64)]
+    offset = 0
+    for part in parts:
+        indptr.append(part.indptr[1:] + offset)
+        offset += part.nnz
+    return CSRMatrix(np.concatenate(indptr),
+                     np.concatenate([part.indices for part in parts]),
+                     np.concatenate([part.data for part in parts]),
+                     (target_coords.shape[0], source_coords.shape[0]))
+
+
+def build_sparse(cppn, input_coords, hidden_coords, output_coords, threshold):
+    """Builds the pruned input -> hidden -> output phenotype for a CPPN."""
+    compiled = neato_cppn.CompiledCPPN(cppn)
+    return SparsePhenotype(build_layer(compiled, input_coords, hidden_coords, threshold),
+                           build_layer(compiled, hidden_coords, output_coords, threshold))
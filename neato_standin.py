@@ -0,0 +1,373 @@
+"""
+Python stand-in for neato_bridge.lua.
+
+StandInBridge serves the same line protocol as the Lua script (GET_STATE,
+ACT:..., RESET, SAVE/LOAD/DROP:<handle>, TURBO:<mode>) from a background
+thread, with a very small fake Mario that walks when Left/Right are held
+(runs with Y) and jumps with A/B. Everything
+is integer arithmetic, so the same buttons always give the same positions.
+A pit (Mario falls through and dies, anim_state 9) and a goal X (sets
+end_level_timer) can be placed on the otherwise flat level.
+It lets the client, the evaluation pool and the training loop be exercised
+without BizHawk.
+
+With binary=True (the default) it also answers HELLO <version> and switches
+the connection to the binary STEP protocol when the version is its own
+(version, neato_client.PROTOCOL_VERSION by default), like neato_bridge.lua
+v22. legacy_hello=True switches on any HELLO instead, like the scripts from
+before that check. With binary=False it behaves like the older text-only
+scripts.
+
+Tile observations (OP_TILES) are served too. By default the grid is drawn
+from the fake level: ground, the pit and standing enemies at the X positions
+in enemies. tile_grids replaces that with recorded grids (an array of
+(height, width) uint8 grids, e.g. NeatoBridge.tiles saved after every frame
+of a real episode): the grid sent is the one for the number of frames since
+the last reset, and the last one once the recording runs out.
+
+Turbo training mode (OP_TURBO, TURBO:<mode>) follows the Lua script's state
+machine: throttled, rendering and sound model the emulator's settings,
+entering turbo from normal remembers them, and mode 0 or a new connection
+puts them back. While not rendering, render() keeps returning the last
+screen drawn, like a window that stopped updating.
+
+Failure injection for pool tests:
+    fail_after  - drop the connection after this many commands
+    stall_after - stop answering after this many commands
+
+frame_time makes every emulated frame take that many seconds, roughly like
+an emulator running unthrottled, for benchmarks that care about overlap.
+"""
+import socket
+import struct
+import threading
+import time
+
+import numpy as np
+
+import neato_client
+import neato_observation
+
+START_X = 16
+START_Y = 320  # Ground level; SMW's Y grows downwards
+WALK_SPEED = 2
+RUN_SPEED = 3
+JUMP_SPEED = 6
+GRAVITY = 1
+PIT_DEPTH = START_Y + 64  # Falling below this is a death
+DEATH_ANIMATION = 9  # anim_state while dying, as in SMW
+GROUND_Y = START_Y + 32  # Mario is 32 pixels tall; the ground starts under his feet
+ENEMY_Y = START_Y + 16  # Enemies are 16 pixels tall and stand on the ground
+
+
+class StandInBridge:
+    def __init__(self, host='127.0.0.1', port=0, fail_after=None, stall_after=None, binary=True,
+                 frame_time=0.0, pit=None, goal_x=None, enemies=(), tile_grids=None,
+                 version=neato_client.PROTOCOL_VERSION, legacy_hello=False):
+        self.host = host
+        self.binary = binary
+        self.version = version
+        self.legacy_hello = legacy_hello
+        self.frame_time = frame_time
+        # Optional (start_x, end_x) stretch with no ground, and the X where the level ends
+        self.pit = pit
+        self.goal_x = goal_x
+        self.enemies = tuple(enemies)
+        self.tile_grids = None if tile_grids is None else np.asarray(tile_grids, dtype=np.uint8)
+        self.tile_shape = None  # (height, width) requested with OP_TILES on this connection
+        # Emulator settings turbo mode changes, and what they were before it
+        self.throttled = True
+        self.rendering = True
+        self.sound = True
+        self.turbo_mode = 0
+        self.normal = None
+        self.fail_after = fail_after
+        self.stall_after = stall_after
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(1)
+        self.port = self.server.getsockname()[1]
+
+        self.commands = 0
+        self.frame = 0
+        self.resets = 0
+        self.saved_states = {}
+        self.geometry = (0, 0, 256, 224, 0, 0)
+        self.screen = np.empty((224, 256, 4), dtype=np.uint8)
+        self.reset_state()
+
+        self.running = False
+        self.thread = None
+
+    def reset_state(self):
+        self.mario_x = START_X
+        self.mario_y = START_Y
+        self.y_speed = 0
+        self.game_mode = 20
+        self.level_index = 0
+        self.end_level_timer = 0
+        self.anim_state = 0
+        self.ticks = 0  # Frames since the reset, to index tile_grids
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        try:
+            # shutdown() wakes up a thread blocked in accept(), close() alone doesn't
+            self.server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.server.close()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _serve(self):
+        # Like the Lua script, only one client is served at a time
+        while self.running:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            with conn:
+                self._handle_client(conn)
+
+    def _handle_client(self, conn):
+        reader = conn.makefile('rb')
+        binary_mode = False
+        last_geometry = None
+        self.tile_shape = None
+        self.set_turbo(0)
+        # Savestates belong to the connection, as in the Lua script
+        self.saved_states = {}
+        while self.running:
+            try:
+                if binary_mode:
+                    header = reader.read(2)
+                    if len(header) < 2:
+                        return
+                    payload = reader.read(struct.unpack('<H', header)[0])
+                else:
+                    line = reader.readline()
+                    if not line:
+                        return
+            except OSError:
+                return
+
+            self.commands += 1
+            if self.fail_after is not None and self.commands > self.fail_after:
+                self.running = False
+                return
+            if self.stall_after is not None and self.commands > self.stall_after:
+                # Keep the socket open but never answer again
+                while self.running:
+                    threading.Event().wait(0.05)
+                return
+
+            if binary_mode:
+                ok = self.handle_binary(payload)
+                include_geometry = self.geometry != last_geometry
+                last_geometry = self.geometry
+                reply = self.state_message(include_geometry, failed=not ok)
+            else:
+                command = line.decode('utf-8').strip()
+                hello, _, version = command.partition(" ")
+                if hello == "HELLO" and self.binary:
+                    reply = f"NEATO_BIN {self.version}\n".encode('utf-8')
+                    if self.legacy_hello or version == str(self.version):
+                        binary_mode = True
+                        last_geometry = None
+                else:
+                    reply = (self.handle(command) + "\n").encode('utf-8')
+
+            try:
+                conn.sendall(reply)
+            except OSError:
+                return
+
+    def handle_binary(self, payload):
+        """Applies one binary request. Every request is answered with STATE."""
+        opcode = payload[0]
+        if opcode == neato_client.OP_STEP:
+            mask, = struct.unpack_from('<H', payload, 1)
+            repeat = max(1, payload[3]) if len(payload) >= 4 else 1
+            buttons = set(neato_client.mask_to_buttons(mask))
+            for _ in range(repeat):
+                self.step(buttons)
+        elif opcode == neato_client.OP_RESET:
+            self.resets += 1
+            self.reset_state()
+        elif opcode in (neato_client.OP_SAVE, neato_client.OP_LOAD, neato_client.OP_DROP):
+            handle, = struct.unpack_from('<H', payload, 1)
+            return self.savestate(opcode, handle)
+        elif opcode == neato_client.OP_TILES:
+            return self.set_tiles(payload[1], payload[2])
+        elif opcode == neato_client.OP_TURBO:
+            return self.set_turbo(payload[1])
+        elif opcode != neato_client.OP_GET_STATE:
+            return False
+        return True
+
+    def savestate(self, opcode, handle):
+        """In-memory savestates, like memorysavestate in the Lua bridge."""
+        if opcode == neato_client.OP_SAVE:
+            self.saved_states[handle] = (self.mario_x, self.mario_y, self.y_speed, self.game_mode,
+                                         self.level_index, self.end_level_timer, self.anim_state,
+                                         self.ticks)
+            return True
+        if handle not in self.saved_states:
+            return False
+        if opcode == neato_client.OP_LOAD:
+            (self.mario_x, self.mario_y, self.y_speed, self.game_mode,
+             self.level_index, self.end_level_timer, self.anim_state,
+             self.ticks) = self.saved_states[handle]
+        else:
+            del self.saved_states[handle]
+        return True
+
+    def set_tiles(self, width, height):
+        """OP_TILES: a width x height grid with every STATE from now on (0 x 0 = off)."""
+        if not width or not height:
+            self.tile_shape = None
+            return True
+        if self.tile_grids is not None and self.tile_grids.shape[1:] != (height, width):
+            # Recorded grids come in one size only
+            return False
+        self.tile_shape = (height, width)
+        return True
+
+    def set_turbo(self, mode):
+        """Turbo training mode (neato_client.TURBO_* bits); 0 restores the settings from before."""
+        if mode == self.turbo_mode:
+            return True
+        if self.turbo_mode == 0:
+            self.normal = (self.throttled, self.rendering, self.sound)
+        if mode == 0:
+            self.throttled, self.rendering, self.sound = self.normal
+        else:
+            self.throttled = not mode & neato_client.TURBO_UNTHROTTLED
+            self.rendering = not mode & neato_client.TURBO_NO_RENDER
+            self.sound = self.normal[2] and not mode & neato_client.TURBO_MUTE
+        self.turbo_mode = mode
+        return True
+
+    def tile_grid(self, width, height):
+        """The (height, width) uint8 grid around Mario, laid out like neato_bridge.lua's read_tiles()."""
+        if self.tile_grids is not None:
+            return self.tile_grids[min(self.ticks, len(self.tile_grids) - 1)]
+        left, top = width // 2, height // 2
+        xs = self.mario_x + 8 + (np.arange(width) - left) * 16
+        ys = self.mario_y + (np.arange(height) - top) * 16
+        ground = xs >= 0
+        if self.pit is not None:
+            ground &= (xs < self.pit[0]) | (xs >= self.pit[1])
+        solid = (ys[:, None] >= GROUND_Y) & ground[None, :]
+        grid = np.where(solid, neato_observation.TILE_SOLID, neato_observation.TILE_EMPTY).astype(np.uint8)
+        row = (ENEMY_Y - self.mario_y + 8) // 16 + top
+        for enemy_x in self.enemies:
+            col = (enemy_x - self.mario_x + 8) // 16 + left
+            if 0 <= col < width and 0 <= row < height:
+                grid[row, col] = neato_observation.TILE_SPRITE
+        return grid
+
+    def state_message(self, include_geometry, failed=False):
+        """Length-framed STATE reply, laid out like neato_bridge.lua's state_message()."""
+        flags = neato_client.FLAG_GEOMETRY if include_geometry else 0
+        if failed:
+            flags |= neato_client.FLAG_ERROR
+        if self.tile_shape is not None:
+            flags |= neato_client.FLAG_TILES
+        payload = neato_client.STATE_STRUCT.pack(
+            neato_client.OP_STATE, flags, self.frame, self.mario_x, self.mario_y,
+            self.game_mode, self.level_index, self.end_level_timer, self.anim_state)
+        if include_geometry:
+            payload += neato_client.GEOMETRY_STRUCT.pack(*self.geometry)
+        if self.tile_shape is not None:
+            payload += self.tile_grid(self.tile_shape[1], self.tile_shape[0]).tobytes()
+        return struct.pack('<H', len(payload)) + payload
+
+    def render(self):
+        """
+        Synthetic BGRA screen: sky, ground and a Mario-sized block.
+        Pass it as NeatoBridge(frame_source=server.render) so capture works
+        without a real BizHawk window.
+        """
+        screen = self.screen
+        if not self.rendering:
+            return screen
+        screen[:] = (200, 140, 90, 255)  # Sky
+        screen[192:] = (40, 100, 160, 255)  # Ground
+        left = self.mario_x % 240
+        top = 160 - (START_Y - self.mario_y)
+        screen[top:top + 32, left:left + 16] = (30, 30, 220, 255)
+        return screen
+
+    def state_fields(self):
+        # Same order as neato_bridge.lua: x, y, w, h, bx, by, mx, my, mode, level, timer, anim
+        return list(self.geometry) + [self.mario_x, self.mario_y, self.game_mode,
+                                      self.level_index, self.end_level_timer, self.anim_state]
+
+    def handle(self, command):
+        """Returns the reply neato_bridge.lua would send for command."""
+        if command == "GET_STATE":
+            return ",".join(str(v) for v in self.state_fields())
+        if command.startswith("ACT:"):
+            buttons = set(b for b in command[4:].split(",") if b)
+            self.step(buttons)
+            return "ACT_OK"
+        if command == "RESET":
+            self.resets += 1
+            self.reset_state()
+            return "RESET_OK"
+        ops = {"SAVE": neato_client.OP_SAVE, "LOAD": neato_client.OP_LOAD, "DROP": neato_client.OP_DROP}
+        name, _, handle = command.partition(":")
+        if name in ops:
+            ok = handle.isdigit() and self.savestate(ops[name], int(handle))
+            return name + "_OK" if ok else "STATE_ERR"
+        if name == "TURBO" and handle.isdigit():
+            return "TURBO_OK" if self.set_turbo(int(handle)) else "TURBO_ERR"
+        return "UNKNOWN_CMD"
+
+    def step(self, buttons):
+        """Advances one frame with the given buttons held."""
+        self.frame += 1
+        self.ticks += 1
+        if self.frame_time:
+            time.sleep(self.frame_time)
+        if self.anim_state == DEATH_ANIMATION:
+            return
+
+        speed = RUN_SPEED if 'Y' in buttons else WALK_SPEED
+        if 'Right' in buttons and 'Left' not in buttons:
+            self.mario_x += speed
+        elif 'Left' in buttons and 'Right' not in buttons:
+            self.mario_x = max(0, self.mario_x - speed)
+
+        # Jump from the ground, then fall back under gravity (through the pit, if over it)
+        over_pit = self.pit is not None and self.pit[0] <= self.mario_x < self.pit[1]
+        on_ground = self.mario_y == START_Y and not over_pit
+        if on_ground and ('A' in buttons or 'B' in buttons):
+            self.y_speed = -JUMP_SPEED
+        if self.y_speed or not on_ground:
+            above_ground = self.mario_y <= START_Y
+            self.mario_y += self.y_speed
+            self.y_speed += GRAVITY
+            if self.mario_y >= START_Y and above_ground and not over_pit:
+                self.mario_y = START_Y
+                self.y_speed = 0
+        if self.mario_y > PIT_DEPTH:
+            self.anim_state = DEATH_ANIMATION
+        if self.goal_x is not None and self.mario_x >= self.goal_x and not self.end_level_timer:
+            self.end_level_timer = 255
@@ -0,0 +1,103 @@
+"""
+When to end an episode early.
+
+run_simulation always stopped after 600 frames, or after 60 frames without
+progress. A dead Mario therefore kept burning frames through the death
+animation until the stagnation rule noticed. TerminationPolicy checks the game
+variables after every step and ends the episode as soon as one of its
+conditions holds:
+
+    death         anim_state == 9 (the dying animation)
+    level_clear   end_level_timer > 0 (the goal was reached)
+    pit           mario_y > pit_y (SMW's Y grows downwards; pit_y = 0 = off)
+    mode_change   game_mode differs from what it was after the reset
+    <name>        any predicate(bridge) added with add()
+
+Every episode ends with one reason: one of the above, 'stagnation',
+'max_frames', or 'bridge_lost'. The policy counts them per generation,
+together with the frames the early stops saved. Saved frames are counted
+against the stagnation rule, assuming no further progress: the frames the
+old loop would still have played before giving up. That's a lower bound (a
+level clear keeps walking right), never an estimate of the whole budget.
+"""
+import threading
+from collections import Counter
+
+DEATH_ANIMATION = 9
+
+# Reasons that aren't conditions
+STAGNATION = 'stagnation'
+MAX_FRAMES = 'max_frames'
+BRIDGE_LOST = 'bridge_lost'
+
+
+class TerminationPolicy:
+    def __init__(self, death=True, level_clear=True, pit_y=0, mode_change=True, stagnation_frames=60):
+        self.stagnation_frames = stagnation_frames
+        # (reason, predicate(bridge, start_mode)) in the order they're checked
+        self.conditions = []
+        if death:
+            self.conditions.append(('death', lambda bridge, mode: bridge.anim_state == DEATH_ANIMATION))
+        if level_clear:
+            self.conditions.append(('level_clear', lambda bridge, mode: bridge.end_level_timer > 0))
+        if pit_y > 0:
+            self.conditions.append(('pit', lambda bridge, mode: bridge.mario_y > pit_y))
+        if mode_change:
+            self.conditions.append(('mode_change', lambda bridge, mode: bridge.game_mode != mode))
+
+        self.lock = threading.Lock()
+        self.reasons = Counter()
+        self.frames_saved = 0
+        self.frames_played = 0
+        # What the last end_generation() returned, for reporters
+        self.last = (Counter(), 0, 0)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(death=settings.terminate_on_death,
+                   level_clear=settings.terminate_on_level_clear,
+                   pit_y=settings.pit_y,
+                   mode_change=settings.terminate_on_mode_change,
+                   stagnation_frames=settings.stagnation_frames)
+
+    def add(self, name, predicate):
+        """Ends episodes with reason name once predicate(bridge) is true."""
+        self.conditions.append((name, lambda bridge, mode: predicate(bridge)))
+
+    def check(self, bridge, start_mode):
+        """The first condition that holds for the bridge's game variables, or None."""
+        for reason, condition in self.conditions:
+            if condition(bridge, start_mode):
+                return reason
+        return None
+
+    def finish(self, reason, frame, max_frames, stagnation, action_repeat=1):
+        """
+        Counts an episode that ended at frame (emulated frames played) with
+        this reason. stagnation is how many frames it had gone without
+        progress. Returns the frames saved.
+        """
+        saved = 0
+        if reason not in (STAGNATION, MAX_FRAMES, BRIDGE_LOST):
+            # Steps the stagnation rule would still have allowed (it stops once
+            # the counter goes past stagnation_frames)
+            steps = max(0, self.stagnation_frames - stagnation) // action_repeat + 1
+            saved = min(steps * action_repeat, max(0, max_frames - frame))
+        self.tally(reason, frame, saved)
+        return saved
+
+    def tally(self, reason, frames, saved):
+        """Counts an episode whose frames were already worked out (a remote worker's)."""
+        with self.lock:
+            self.reasons[reason] += 1
+            self.frames_saved += saved
+            self.frames_played += frames
+
+    def end_generation(self):
+        """Returns (reason counts, frames saved, frames played) for the generation and resets them."""
+        with self.lock:
+            totals = self.reasons, self.frames_saved, self.frames_played
+            self.reasons = Counter()
+            self.frames_saved = self.frames_played = 0
+        self.last = totals
+        return totals
@@ -0,0 +1,142 @@
+"""
+Per-stage timing of the evaluation hot path.
+
+Every episode fills a StageTimes with how long each stage took, one sample
+per occurrence:
+
+    build        CPPN -> phenotype, once per genome (0 samples on a cache hit)
+    reset        RESET round trip
+    grab         screen grab (mss, or the stand-in's frame source)
+    preprocess   resize / grayscale / normalize into the input buffer
+    infer        Policy.act(): the network product and the button logic
+    step         STEP round trip (ACT + GET_STATE on the text protocol);
+                 with pipelining this includes the prefetched grab
+    record       trajectory recording, when enabled
+
+Recording a sample is one perf_counter() pair and a list append, so the
+timers are always on. GenerationTimes collects the episodes of a generation
+from the pool threads, and TimingReporter prints and keeps its p50/p95/max
+histograms next to neat's StatisticsReporter:
+
+    timing = neato_timing.TimingReporter(brain.timings)
+    p.add_reporter(timing)
+
+Settings profile_genome / profile_output dump a cProfile of one genome's
+episode (see NeatoBrain.evaluate), for when the histograms say where the
+time goes but not why.
+"""
+import csv
+import threading
+
+import neat
+import numpy as np
+
+STAGES = ('build', 'reset', 'grab', 'preprocess', 'infer', 'step', 'record')
+
+
+def histogram(samples):
+    """count / total / p50 / p95 / max of durations in seconds."""
+    values = np.asarray(samples, dtype=np.float64)
+    return {
+        'count': int(len(values)),
+        'total': float(values.sum()),
+        'p50': float(np.percentile(values, 50)),
+        'p95': float(np.percentile(values, 95)),
+        'max': float(values.max()),
+    }
+
+
+class StageTimes:
+    """Stage durations of one episode. Only ever touched by one thread."""
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, stage, seconds):
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples[stage] = []
+        samples.append(seconds)
+
+    def extend(self, samples):
+        """Adds {stage: [seconds]} recorded elsewhere (a remote worker's episode)."""
+        for stage, seconds in samples.items():
+            self.samples.setdefault(stage, []).extend(seconds)
+
+    def summary(self):
+        return {stage: histogram(samples) for stage, samples in self.samples.items() if samples}
+
+
+class GenerationTimes:
+    """Every episode of the current generation, keyed by genome id. Shared by the pool threads."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.genomes = {}
+        # The generation end_generation() closed, for the reporter
+        self.last = {}
+
+    def for_genome(self, genome_id):
+        """The StageTimes of this genome (a requeued genome keeps adding to it)."""
+        with self.lock:
+            times = self.genomes.get(genome_id)
+            if times is None:
+                times = self.genomes[genome_id] = StageTimes()
+        return times
+
+    def end_generation(self):
+        """Keeps this generation's {genome_id: StageTimes} in last and starts the next one."""
+        with self.lock:
+            self.last, self.genomes = self.genomes, {}
+        return self.last
+
+
+class TimingReporter(neat.reporting.BaseReporter):
+    """
+    Turns the brain's GenerationTimes into per-generation and per-genome
+    histograms after every evaluation.
+
+    generation_statistics: one {stage: histogram} per generation, over all
+    samples of all its episodes.
+    genome_statistics: {genome_id: {stage: histogram}} for the last generation.
+    """
+    def __init__(self, timings, show_genomes=False):
+        self.timings = timings
+        self.show_genomes = show_genomes
+        self.generation_statistics = []
+        self.genome_statistics = {}
+
+    def post_evaluate(self, config, population, species, best_genome):
+        genomes = self.timings.last
+        merged = {}
+        for times in genomes.values():
+            for stage, samples in times.samples.items():
+                merged.setdefault(stage, []).extend(samples)
+        summary = {stage: histogram(samples) for stage, samples in merged.items() if samples}
+
+        self.generation_statistics.append(summary)
+        self.genome_statistics = {genome_id: times.summary() for genome_id, times in genomes.items()}
+        self.print_summary(summary)
+        if self.show_genomes:
+            for genome_id in sorted(self.genome_statistics):
+                print(f"Genome {genome_id}:")
+                self.print_summary(self.genome_statistics[genome_id])
+
+    @staticmethod
+    def print_summary(summary):
+        print(f"  {'stage':<11} {'count':>7} {'total s':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}")
+        order = [s for s in STAGES if s in summary] + sorted(set(summary) - set(STAGES))
+        for stage in order:
+            h = summary[stage]
+            print(f"  {stage:<11} {h['count']:>7} {h['total']:>8.2f} {h['p50'] * 1000:>8.2f} "
+                  f"{h['p95'] * 1000:>8.2f} {h['max'] * 1000:>8.2f}")
+
+    def get_stage_stat(self, stage, stat='p95'):
+        """One value per generation (None where the stage never ran), like StatisticsReporter.get_fitness_mean()."""
+        return [summary[stage][stat] if stage in summary else None for summary in self.generation_statistics]
+
+    def save_timings(self, filename='timings.csv'):
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['generation', 'stage', 'count', 'total', 'p50', 'p95', 'max'])
+            for generation, summary in enumerate(self.generation_statistics):
+                for stage, h in summary.items():
+                    writer.writerow([generation, stage, h['count'], h['total'], h['p50'], h['p95'], h['max']])
@@ -0,0 +1,298 @@
+"""
+Episode recordings and a replay bridge.
+
+TrajectoryRecorder keeps what the network saw and did, one row per decision:
+the preprocessed 128x112 observation, the game variables at that moment and
+the button mask sent (with how many frames it was held). Rows go into
+fixed-size chunks of raw memory-mapped files:
+
+    <dir>/obs-00000.bin    uint8 (chunk_frames, 112 * 128) grayscale observations
+    <dir>/ram-00000.bin    RAM_DTYPE (chunk_frames,) game variables and buttons
+    <dir>/index.json       chunk size, row count, and one entry per episode
+
+Observations are stored as the uint8 gray value the inputs were normalized
+from. That is lossless (inputs are gray / 127.5 - 1) and 4x smaller than
+float32.
+
+Pool threads run episodes concurrently, so each episode fills its own
+in-memory buffer and is appended to the chunks in one go when it finishes.
+Every episode is therefore a contiguous range of rows.
+
+TrajectoryReader maps the chunks read-only, so reading a large run copies
+nothing. Only an episode that straddles two chunks is concatenated.
+ReplayBridge serves an episode over the bridge protocol like the stand-in
+does, with the recorded RAM values and screens.
+
+    python neato_trajectory.py recordings/ --episode 3 --port 8086
+
+serves one episode to RAM-only scripts such as test_fitness.py. The screen
+can only be replayed in-process, via frame_source=server.render.
+"""
+import argparse
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+
+import neato_client
+import neato_standin
+
+RAM_DTYPE = np.dtype([
+    ('frame', '<u4'),
+    ('mario_x', '<u2'),
+    ('mario_y', '<u2'),
+    ('game_mode', 'u1'),
+    ('level_index', 'u1'),
+    ('end_level_timer', 'u1'),
+    ('anim_state', 'u1'),
+    ('buttons', '<u2'),  # Button mask sent after this observation
+    ('repeat', 'u1'),    # Frames it was held for
+])
+RAM_FIELDS = ('frame', 'mario_x', 'mario_y', 'game_mode', 'level_index', 'end_level_timer', 'anim_state')
+
+OBSERVATION_SHAPE = (112, 128)
+INDEX_NAME = "index.json"
+
+
+def _chunk_path(directory, kind, chunk):
+    return os.path.join(directory, f"{kind}-{chunk:05d}.bin")
+
+
+class EpisodeRecording:
+    """Rows of one episode, kept in memory until TrajectoryRecorder.finish()."""
+    def __init__(self, generation, capacity=600):
+        self.generation = generation
+        self.length = 0
+        self.observations = np.empty((capacity, OBSERVATION_SHAPE[0] * OBSERVATION_SHAPE[1]), dtype=np.uint8)
+        self.ram = np.zeros(capacity, dtype=RAM_DTYPE)
+        self._scratch = np.empty(self.observations.shape[1], dtype=np.float32)
+
+    def append(self, inputs, bridge, buttons, repeat=1):
+        """
+        inputs: the normalized screen inputs the decision was made from.
+        bridge: read for the game variables (as they were for this decision).
+        buttons: the button mask sent.
+        """
+        if self.length == len(self.ram):
+            self._grow()
+        # -1..1 back to the gray value it came from
+        np.multiply(inputs, 127.5, out=self._scratch)
+        self._scratch += 127.5
+        np.rint(self._scratch, out=self._scratch)
+        self.observations[self.length] = self._scratch
+
+        row = self.ram[self.length]
+        for name in RAM_FIELDS:
+            row[name] = getattr(bridge, name)
+        row['buttons'] = buttons
+        row['repeat'] = repeat
+        self.length += 1
+
+    def _grow(self):
+        self.observations = np.concatenate((self.observations, np.empty_like(self.observations)))
+        self.ram = np.concatenate((self.ram, np.zeros_like(self.ram)))
+
+
+class TrajectoryRecorder:
+    def __init__(self, directory, chunk_frames=4096):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.generation = 0
+
+        index_path = os.path.join(directory, INDEX_NAME)
+        if os.path.exists(index_path):
+            # Keep appending to an existing recording (e.g. a resumed run)
+            with open(index_path) as f:
+                self.index = json.load(f)
+        else:
+            self.index = {'chunk_frames': chunk_frames, 'rows': 0, 'episodes': []}
+        self.chunk_frames = self.index['chunk_frames']
+
+        self.chunk = None
+        self.obs_map = None
+        self.ram_map = None
+
+    def start_episode(self):
+        return EpisodeRecording(self.generation)
+
+    def finish(self, episode, fitness, termination=None):
+        """
+        Appends a finished episode to the chunks and records it in the index,
+        with why it ended (see neato_termination) if given.
+        """
+        if episode.length == 0:
+            return
+        with self.lock:
+            start = self.index['rows']
+            written = 0
+            while written < episode.length:
+                row = start + written
+                self._open_chunk(row // self.chunk_frames)
+                offset = row % self.chunk_frames
+                count = min(episode.length - written, self.chunk_frames - offset)
+                self.obs_map[offset:offset + count] = episode.observations[written:written + count]
+                self.ram_map[offset:offset + count] = episode.ram[written:written + count]
+                written += count
+
+            self.index['rows'] = start + episode.length
+            self.index['episodes'].append({
+                'start': start,
+                'length': episode.length,
+                'generation': episode.generation,
+                'fitness': float(fitness),
+                'termination': termination,
+            })
+            self._write_index()
+
+    def _open_chunk(self, chunk):
+        if chunk == self.chunk:
+            return
+        self._close_chunk()
+        mode = 'r+' if os.path.exists(_chunk_path(self.directory, 'ram', chunk)) else 'w+'
+        self.obs_map = np.memmap(_chunk_path(self.directory, 'obs', chunk), dtype=np.uint8, mode=mode,
+                                 shape=(self.chunk_frames, OBSERVATION_SHAPE[0] * OBSERVATION_SHAPE[1]))
+        self.ram_map = np.memmap(_chunk_path(self.directory, 'ram', chunk), dtype=RAM_DTYPE, mode=mode,
+                                 shape=(self.chunk_frames,))
+        self.chunk = chunk
+
+    def _close_chunk(self):
+        if self.chunk is not None:
+            self.obs_map.flush()
+            self.ram_map.flush()
+            self.obs_map = self.ram_map = None
+            self.chunk = None
+
+    def _write_index(self):
+        # Data first, then the index that points at it
+        self.obs_map.flush()
+        self.ram_map.flush()
+        path = os.path.join(self.directory, INDEX_NAME)
+        with open(path + ".tmp", 'w') as f:
+            json.dump(self.index, f)
+        os.replace(path + ".tmp", path)
+
+    def end_generation(self):
+        self.generation += 1
+
+    def close(self):
+        with self.lock:
+            self._close_chunk()
+
+
+class TrajectoryReader:
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, INDEX_NAME)) as f:
+            self.index = json.load(f)
+        self.chunk_frames = self.index['chunk_frames']
+        self.episodes = self.index['episodes']
+        self._maps = {}
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def _chunk(self, chunk):
+        if chunk not in self._maps:
+            self._maps[chunk] = (
+                np.memmap(_chunk_path(self.directory, 'obs', chunk), dtype=np.uint8, mode='r',
+                          shape=(self.chunk_frames, OBSERVATION_SHAPE[0] * OBSERVATION_SHAPE[1])),
+                np.memmap(_chunk_path(self.directory, 'ram', chunk), dtype=RAM_DTYPE, mode='r',
+                          shape=(self.chunk_frames,)))
+        return self._maps[chunk]
+
+    def rows(self, start, stop):
+        """(observations, ram) for rows start..stop-1. Views into the mapped files unless they span chunks."""
+        parts = []
+        row = start
+        while row < stop:
+            chunk, offset = divmod(row, self.chunk_frames)
+            count = min(stop - row, self.chunk_frames - offset)
+            obs, ram = self._chunk(chunk)
+            parts.append((obs[offset:offset + count], ram[offset:offset + count]))
+            row += count
+        if len(parts) == 1:
+            return parts[0]
+        return (np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]))
+
+    def episode(self, number):
+        """(observations, ram) of one episode."""
+        entry = self.episodes[number]
+        return self.rows(entry['start'], entry['start'] + entry['length'])
+
+
+class ReplayBridge(neato_standin.StandInBridge):
+    """
+    Serves a recorded episode over the bridge protocol. RESET goes back to
+    its first row; every emulated frame moves through the rows as they were
+    held (a row recorded with repeat=4 lasts 4 frames). The buttons sent are
+    ignored: this replays what happened, it doesn't simulate. After the last
+    row the episode stays on its final state.
+    """
+    def __init__(self, reader, episode=0, **kwargs):
+        self.reader = reader
+        self.observations, self.ram = reader.episode(episode)
+        self.bgra = np.empty(OBSERVATION_SHAPE + (4,), dtype=np.uint8)
+        super().__init__(**kwargs)
+
+    def reset_state(self):
+        self.row = 0
+        self.held = 0
+        self.ticks = 0
+        self.y_speed = 0
+        self._load_row()
+
+    def _load_row(self):
+        record = self.ram[self.row]
+        self.mario_x = int(record['mario_x'])
+        self.mario_y = int(record['mario_y'])
+        self.game_mode = int(record['game_mode'])
+        self.level_index = int(record['level_index'])
+        self.end_level_timer = int(record['end_level_timer'])
+        self.anim_state = int(record['anim_state'])
+
+    def step(self, buttons):
+        self.frame += 1
+        self.ticks += 1
+        self.held += 1
+        if self.held >= max(1, int(self.ram[self.row]['repeat'])) and self.row + 1 < len(self.ram):
+            self.row += 1
+            self.held = 0
+            self._load_row()
+
+    def savestate(self, opcode, handle):
+        """Savestates hold the replay position, so loading one rewinds the recording to it."""
+        if opcode == neato_client.OP_SAVE:
+            self.saved_states[handle] = (self.row, self.held, self.ticks)
+            return True
+        if handle not in self.saved_states:
+            return False
+        if opcode == neato_client.OP_LOAD:
+            self.row, self.held, self.ticks = self.saved_states[handle]
+            self._load_row()
+        else:
+            del self.saved_states[handle]
+        return True
+
+    def render(self):
+        """The recorded observation as a 128x112 BGRA screen; capture turns it back into the same inputs."""
+        gray = self.observations[self.row].reshape(OBSERVATION_SHAPE)
+        return cv2.cvtColor(gray, cv2.COLOR_GRAY2BGRA, dst=self.bgra)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a recorded episode over the bridge protocol.")
+    parser.add_argument('directory')
+    parser.add_argument('--episode', type=int, default=0)
+    parser.add_argument('--port', type=int, default=8086)
+    args = parser.parse_args()
+
+    reader = TrajectoryReader(args.directory)
+    server = ReplayBridge(reader, args.episode, port=args.port).start()
+    print(f"Replaying episode {args.episode} of {len(reader)} on port {server.port}. Ctrl+C to stop.")
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
@@ -5,6 +5,7 @@ import os
 # Add parent directory to path to import neato_client
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import neato_client
+import neato_cppn
 import time
 import pickle
 import cv2
@@ -46,39 +47,14 @@ class Substrate:
     def build_phenotype(self, cppn, config):
         """
         Constructs the weight matrix from Input -> Output using the CPPN.
-        Returns a function that takes an image and returns button probabilities.
+        Returns the (N_inputs, N_outputs) weight matrix.
         """
         # We need to query CPPN for every pair of (Input, Output)
         # Input: (N_pixels, 2)
         # Output: (N_buttons, 2)
-        # Total weights: N_pixels * N_buttons
-        
-        # Broadcast inputs and outputs to create all pairs
-        # This can be memory intensive. Let's do it per output neuron to save memory.
-        
-        weights = np.zeros((self.input_coords.shape[0], self.output_coords.shape[0]))
-        
-        for i in range(self.output_coords.shape[0]):
-            out_x, out_y = self.output_coords[i]
-            print(f"Building weights for Output {i+1}/{self.output_coords.shape[0]}...")
-            
-            # Create inputs for CPPN: x1, y1, x2, y2
-            # x1, y1 are all input pixels
-            # x2, y2 are constant for this output neuron
-            
-            # We can batch query the CPPN if it supports it, but neat-python CPPN is usually node-by-node.
-            # However, neat-python's FeedForwardNetwork.activate is for a single input vector.
-            # We need to iterate. This is the slow part of HyperNEAT construction.
-            # Optimization: The CPPN is usually small.
-            
-            for j in range(self.input_coords.shape[0]):
-                in_x, in_y = self.input_coords[j]
-                # Query CPPN
-                # Inputs: x1, y1, x2, y2
-                w = cppn.activate([in_x, in_y, out_x, out_y])[0]
-                weights[j, i] = w
-                
-        return weights
+        # CompiledCPPN evaluates all pairs as numpy arrays in one pass instead of
+        # calling cppn.activate() once per pixel per button.
+        return neato_cppn.CompiledCPPN(cppn).query_grid(self.input_coords, self.output_coords)
 
 class NeatoBrain:
     def __init__(self):
@@ -0,0 +1,81 @@
+import neat
+import numpy as np
+
+import neato_brain
+import neato_build
+import neato_cache
+import neato_settings
+
+CONFIG_PATH = "config-feedforward"
+
+
+def make_population():
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_PATH)
+    population = neat.Population(config)
+    return config, list(population.population.items())
+
+
+def test_pool_matches_in_process_build():
+    config, genomes = make_population()
+    substrate = neato_brain.Substrate(width=32, height=28)
+
+    serial = neato_build.PhenotypeBuilder(substrate.input_coords, substrate.output_coords, workers=1)
+    expected = {genome_id: weights for genome_id, _, weights in serial.build_all(genomes, config)}
+    assert list(expected) == [genome_id for genome_id, _ in genomes]
+
+    pooled = neato_build.PhenotypeBuilder(substrate.input_coords, substrate.output_coords, workers=2)
+    try:
+        # Two generations reuse the same pool and shared coordinates
+        for _ in range(2):
+            seen = {}
+            for genome_id, genome, weights in pooled.build_all(genomes, config):
+                assert dict(genomes)[genome_id] is genome
+                seen[genome_id] = weights
+            assert set(seen) == set(expected)
+            for genome_id, weights in seen.items():
+                assert np.array_equal(weights, expected[genome_id])
+    finally:
+        pooled.close()
+    assert pooled.shm is None and pooled.executor is None
+
+
+def test_settings_read_neato_section(tmp_path):
+    path = tmp_path / "config"
+    path.write_text(open(CONFIG_PATH).read() + "\n[Neato]\nbuild_workers = 3\n")
+    assert neato_settings.NeatoSettings.from_file(str(path)).build_workers == 3
+    assert neato_settings.NeatoSettings.from_file(CONFIG_PATH).build_workers == 1
+
+
+def test_cache_skips_rebuilds_and_survives_restart(tmp_path):
+    config, genomes = make_population()
+    substrate = neato_brain.Substrate(width=16, height=14)
+    cache_dir = str(tmp_path / "cache")
+
+    cache = neato_cache.PhenotypeCache(max_entries=4, cache_dir=cache_dir)
+    builder = neato_build.PhenotypeBuilder(substrate.input_coords, substrate.output_coords, cache=cache)
+    first = {genome_id: weights for genome_id, _, weights in builder.build_all(genomes, config)}
+    assert cache.end_generation() == (0, len(genomes))
+
+    # A fresh cache over the same directory (as after a checkpoint resume)
+    # serves everything from disk, even though memory only holds 4 entries
+    cache = neato_cache.PhenotypeCache(max_entries=4, cache_dir=cache_dir)
+    builder = neato_build.PhenotypeBuilder(substrate.input_coords, substrate.output_coords, cache=cache)
+    second = {genome_id: weights for genome_id, _, weights in builder.build_all(genomes, config)}
+    assert cache.end_generation() == (len(genomes), 0)
+    assert len(cache.entries) == 4
+    for genome_id, weights in first.items():
+        assert np.array_equal(second[genome_id], weights)
+
+    # Mutating a weight changes the key, toggling a disabled connection does not
+    genome = genomes[0][1]
+    geometry = builder.geometry
+    before = neato_cache.cppn_digest(genome, geometry)
+    conn = next(iter(genome.connections.values()))
+    conn.weight += 0.5
+    assert neato_cache.cppn_digest(genome, geometry) != before
+    conn.enabled = False
+    disabled = neato_cache.cppn_digest(genome, geometry)
+    conn.weight += 0.5
+    assert neato_cache.cppn_digest(genome, geometry) == disabled
@@ -0,0 +1,41 @@
+import cv2
+import numpy as np
+
+import neato_capture
+
+
+def old_pipeline(bgra):
+    # What get_state() + run_simulation used to do per frame
+    img_small = cv2.resize(bgra[:, :, :3], (128, 112))
+    img_gray = cv2.cvtColor(img_small, cv2.COLOR_BGR2GRAY)
+    return (img_gray.flatten() / 127.5) - 1.0
+
+
+def test_fused_pipeline_matches_old_preprocessing():
+    rng = np.random.default_rng(1)
+    bgra = rng.integers(0, 256, size=(224, 256, 4), dtype=np.uint8)
+    session = neato_capture.CaptureSession()
+    out = np.empty(128 * 112, dtype=np.float32)
+
+    session.process(bgra, out)
+    assert np.allclose(out, old_pipeline(bgra), atol=1e-6)
+
+
+def test_grab_into_reuses_buffers_and_caches_monitor():
+    rng = np.random.default_rng(2)
+    frames = [rng.integers(0, 256, size=(224, 256, 4), dtype=np.uint8) for _ in range(3)]
+    session = neato_capture.CaptureSession(source=frames.pop)
+    out = np.empty(128 * 112, dtype=np.float32)
+    small = session.small_bgra
+
+    geometry = (100, 50, 256, 224, 8, 53)
+    for _ in range(2):
+        assert session.grab_into(geometry, out) is out
+    monitor = session.monitor
+    assert monitor == {"top": 103, "left": 108, "width": 256, "height": 224}
+
+    session.grab_into(geometry, out)
+    assert session.monitor is monitor
+    assert session.small_bgra is small
+    stats = session.latency_stats()
+    assert len(session.latencies) == 3 and stats['max'] >= stats['mean'] > 0
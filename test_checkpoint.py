@@ -0,0 +1,139 @@
+import json
+
+import neat
+
+import neato_brain
+import neato_checkpoint
+import neato_settings
+import neato_standin
+
+CONFIG_PATH = "config-feedforward"
+
+
+def make_config():
+    return neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                       neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                       CONFIG_PATH)
+
+
+def score(genomes, config):
+    for genome_id, genome in genomes:
+        genome.fitness = len(genome.connections) + genome_id * 0.001
+
+
+def test_chains_of_full_and_delta_checkpoints_restore_the_population(tmp_path):
+    population = neat.Population(make_config())
+    store = neato_checkpoint.CheckpointStore(str(tmp_path), full_every=2, keep_chains=2)
+    population.add_reporter(store)
+    population.run(score, 5)
+    store.close()
+
+    with open(tmp_path / "manifest.json") as f:
+        entries = json.load(f)['entries']
+    # Generations 1-5: the oldest chain (1, 2) was deleted once two newer ones existed
+    assert [(e['generation'], e['full']) for e in entries] == [(3, True), (4, False), (5, True)]
+    assert sorted(p.name for p in tmp_path.glob("gen-*")) == [e['file'] for e in entries]
+    # Elites carried over from generation 3 weren't stored again
+    assert entries[1]['genomes'] < len(population.population)
+
+    restored = neato_checkpoint.CheckpointStore(str(tmp_path)).restore()
+    assert restored.generation == population.generation == 5
+    assert sorted(restored.population) == sorted(population.population)
+    for key, genome in restored.population.items():
+        assert genome.fitness == population.population[key].fitness
+        assert set(genome.connections) == set(population.population[key].connections)
+    assert sorted(restored.species.species) == sorted(population.species.species)
+
+    # And evolution carries on from there
+    restored.run(score, 1)
+    assert restored.generation == 6
+
+
+def test_delta_chain_restores_genomes_from_earlier_files(tmp_path):
+    population = neat.Population(make_config())
+    store = neato_checkpoint.CheckpointStore(str(tmp_path), full_every=10)
+    population.add_reporter(store)
+    population.run(score, 3)
+    store.close()
+
+    restored = neato_checkpoint.CheckpointStore(str(tmp_path)).restore()
+    assert sorted(restored.population) == sorted(population.population)
+
+
+def test_resumed_generation_skips_genomes_already_played(tmp_path):
+    config = make_config()
+    population = neat.Population(config)
+    store = neato_checkpoint.CheckpointStore(str(tmp_path))
+    store.save(config, population.population, population.species, 0)
+    store.start_generation(0)
+    played = sorted(population.population)[:3]
+    for genome_id in played:
+        store.record_fitness(genome_id, 1000.0 + genome_id)
+    store.close()  # The run crashes here
+
+    store = neato_checkpoint.CheckpointStore(str(tmp_path))
+    restored = store.restore()
+    store.start_generation(restored.generation)
+    genomes = list(restored.population.items())[:6]
+
+    with neato_standin.StandInBridge() as server:
+        brain = neato_brain.NeatoBrain(neato_settings.NeatoSettings(bridge_port=server.port))
+        brain.pool.bridges[0].capture_session.source = server.render
+        brain.checkpoints = store
+        try:
+            brain.evaluate(genomes, config)
+        finally:
+            brain.close()
+        resets = server.resets
+    store.flush()
+
+    assert resets == len(genomes) - len(played)
+    for genome_id, genome in genomes:
+        if genome_id in played:
+            assert genome.fitness == 1000.0 + genome_id
+    # Everything played is in partial.json again, should it crash now
+    with open(tmp_path / "partial.json") as f:
+        assert len(json.load(f)['fitness']) == len(genomes)
+    store.close()
+
+
+def test_resumed_genomes_are_blended_with_novelty(tmp_path):
+    config = make_config()
+    population = neat.Population(config)
+    store = neato_checkpoint.CheckpointStore(str(tmp_path))
+    store.save(config, population.population, population.species, 0)
+    store.start_generation(0)
+    played = sorted(population.population)[:2]
+    for genome_id in played:
+        store.record_fitness(genome_id, 1000.0 + genome_id, [float(genome_id)] * 20)
+    store.close()
+
+    store = neato_checkpoint.CheckpointStore(str(tmp_path))
+    restored = store.restore()
+    store.start_generation(restored.generation)
+    genomes = list(restored.population.items())[:4]
+
+    with neato_standin.StandInBridge() as server:
+        brain = neato_brain.NeatoBrain(neato_settings.NeatoSettings(bridge_port=server.port, novelty_weight=0.5,
+                                                                    novelty_samples=10))
+        brain.pool.bridges[0].capture_session.source = server.render
+        brain.checkpoints = store
+        combine = brain.novelty.combine
+        blended = {}
+
+        def spy(behaviors, fitnesses):
+            blended.update(combine(behaviors, fitnesses))
+            return blended
+        brain.novelty.combine = spy
+        try:
+            brain.evaluate(genomes, config)
+        finally:
+            brain.close()
+    store.close()
+
+    # Every genome, resumed or played, went through the same blend
+    assert sorted(blended) == sorted(genome_id for genome_id, _ in genomes)
+    for genome_id, genome in genomes:
+        assert genome.fitness == blended[genome_id]
+    with open(tmp_path / "partial.json") as f:
+        assert sorted(json.load(f)['behavior']) == sorted(str(genome_id) for genome_id, _ in genomes)
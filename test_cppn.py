@@ -0,0 +1,52 @@
+import neat
+import numpy as np
+
+import neato_brain
+import neato_cppn
+
+CONFIG_PATH = "config-feedforward"
+
+
+def make_genomes(count=6):
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_PATH)
+    population = neat.Population(config)
+    genomes = list(population.population.values())[:count]
+
+    # Grow some hidden structure so the CPPNs are more than a single node
+    for genome in genomes:
+        for _ in range(4):
+            genome.mutate_add_node(config.genome_config)
+            genome.mutate_add_connection(config.genome_config)
+    return config, genomes
+
+
+def test_compiled_matches_scalar_for_every_activation():
+    config, genomes = make_genomes()
+    options = config.genome_config.activation_options
+    substrate = neato_brain.Substrate(width=16, height=14)
+
+    for genome in genomes:
+        for activation in options:
+            for node in genome.nodes.values():
+                node.activation = activation
+
+            cppn = neat.nn.FeedForwardNetwork.create(genome, config)
+            scalar = neato_cppn.query_grid_scalar(cppn, substrate.input_coords, substrate.output_coords)
+            compiled = neato_cppn.CompiledCPPN(cppn).query_grid(substrate.input_coords, substrate.output_coords)
+
+            assert compiled.shape == scalar.shape
+            assert np.allclose(compiled, scalar, rtol=0, atol=1e-12), activation
+
+
+def test_activate_batch_matches_activate():
+    config, genomes = make_genomes(count=2)
+    rng = np.random.default_rng(0)
+    inputs = rng.uniform(-1.5, 1.5, size=(50, 4))
+
+    for genome in genomes:
+        cppn = neat.nn.FeedForwardNetwork.create(genome, config)
+        expected = np.array([cppn.activate(list(row)) for row in inputs])
+        batch = neato_cppn.CompiledCPPN(cppn).activate_batch(inputs)
+        assert np.allclose(batch, expected, rtol=0, atol=1e-12)
@@ -0,0 +1,211 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import neat
+
+import neato_brain
+import neato_distributed
+import neato_settings
+from test_pool import start_standins
+
+CONFIG_PATH = "config-feedforward"
+HERE = os.path.dirname(os.path.abspath(__file__))
+NOVELTY = {'novelty_weight': 0.5, 'novelty_k': 3}
+
+
+def fake_worker(port, slots, behavior):
+    """
+    A worker speaking the protocol directly. behavior:
+        'answer'     - fitness = 2 * genome_id, heartbeats as asked
+        'disconnect' - takes `slots` jobs, then closes the connection
+        'silent'     - takes jobs and never says anything again
+    """
+    sock = socket.create_connection(('127.0.0.1', port))
+    neato_distributed.send_message(sock, ('hello', behavior, slots))
+    interval = neato_distributed.recv_message(sock)[1]
+
+    def serve():
+        received = 0
+        last_beat = time.monotonic()
+        sock.settimeout(interval)
+        try:
+            while True:
+                try:
+                    message = neato_distributed.recv_message(sock)
+                except socket.timeout:
+                    message = ()
+                if message is None or message[:1] == ('bye',):
+                    return
+                if behavior == 'answer' and time.monotonic() - last_beat >= interval:
+                    neato_distributed.send_message(sock, ('heartbeat',))
+                    last_beat = time.monotonic()
+                if not message:
+                    continue
+                received += 1
+                _, job_id, (genome_id, _, _, _) = message
+                if behavior == 'answer':
+                    neato_distributed.send_message(sock, ('result', job_id, 2 * genome_id, {}))
+                elif behavior == 'disconnect' and received == slots:
+                    return
+        except OSError:
+            pass
+        finally:
+            sock.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    return thread
+
+
+def test_silent_and_disconnected_workers_lose_their_jobs():
+    coordinator = neato_distributed.Coordinator('127.0.0.1', 0, heartbeat_timeout=0.4, join_timeout=2.0)
+    try:
+        fake_worker(coordinator.port, 2, 'silent')
+        fake_worker(coordinator.port, 1, 'disconnect')
+        assert coordinator.wait_for_workers(2, timeout=2.0)
+        fake_worker(coordinator.port, 2, 'answer')
+        assert coordinator.wait_for_workers(3, timeout=2.0)
+
+        jobs = [(genome_id, None, 600, 0) for genome_id in range(1, 11)]
+        telemetry = []
+        results = coordinator.evaluate(iter(jobs), lambda job, fitness, t: telemetry.append(job[0]))
+        assert results == [2 * genome_id for genome_id in range(1, 11)]
+        assert sorted(telemetry) == list(range(1, 11))
+        assert coordinator.requeued == 3
+        assert coordinator.end_generation() == {'answer': 10}
+    finally:
+        coordinator.close()
+
+
+def test_jobs_score_zero_without_workers():
+    coordinator = neato_distributed.Coordinator('127.0.0.1', 0, join_timeout=0.2)
+    try:
+        assert coordinator.evaluate([(1, None, 600, 0), (2, None, 600, 0)]) == [0, 0]
+    finally:
+        coordinator.close()
+
+
+def local_fitness(genomes, config):
+    base, servers = start_standins(2)
+    brain = neato_brain.NeatoBrain(neato_settings.NeatoSettings(bridge_port=base, bridge_count=2,
+                                                                bridge_timeout=2.0, **NOVELTY))
+    for bridge, server in zip(brain.pool.bridges, servers):
+        bridge.capture_session.source = server.render
+    try:
+        brain.evaluate(genomes, config)
+    finally:
+        brain.close()
+        for server in servers:
+            server.stop()
+    return {genome_id: genome.fitness for genome_id, genome in genomes}
+
+
+def test_worker_processes_match_local_evaluation(capsys):
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_PATH)
+    genomes = list(neat.Population(config).population.items())[:8]
+    expected = local_fitness(genomes, config)
+
+    brain = neato_brain.NeatoBrain(neato_settings.NeatoSettings(**NOVELTY))
+    brain.coordinator = neato_distributed.Coordinator('127.0.0.1', 0, heartbeat_timeout=5.0, join_timeout=10.0)
+    workers = [subprocess.Popen([sys.executable, os.path.join(HERE, 'neato_distributed.py'),
+                                 f"127.0.0.1:{brain.coordinator.port}", '--config', CONFIG_PATH,
+                                 '--standins', '2', '--name', f"box{i}"],
+                                cwd=HERE, stdout=subprocess.DEVNULL)
+               for i in range(2)]
+    try:
+        # A worker that vanishes holding two genomes
+        fake_worker(brain.coordinator.port, 2, 'disconnect')
+        assert brain.coordinator.wait_for_workers(3, timeout=30.0)
+        brain.evaluate(genomes, config)
+    finally:
+        brain.close()
+        for worker in workers:
+            worker.wait(timeout=10)
+
+    assert brain.coordinator.requeued == 2
+    # Telemetry made it back: timings, termination reasons and behaviors
+    assert set(brain.timings.last) == set(expected)
+    assert all('step' in times.samples for times in brain.timings.last.values())
+    assert len(brain.novelty.archive) == 5
+    out = capsys.readouterr().out
+    assert "Episodes ended by" in out
+    assert "Workers: box0: " in out and "box1: " in out
+    # Same episodes, same behaviors, same blended fitness as on local emulators
+    assert {genome_id: genome.fitness for genome_id, genome in genomes} == expected
+
+
+def test_worker_ignores_the_run_configs_coordinator(tmp_path):
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_PATH)
+    genomes = list(neat.Population(config).population.items())[:2]
+
+    brain = neato_brain.NeatoBrain(neato_settings.NeatoSettings())
+    brain.coordinator = neato_distributed.Coordinator('127.0.0.1', 0, heartbeat_timeout=5.0, join_timeout=10.0)
+    # The trainer's own config, as the module docstring says to start workers with
+    run_config = tmp_path / "config-run"
+    with open(os.path.join(HERE, CONFIG_PATH)) as f:
+        run_config.write_text(f.read() + f"\n[Neato]\ncoordinator_port = {brain.coordinator.port}\n"
+                                          "coordinator_host = 127.0.0.1\n")
+    worker = subprocess.Popen([sys.executable, os.path.join(HERE, 'neato_distributed.py'),
+                               f"127.0.0.1:{brain.coordinator.port}", '--config', str(run_config),
+                               '--standins', '1'],
+                              cwd=HERE, stdout=subprocess.DEVNULL)
+    try:
+        assert brain.coordinator.wait_for_workers(1, timeout=30.0)
+        brain.evaluate(genomes, config)
+    finally:
+        brain.close()
+        returncode = worker.wait(timeout=10)
+
+    assert returncode == 0
+    assert all(genome.fitness > 0 for _, genome in genomes)
+
+
+def test_worker_scores_a_failed_episode_zero_and_keeps_playing():
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_PATH)
+    genomes = list(neat.Population(config).population.items())[:4]
+
+    base, servers = start_standins(1)
+    worker_brain = neato_brain.NeatoBrain(neato_settings.NeatoSettings(bridge_port=base, bridge_count=1,
+                                                                       bridge_timeout=2.0))
+    bridge = worker_brain.pool.bridges[0]
+    bridge.capture_session.source = servers[0].render
+    # The bridge fails partway through the first episode, once
+    step = bridge.step
+    calls = {'step': 0}
+
+    def failing_step(*args, **kwargs):
+        calls['step'] += 1
+        if calls['step'] == 5:
+            raise ValueError("malformed reply")
+        return step(*args, **kwargs)
+    bridge.step = failing_step
+
+    brain = neato_brain.NeatoBrain(neato_settings.NeatoSettings())
+    brain.coordinator = neato_distributed.Coordinator('127.0.0.1', 0, heartbeat_timeout=5.0, join_timeout=10.0)
+    worker = neato_distributed.Worker(worker_brain, '127.0.0.1', brain.coordinator.port, 'flaky')
+    thread = threading.Thread(target=worker.run, args=(10.0,), daemon=True)
+    thread.start()
+    try:
+        assert brain.coordinator.wait_for_workers(1, timeout=10.0)
+        brain.evaluate(genomes, config)
+    finally:
+        brain.close()
+        thread.join(timeout=10)
+        worker_brain.close()
+        servers[0].stop()
+
+    assert not thread.is_alive()
+    fitnesses = [genome.fitness for _, genome in genomes]
+    # The failed genome scores 0, and the same play loop went on to the others
+    assert fitnesses[0] == 0
+    assert all(fitness > 0 for fitness in fitnesses[1:])
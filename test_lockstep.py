@@ -0,0 +1,76 @@
+import threading
+
+import neat
+import numpy as np
+
+import neato_brain
+import neato_lockstep
+import neato_settings
+from test_pool import start_standins
+
+CONFIG_PATH = "config-feedforward"
+
+
+def test_batch_matches_per_episode_products_and_drops_finished_episodes():
+    rng = np.random.default_rng(0)
+    lengths = [5, 20, 12]
+    weights = [rng.normal(size=(50, 4)) for _ in lengths]
+    batch = neato_lockstep.LockstepBatch(len(lengths), 50, 4)
+    errors = []
+
+    # Seat and join everyone up front so the first frames are batched too
+    seats = [batch.seat(w).__enter__() for w in weights]
+    for seat in seats:
+        seat.join()
+
+    def episode(i):
+        rng = np.random.default_rng(i)
+        try:
+            for _ in range(lengths[i]):
+                inputs = rng.uniform(-1, 1, 50).astype(np.float32)
+                outputs = seats[i].forward(inputs)
+                if not np.allclose(outputs, np.dot(inputs, weights[i]), atol=1e-4):
+                    errors.append(i)
+        finally:
+            seats[i].__exit__(None, None, None)
+
+    threads = [threading.Thread(target=episode, args=(i,)) for i in range(len(lengths))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=5)
+    assert not any(thread.is_alive() for thread in threads)
+    assert not errors
+
+    # One product per frame of the longest episode; finished episodes dropped out
+    assert batch.batches == max(lengths)
+    assert batch.rows == sum(lengths)
+    assert sorted(batch.free) == [0, 1, 2]
+
+
+def test_lockstep_evaluation_matches_serial(capsys):
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_PATH)
+    genomes = list(neat.Population(config).population.items())[:6]
+
+    base, servers = start_standins(3)
+    fitnesses = {}
+    try:
+        for lockstep in (False, True):
+            settings = neato_settings.NeatoSettings(bridge_port=base, bridge_count=3,
+                                                    bridge_timeout=2.0, lockstep=lockstep)
+            brain = neato_brain.NeatoBrain(settings)
+            for bridge, server in zip(brain.pool.bridges, servers):
+                bridge.capture_session.source = server.render
+            try:
+                brain.evaluate(genomes, config)
+            finally:
+                brain.close()
+            fitnesses[lockstep] = [genome.fitness for _, genome in genomes]
+    finally:
+        for server in servers:
+            server.stop()
+
+    assert fitnesses[True] == fitnesses[False]
+    assert "episodes per batch" in capsys.readouterr().out
@@ -0,0 +1,102 @@
+import neat
+
+import neato_brain
+import neato_memo
+import neato_settings
+from test_pool import start_standins
+
+CONFIG_PATH = "config-feedforward"
+
+
+def make_config():
+    return neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                       neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                       CONFIG_PATH)
+
+
+def outcome(frames):
+    return {'reason': 'max_frames', 'frames': frames, 'saved': 0}
+
+
+def test_memoized_episodes_are_recalled_not_played(tmp_path):
+    genomes = list(neat.Population(make_config()).population.items())[:4]
+    path = str(tmp_path / "memo.json")
+    memo = neato_memo.FitnessMemo('v1', path=path)
+    played = []
+
+    def play(jobs, horizon):
+        jobs = list(jobs)
+        played.append([genome_id for genome_id, _ in jobs])
+        return [genome_id * 10.0 for genome_id, _ in jobs]
+
+    assert not any(memo.plan(genome_id, genome, 'geometry', [600]) for genome_id, genome in genomes)
+    ids = [genome_id for genome_id, _ in genomes]
+    assert memo.play([(genome_id, None) for genome_id in ids], 600, play, None) == [i * 10.0 for i in ids]
+    for genome_id in ids[:3]:
+        memo.store(genome_id, 600, genome_id * 10.0, outcome(600), [1.0, 2.0], 0.5)
+    assert memo.end_generation() == (0, 0, 0.0, 0, 0)
+
+    # Next generation, from the file: three are recalled, one is played
+    memo = neato_memo.FitnessMemo('v1', path=path)
+    assert [memo.plan(genome_id, genome, 'geometry', [600]) for genome_id, genome in genomes] == \
+        [True, True, True, False]
+    recalled = []
+    fitness = memo.play([(genome_id, None) for genome_id in ids], 600, play,
+                        lambda genome_id, fitness, behavior: recalled.append((genome_id, behavior)))
+    assert fitness == [i * 10.0 for i in ids]
+    assert played[-1] == ids[3:]
+    assert recalled == [(genome_id, [1.0, 2.0]) for genome_id in ids[:3]]
+    assert memo.end_generation() == (3, 1800, 1.5, 0, 0)
+
+    # Another fitness version or horizon is another key
+    other = neato_memo.FitnessMemo('v2', path=path)
+    assert not other.plan(ids[0], genomes[0][1], 'geometry', [600])
+    assert not memo.plan(ids[0], genomes[0][1], 'geometry', [300, 600])
+
+
+def test_verification_counts_mismatches(capsys):
+    genome_id, genome = next(iter(neat.Population(make_config()).population.items()))
+    memo = neato_memo.FitnessMemo(verify=1.0)
+    memo.plan(genome_id, genome, '', [600])
+    memo.store(genome_id, 600, 100.0, outcome(600), None, 0.1)
+    memo.end_generation()
+
+    # Picked for verification: built and played again
+    assert not memo.plan(genome_id, genome, '', [600])
+    memo.store(genome_id, 600, 101.0, outcome(600), None, 0.1)
+    assert memo.end_generation() == (0, 0, 0.0, 1, 1)
+    assert "isn't deterministic" in capsys.readouterr().out
+
+
+def test_unchanged_genomes_skip_the_emulator(capsys):
+    config = make_config()
+    genomes = list(neat.Population(config).population.items())[:6]
+
+    base, servers = start_standins(2)
+    settings = neato_settings.NeatoSettings(bridge_port=base, bridge_count=2, bridge_timeout=2.0,
+                                            fitness_memo=True, fitness_memo_verify=0.5)
+    brain = neato_brain.NeatoBrain(settings)
+    brain.memo.random.seed(3)
+    for bridge, server in zip(brain.pool.bridges, servers):
+        bridge.capture_session.source = server.render
+    try:
+        brain.evaluate(genomes, config)
+        first = {genome_id: genome.fitness for genome_id, genome in genomes}
+        resets = sum(server.resets for server in servers)
+        capsys.readouterr()
+
+        brain.evaluate(genomes, config)
+        replayed = sum(server.resets for server in servers) - resets
+    finally:
+        brain.close()
+        for server in servers:
+            server.stop()
+
+    assert {genome_id: genome.fitness for genome_id, genome in genomes} == first
+    out = capsys.readouterr().out
+    # Only the genomes picked for verification touched an emulator, and the stand-in is deterministic
+    assert 0 < replayed < 6
+    assert f"Fitness memo: {6 - replayed} episodes skipped" in out
+    assert f"{replayed} verified, 0 mismatched" in out
+    # The frame budget only counts the genomes that were played
+    assert f"of the fixed {replayed * brain.max_frames}-frame budget" in out
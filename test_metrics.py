@@ -0,0 +1,84 @@
+import urllib.error
+import urllib.request
+
+import neat
+import pytest
+
+import neato_brain
+import neato_checkpoint
+import neato_metrics
+import neato_settings
+from test_pool import start_standins
+
+CONFIG_PATH = "config-feedforward"
+
+
+def scrape(port, path="/metrics"):
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=2) as response:
+        assert response.headers['Content-Type'] == neato_metrics.CONTENT_TYPE
+        text = response.read().decode('utf-8')
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_summary_lines():
+    lines = neato_metrics.summary('rtt_seconds', "Round trips.", [0.001] * 99 + [0.101])
+    assert lines[:2] == ["# HELP rtt_seconds Round trips.", "# TYPE rtt_seconds summary"]
+    assert 'rtt_seconds{quantile="0.5"} 0.001' in lines
+    assert lines[-2:] == ["rtt_seconds_sum 0.2", "rtt_seconds_count 100"]
+    # No samples: just the count
+    assert neato_metrics.summary('rtt_seconds', "Round trips.", [])[2:] == ["rtt_seconds_sum 0", "rtt_seconds_count 0"]
+
+
+def test_generation_metrics_are_served(tmp_path):
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_PATH)
+    population = neat.Population(config)
+
+    base, servers = start_standins(2)
+    brain = neato_brain.NeatoBrain(neato_settings.NeatoSettings(bridge_port=base, bridge_count=2,
+                                                                bridge_timeout=2.0))
+    for bridge, server in zip(brain.pool.bridges, servers):
+        bridge.capture_session.source = server.render
+    brain.checkpoints = neato_checkpoint.CheckpointStore(str(tmp_path))
+    population.add_reporter(brain.checkpoints)
+    metrics = neato_metrics.MetricsReporter(brain)
+    population.add_reporter(metrics)
+    evaluated = {}
+
+    def evaluate(genomes, config):
+        brain.evaluate(genomes, config)
+        evaluated['fitness'] = [genome.fitness for _, genome in genomes]
+        evaluated['species'] = len(population.species.species)
+
+    try:
+        # Nothing evaluated yet: an empty page
+        assert scrape(metrics.port) == {}
+        population.run(evaluate, 1)
+        brain.checkpoints.flush()
+        samples = scrape(metrics.port)
+        with pytest.raises(urllib.error.HTTPError):
+            scrape(metrics.port, "/")
+    finally:
+        brain.close()
+        brain.checkpoints.close()
+        metrics.close()
+        for server in servers:
+            server.stop()
+
+    assert samples['neato_generation'] == 0
+    assert samples['neato_genomes_per_minute'] > 0
+    assert samples['neato_frames_per_second'] > 0
+    assert samples['neato_step_rtt_seconds_count'] > 0
+    assert 0 < samples['neato_step_rtt_seconds{quantile="0.5"}'] <= samples['neato_step_rtt_seconds{quantile="0.99"}']
+    fitnesses = evaluated['fitness']
+    assert samples['neato_reset_seconds_count'] == len(fitnesses)
+    assert samples['neato_fitness_best'] == pytest.approx(max(fitnesses), rel=1e-5)
+    assert samples['neato_fitness_mean'] == pytest.approx(sum(fitnesses) / len(fitnesses), rel=1e-5)
+    assert samples['neato_species'] == evaluated['species']
+    assert 0 <= samples['neato_checkpoint_age_seconds'] < 60
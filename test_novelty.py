@@ -0,0 +1,88 @@
+import neat
+import numpy as np
+
+import neato_brain
+import neato_novelty
+import neato_settings
+from test_pool import start_standins
+
+CONFIG_PATH = "config-feedforward"
+
+
+def brute_force(points, queries, k):
+    dist = np.sqrt(((queries[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+    return np.sort(dist, axis=1)[:, :k]
+
+
+def test_kdtree_matches_brute_force():
+    rng = np.random.default_rng(1)
+    points = rng.normal(size=(1000, 6))
+    queries = rng.normal(size=(40, 6))
+    tree = neato_novelty.KDTree(points, leaf_size=16)
+    assert np.allclose(np.sqrt(tree.query(queries, 5)), brute_force(points, queries, 5))
+    # k larger than the tree
+    small = neato_novelty.KDTree(points[:3], leaf_size=16)
+    assert small.query(queries, 5).shape == (40, 3)
+
+
+def test_archive_grows_incrementally():
+    rng = np.random.default_rng(2)
+    archive = neato_novelty.NoveltyArchive(4, leaf_size=8, buffer_size=16)
+    queries = rng.normal(size=(20, 4))
+    assert archive.knn_distances(queries, 3).shape == (20, 0)
+
+    added = []
+    for size in (5, 16, 40, 3, 100):
+        points = rng.normal(size=(size, 4))
+        archive.add(points)
+        added.append(points)
+        everything = np.concatenate(added)
+        assert len(archive) == len(everything)
+        assert np.allclose(archive.knn_distances(queries, 7), brute_force(everything, queries, 7))
+    # Several levels and a partly filled buffer
+    assert sum(tree is not None for tree in archive.trees) > 1
+    assert 0 < len(archive.buffer) < 16
+
+
+def test_tracker_pads_an_early_end():
+    tracker = neato_novelty.BehaviorTracker(samples=4, max_frames=100)
+    tracker.start(10, 300)
+    tracker.record(25, 20, 290)
+    tracker.record(50, 40, 280)
+    tracker.record(60, 45, 330)  # Fell into a pit and the episode ended
+    assert list(tracker.descriptor()) == [10, 10, 30, 20, 35, -30, 35, -30]
+
+
+def test_novelty_rewards_the_outlier():
+    search = neato_novelty.NoveltySearch(weight=0.5, k=2, samples=1, add_per_generation=1)
+    behaviors = {1: [0, 0], 2: [1, 0], 3: [0, 1], 4: [50, 0]}
+    fitness = search.combine(behaviors, {1: 10, 2: 10, 3: 10, 4: 10})
+    assert max(fitness, key=fitness.get) == 4
+    assert len(search.archive) == 1
+    # The archived outlier is no longer novel
+    again = search.combine({5: [50, 0], 6: [0, 0]}, {5: 10, 6: 10})
+    assert again[5] < fitness[4]
+
+
+def test_novelty_generation_against_standins(capsys):
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_PATH)
+    genomes = list(neat.Population(config).population.items())[:6]
+
+    base, servers = start_standins(2)
+    settings = neato_settings.NeatoSettings(bridge_port=base, bridge_count=2, bridge_timeout=2.0,
+                                            novelty_weight=0.5, novelty_k=3, novelty_archive_add=2)
+    brain = neato_brain.NeatoBrain(settings)
+    for bridge, server in zip(brain.pool.bridges, servers):
+        bridge.capture_session.source = server.render
+    try:
+        brain.evaluate(genomes, config)
+    finally:
+        brain.close()
+        for server in servers:
+            server.stop()
+
+    assert len(brain.novelty.archive) == 2
+    assert all(genome.fitness is not None for _, genome in genomes)
+    assert "archive of 2 behaviors" in capsys.readouterr().out
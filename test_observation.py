@@ -0,0 +1,199 @@
+import cv2
+import neat
+import numpy as np
+import pytest
+
+import neato_brain
+import neato_client
+import neato_observation
+import neato_settings
+import neato_standin
+from test_pool import start_standins
+
+CONFIG_PATH = "config-feedforward"
+
+
+def gray_frame(value, shape=(224, 256)):
+    frame = np.empty(shape + (4,), dtype=np.uint8)
+    frame[..., :3] = value
+    frame[..., 3] = 255
+    return frame
+
+
+def test_default_layout_is_the_old_single_frame():
+    layout = neato_observation.ObservationLayout()
+    x, y = np.meshgrid(np.linspace(-1, 1, 128), np.linspace(-1, 1, 112))
+    assert np.allclose(layout.coords(), np.column_stack((x.flatten(), y.flatten())))
+
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (224, 256, 4), dtype=np.uint8)
+    expected = cv2.cvtColor(cv2.resize(frame, (128, 112)), cv2.COLOR_BGRA2GRAY).flatten() / 127.5 - 1.0
+    out = np.empty(layout.size, dtype=np.float32)
+    neato_observation.Preprocessor(layout).process(frame, out)
+    assert np.allclose(out, expected, atol=1e-6)
+
+
+def test_crop_and_downsample_keep_screen_positions():
+    layout = neato_observation.ObservationLayout(crop=(32, 16, 96, 82), downsample=4)
+    # The partial block at the bottom is dropped
+    assert (layout.width, layout.height, layout.size) == (16, 16, 256)
+    coords = layout.coords()
+    full = neato_observation.ObservationLayout().coords().reshape(112, 128, 2)
+    # Each input sits at the centre of the block it averages
+    assert np.allclose(coords[0], full[16:20, 32:36].reshape(-1, 2).mean(axis=0))
+    assert np.allclose(coords[-1], full[76:80, 92:96].reshape(-1, 2).mean(axis=0))
+
+    # A 128x112 grab: every input is the mean of its 4x4 block
+    rng = np.random.default_rng(1)
+    gray = rng.integers(0, 256, (112, 128), dtype=np.uint8)
+    frame = np.repeat(gray[..., None], 4, axis=2)
+    out = np.empty(layout.size, dtype=np.float32)
+    neato_observation.Preprocessor(layout).process(frame, out)
+    blocks = gray[16:80, 32:96].reshape(16, 4, 16, 4).mean(axis=(1, 3))
+    assert np.allclose(out, blocks.flatten() / 127.5 - 1.0, atol=1.01 / 127.5)
+
+    with pytest.raises(RuntimeError):
+        neato_observation.ObservationLayout(crop=(0, 0, 200, 50))
+
+
+def test_stacking_and_differencing_from_the_ring():
+    layout = neato_observation.ObservationLayout(downsample=8, stack=3, difference=True)
+    assert layout.planes == 4
+    coords = layout.coords().reshape(4, -1, 2)
+    assert np.allclose(coords[1] - coords[0], [neato_observation.PLANE_SPACING, 0])
+
+    pre = neato_observation.Preprocessor(layout)
+    ring = pre.ring.ctypes.data
+    out = np.empty(layout.size, dtype=np.float32)
+    planes = out.reshape(4, -1)
+
+    def values(gray):
+        pre.process(gray_frame(gray), out)
+        return [float(plane.mean()) for plane in planes]
+
+    norm = lambda gray: gray / 127.5 - 1.0
+    # First frame of an episode: no history yet
+    assert np.allclose(values(0), [norm(0)] * 3 + [0.0])
+    assert np.allclose(values(100), [norm(100), norm(0), norm(0), 50 / 127.5])
+    assert np.allclose(values(200), [norm(200), norm(100), norm(0), 50 / 127.5])
+    assert np.allclose(values(50), [norm(50), norm(200), norm(100), -75 / 127.5])
+    pre.reset()
+    assert np.allclose(values(10), [norm(10)] * 3 + [0.0])
+    # The history never moved
+    assert pre.ring.ctypes.data == ring
+
+
+def test_stacked_generation_against_standins():
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_PATH)
+    genomes = list(neat.Population(config).population.items())[:4]
+
+    base, servers = start_standins(2)
+    settings = neato_settings.NeatoSettings(bridge_port=base, bridge_count=2, bridge_timeout=2.0,
+                                            observation_downsample=2, observation_crop=('0', '8', '128', '104'),
+                                            observation_stack=2, observation_difference=True)
+    brain = neato_brain.NeatoBrain(settings)
+    assert brain.substrate.input_coords.shape == (3 * 64 * 48, 2)
+    for bridge, server in zip(brain.pool.bridges, servers):
+        bridge.capture_session.source = server.render
+    try:
+        brain.evaluate(genomes, config)
+    finally:
+        brain.close()
+        for server in servers:
+            server.stop()
+    assert all(genome.fitness > 0 for _, genome in genomes)
+
+
+def test_tile_grids_follow_mario_over_the_protocol():
+    standin = neato_standin.StandInBridge(pit=(64, 96), enemies=(80,)).start()
+    layout = neato_observation.ObservationLayout(16, 14, source='tiles')
+    bridge = neato_client.NeatoBridge(port=standin.port, timeout=2.0, layout=layout)
+    try:
+        assert bridge.connect() and bridge.reset()
+        assert bridge.tiles.shape == (14, 16)
+        # Ground from two rows under Mario down; nothing left of X = 0
+        assert (bridge.tiles[9:, 7:11] == neato_observation.TILE_SOLID).all()
+        assert (bridge.tiles[9:, 13:] == neato_observation.TILE_SOLID).all()
+        assert (bridge.tiles[9:, :7] == neato_observation.TILE_EMPTY).all()
+        # The pit and the enemy, ahead of Mario
+        assert (bridge.tiles[9:, 11:13] == neato_observation.TILE_EMPTY).all()
+        assert bridge.tiles[8, 12] == neato_observation.TILE_SPRITE
+        assert np.count_nonzero(bridge.tiles[:9]) == 1
+
+        right = neato_client.BUTTON_MASKS['right']
+        assert bridge.step(right, repeat=8)
+        # Mario walked one tile right: so did the level, relative to him
+        assert bridge.tiles[8, 11] == neato_observation.TILE_SPRITE
+        assert (bridge.tiles[9:, 10:12] == neato_observation.TILE_EMPTY).all()
+
+        out = np.empty(layout.size, dtype=np.float32)
+        assert bridge.capture_into(out) is out
+        assert np.array_equal(out, neato_observation.TILE_LUT[bridge.tiles].flatten())
+        # Tiles only: nothing was grabbed
+        assert bridge.capture_session.sct is None
+    finally:
+        bridge.close()
+        standin.stop()
+
+    # Text-only bridges can't send tiles
+    standin = neato_standin.StandInBridge(binary=False).start()
+    bridge = neato_client.NeatoBridge(port=standin.port, timeout=2.0, layout=layout)
+    try:
+        assert not bridge.connect()
+    finally:
+        bridge.close()
+        standin.stop()
+
+
+def test_tile_generation_replays_recorded_grids():
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_PATH)
+    genomes = list(neat.Population(config).population.items())[:4]
+
+    # Record the grids of an episode that walks right over a pit
+    standin = neato_standin.StandInBridge(pit=(96, 160), enemies=(200, 300)).start()
+    bridge = neato_client.NeatoBridge(port=standin.port, timeout=2.0)
+    try:
+        assert bridge.connect() and bridge.set_tiles(12, 10) and bridge.reset()
+        grids = [bridge.tiles.copy()]
+        for _ in range(120):
+            assert bridge.step(neato_client.BUTTON_MASKS['right'])
+            grids.append(bridge.tiles.copy())
+    finally:
+        bridge.close()
+        standin.stop()
+    assert len({grid.tobytes() for grid in grids}) > 10
+
+    servers = [neato_standin.StandInBridge(tile_grids=np.array(grids)).start() for _ in range(2)]
+    bridge = neato_client.NeatoBridge(port=servers[0].port, timeout=2.0)
+    try:
+        assert bridge.connect() and bridge.set_tiles(12, 10) and bridge.reset()
+        assert np.array_equal(bridge.tiles, grids[0])
+        assert bridge.step(0, repeat=5)
+        assert np.array_equal(bridge.tiles, grids[5])
+        # Recordings only come in the size they were recorded at
+        assert not bridge.set_tiles(16, 14)
+    finally:
+        bridge.close()
+    ports = [server.port for server in servers]
+    settings = neato_settings.NeatoSettings(bridge_count=2, bridge_timeout=2.0, observation_source='tiles',
+                                            observation_tile_width=12, observation_tile_height=10,
+                                            observation_stack=2)
+    brain = neato_brain.NeatoBrain(settings)
+    assert brain.substrate.input_coords.shape == (2 * 12 * 10, 2)
+    for bridge, port in zip(brain.pool.bridges, ports):
+        bridge.port = port
+    try:
+        brain.evaluate(genomes, config)
+        assert all(bridge.tiles is not None for bridge in brain.pool.bridges)
+    finally:
+        brain.close()
+        for server in servers:
+            server.stop()
+    assert all(genome.fitness > 0 for _, genome in genomes)
+
+    with pytest.raises(RuntimeError):
+        neato_observation.ObservationLayout(16, 14, downsample=2, source='tiles')
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+import neato_client
+import neato_pipeline
+import neato_standin
+
+
+@pytest.fixture
+def connected():
+    server = neato_standin.StandInBridge().start()
+    bridge = neato_client.NeatoBridge(port=server.port, timeout=2.0, frame_source=server.render)
+    assert bridge.connect()
+    yield server, bridge
+    bridge.close()
+    server.stop()
+
+
+def test_depth_one_keeps_game_variables_exact(connected):
+    server, bridge = connected
+    pipelined = neato_pipeline.PipelinedBridge(bridge, depth=1)
+    assert pipelined.reset() == "RESET_OK"
+    screen = np.empty(128 * 112, dtype=np.float32)
+
+    for i in range(1, 11):
+        assert pipelined.capture_into(screen) is screen
+        assert pipelined.step({'Right': True}, repeat=2)
+        # Same as the serial loop: the reply to this step is already in
+        assert pipelined.mario_x == neato_standin.START_X + 4 * i
+    # Only the first capture ran on its own; the rest were prefetched during steps
+    assert pipelined.captures == 11
+    assert pipelined.overlapped == 10
+
+
+def test_deeper_pipeline_lags_and_drains_before_other_requests(connected):
+    server, bridge = connected
+    pipelined = neato_pipeline.PipelinedBridge(bridge, depth=3)
+    pipelined.reset()
+    screen = np.empty(128 * 112, dtype=np.float32)
+
+    for i in range(1, 6):
+        pipelined.capture_into(screen)
+        assert pipelined.step(neato_client.BUTTON_MASKS['right'])
+        # Replies trail the requests by depth - 1 steps
+        assert pipelined.mario_x == neato_standin.START_X + 2 * max(0, i - 2)
+    assert pipelined.in_flight == 2
+
+    # reset() is delegated and must not read a stale STEP reply as its own
+    assert pipelined.reset() == "RESET_OK"
+    assert pipelined.in_flight == 0
+    assert pipelined.mario_x == neato_standin.START_X
+    assert server.frame == 5
+
+
+def test_text_protocol_falls_back_to_serial_steps():
+    with neato_standin.StandInBridge(binary=False) as server:
+        bridge = neato_client.NeatoBridge(port=server.port, timeout=2.0, frame_source=server.render)
+        assert bridge.connect()
+        pipelined = neato_pipeline.PipelinedBridge(bridge, depth=2)
+        pipelined.reset()
+        assert pipelined.step({'Right': True}, repeat=3)
+        assert pipelined.mario_x == neato_standin.START_X + 6
+        assert pipelined.in_flight == 0
+        bridge.close()
@@ -0,0 +1,58 @@
+import numpy as np
+
+import neato_client
+import neato_policy
+
+BUTTONS = ['B', 'Y', 'Left', 'Right', 'A']
+
+
+def reference_step(weights, inputs, prev_pressed):
+    """The decision code run_simulation had before Policy (run 2 flavour)."""
+    full = np.concatenate((inputs, prev_pressed * 2.0 - 1.0))
+    outputs = 1 / (1 + np.exp(-np.dot(full, weights)))
+    buttons = {}
+    pressed = np.zeros(len(BUTTONS))
+    for i, name in enumerate(BUTTONS):
+        buttons[name] = outputs[i] > 0.5
+        pressed[i] = 1.0 if buttons[name] else 0.0
+    if buttons.get('Left') and buttons.get('Right'):
+        if abs(outputs[BUTTONS.index('Left')]) > abs(outputs[BUTTONS.index('Right')]):
+            buttons['Right'] = False
+        else:
+            buttons['Left'] = False
+    return neato_client.buttons_to_mask(buttons), pressed
+
+
+def test_policy_matches_reference_decisions_with_feedback():
+    rng = np.random.default_rng(0)
+    weights = rng.normal(scale=0.05, size=(200 + len(BUTTONS), len(BUTTONS)))
+    policy = neato_policy.Policy(weights, BUTTONS, feedback=True)
+    assert policy.screen.shape == (200,)
+
+    prev = np.zeros(len(BUTTONS))
+    masks = set()
+    for _ in range(300):
+        frame = rng.uniform(-1, 1, 200).astype(np.float32)
+        policy.screen[:] = frame
+        mask = policy.act()
+        expected, prev = reference_step(weights, frame, prev)
+        assert isinstance(mask, int)
+        assert mask == expected
+        masks.add(mask)
+    # Never both directions, and the test covered a range of decisions
+    left_right = neato_client.BUTTON_MASKS['left'] | neato_client.BUTTON_MASKS['right']
+    assert all(m & left_right != left_right for m in masks)
+    assert len(masks) > 5
+
+
+def test_policy_resolves_left_right_conflict_and_resets_feedback():
+    weights = np.zeros((3 + len(BUTTONS), len(BUTTONS)))
+    weights[0, BUTTONS.index('Left')] = 2.0
+    weights[0, BUTTONS.index('Right')] = 1.0
+    policy = neato_policy.Policy(weights, BUTTONS, feedback=True)
+    policy.screen[:] = [1.0, 0.0, 0.0]
+    assert policy.act() == neato_client.BUTTON_MASKS['left']
+    # Feedback holds what the network decided, both directions included
+    assert list(policy.feedback_slots) == [-1.0, -1.0, 1.0, 1.0, -1.0]
+    policy.reset()
+    assert list(policy.feedback_slots) == [-1.0] * len(BUTTONS)
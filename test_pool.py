@@ -0,0 +1,116 @@
+import random
+
+import neat
+import pytest
+
+import neato_brain
+import neato_client
+import neato_pool
+import neato_settings
+import neato_standin
+
+
+def start_standins(count, **failures):
+    """Starts count stand-in bridges on consecutive ports. failures maps index -> kwargs."""
+    for _ in range(50):
+        base = random.randint(20000, 40000)
+        servers = []
+        try:
+            for i in range(count):
+                servers.append(neato_standin.StandInBridge(port=base + i, **failures.get(str(i), {})))
+        except OSError:
+            for server in servers:
+                server.stop()
+            continue
+        return base, [server.start() for server in servers]
+    pytest.skip("no free port range")
+
+
+def walk_right(bridge, frames):
+    """Minimal episode over the text protocol: reset, hold Right, report X."""
+    if bridge.reset() != "RESET_OK":
+        return 0
+    for _ in range(frames):
+        if not bridge.act({'Right': True}):
+            return 0
+    if bridge.read_state() is None:
+        return 0
+    return bridge.mario_x
+
+
+def test_results_come_back_in_job_order():
+    base, servers = start_standins(3)
+    pool = neato_pool.EvaluationPool(base_port=base, count=3, timeout=2.0)
+    try:
+        frames = [5, 1, 8, 3, 0, 7, 2, 6, 4]
+        results = pool.evaluate(iter(frames), walk_right)
+        assert results == [neato_standin.START_X + 2 * f for f in frames]
+        # Every emulator got work
+        assert all(server.resets > 0 for server in servers)
+    finally:
+        pool.close()
+        for server in servers:
+            server.stop()
+
+
+@pytest.mark.parametrize("failure", [{'fail_after': 12}, {'stall_after': 12}])
+def test_lost_bridge_is_retired_and_job_requeued(failure):
+    base, servers = start_standins(2, **{'0': failure})
+    pool = neato_pool.EvaluationPool(base_port=base, count=2, timeout=0.5)
+    try:
+        frames = [10] * 6
+        results = pool.evaluate(frames, walk_right)
+        assert results == [neato_standin.START_X + 20] * 6
+        assert pool.requeued == 1
+        assert pool.bridges[0].sock is None
+    finally:
+        pool.close()
+        for server in servers:
+            server.stop()
+
+
+def test_no_bridges_scores_zero():
+    base, servers = start_standins(1)
+    servers[0].stop()
+    pool = neato_pool.EvaluationPool(base_port=base, count=1, timeout=0.5)
+    assert pool.evaluate([1, 2], walk_right) == [0, 0]
+
+
+def test_evaluate_runs_in_turbo_mode_and_replay_does_not():
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         "config-feedforward")
+    genomes = list(neat.Population(config).population.items())[:2]
+
+    base, servers = start_standins(2)
+    brain = neato_brain.NeatoBrain(neato_settings.NeatoSettings(bridge_port=base, bridge_count=2,
+                                                                bridge_timeout=2.0))
+    for bridge, server in zip(brain.pool.bridges, servers):
+        bridge.capture_session.source = server.render
+    try:
+        brain.evaluate(genomes, config)
+        turbo = neato_client.TURBO_UNTHROTTLED | neato_client.TURBO_MUTE
+        assert [server.turbo_mode for server in servers] == [turbo, turbo]
+
+        genome_id, genome = genomes[0]
+        assert brain.replay(genome, config) == genome.fitness
+        assert servers[0].turbo_mode == 0 and servers[0].throttled and servers[0].sound
+    finally:
+        brain.close()
+        for server in servers:
+            server.stop()
+
+
+def test_replay_without_an_emulator_returns_none():
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         "config-feedforward")
+    genome = next(iter(neat.Population(config).population.values()))
+    # Nothing listens there (e.g. a trainer whose emulators are all on workers)
+    base, servers = start_standins(1)
+    servers[0].stop()
+    brain = neato_brain.NeatoBrain(neato_settings.NeatoSettings(bridge_port=base, bridge_timeout=2.0))
+    try:
+        assert brain.replay(genome, config) is None
+    finally:
+        brain.close()
@@ -0,0 +1,173 @@
+import pytest
+
+import neato_client
+import neato_observation
+import neato_standin
+
+
+@pytest.fixture(params=[True, False], ids=['binary', 'text'])
+def connected(request):
+    server = neato_standin.StandInBridge(binary=request.param).start()
+    bridge = neato_client.NeatoBridge(port=server.port, timeout=2.0)
+    assert bridge.connect()
+    yield server, bridge
+    bridge.close()
+    server.stop()
+
+
+def test_handshake_picks_protocol(connected):
+    server, bridge = connected
+    assert bridge.protocol == ('binary' if server.binary else 'text')
+
+
+@pytest.mark.parametrize('legacy_hello', [False, True], ids=['checks-version', 'switches-anyway'])
+def test_version_mismatch_falls_back_to_text(legacy_hello):
+    with neato_standin.StandInBridge(version=neato_client.PROTOCOL_VERSION - 1, legacy_hello=legacy_hello) as server:
+        bridge = neato_client.NeatoBridge(port=server.port, timeout=2.0)
+        assert bridge.connect()
+        assert bridge.protocol == 'text'
+        # The bridge is on text as well, whether or not it switched on the first connection
+        assert bridge.read_state() == server.geometry
+        assert bridge.reset() == "RESET_OK" and bridge.step({'Right': True})
+        assert bridge.mario_x == neato_standin.START_X + neato_standin.WALK_SPEED
+        bridge.close()
+
+
+def test_step_returns_state_after_the_frame(connected):
+    server, bridge = connected
+    assert bridge.reset() == "RESET_OK"
+    for i in range(1, 4):
+        assert bridge.step({'Right': True, 'B': False})
+        assert bridge.mario_x == neato_standin.START_X + 2 * i
+    # Bitmasks work as well as dicts
+    assert bridge.step(neato_client.BUTTON_MASKS['left'])
+    assert bridge.mario_x == neato_standin.START_X + 4
+    assert bridge.read_state() == server.geometry
+
+
+def test_binary_geometry_only_sent_when_changed():
+    with neato_standin.StandInBridge() as server:
+        bridge = neato_client.NeatoBridge(port=server.port, timeout=2.0)
+        assert bridge.connect()
+        assert bridge.read_state() == (0, 0, 256, 224, 0, 0)
+
+        # Unchanged geometry is not resent, so a cleared value stays cleared
+        bridge.geometry = None
+        assert bridge.step({})
+        assert bridge.geometry is None
+
+        server.geometry = (-1920, 40, 512, 448, 8, 53)
+        assert bridge.step({})
+        assert bridge.geometry == (-1920, 40, 512, 448, 8, 53)
+        bridge.close()
+
+
+def test_button_mask_round_trip():
+    buttons = {'B': True, 'Left': False, 'Right': True, 'A': True}
+    mask = neato_client.buttons_to_mask(buttons)
+    assert neato_client.mask_to_buttons(mask) == {'B': True, 'Right': True, 'A': True}
+
+
+def test_step_repeat_advances_several_frames(connected):
+    server, bridge = connected
+    bridge.reset()
+    start_frame = server.frame
+    assert bridge.step({'Right': True}, repeat=4)
+    assert bridge.mario_x == neato_standin.START_X + 8
+    assert server.frame - start_frame == 4
+
+
+def test_reset_returns_post_reset_state(connected):
+    server, bridge = connected
+    bridge.step({'Right': True}, repeat=5)
+    assert bridge.reset() == "RESET_OK"
+    assert bridge.mario_x == neato_standin.START_X
+    assert bridge.geometry == server.geometry
+
+
+def test_savestates_restore_mid_episode(connected):
+    server, bridge = connected
+    bridge.reset()
+    bridge.step({'Right': True}, repeat=10)
+    checkpoint = bridge.save_state("checkpoint")
+    assert checkpoint is not None
+
+    bridge.step({'Right': True}, repeat=10)
+    assert bridge.mario_x == neato_standin.START_X + 40
+    assert bridge.load_state("checkpoint")
+    assert bridge.mario_x == neato_standin.START_X + 20
+
+    # Same handle by number, then freed
+    bridge.step({'Left': True}, repeat=3)
+    assert bridge.load_state(checkpoint)
+    assert bridge.mario_x == neato_standin.START_X + 20
+    assert bridge.drop_state("checkpoint")
+    assert not bridge.load_state(checkpoint)
+    assert bridge.sock is not None
+
+
+def test_bad_handles_and_reconnects_free_savestates():
+    with neato_standin.StandInBridge(binary=False) as server:
+        bridge = neato_client.NeatoBridge(port=server.port, timeout=2.0)
+        assert bridge.connect()
+        for command in ("SAVE:abc", "LOAD:", "DROP:x"):
+            assert bridge.send_command(command) == "STATE_ERR"
+        handle = bridge.save_state()
+        assert handle is not None and server.saved_states
+
+        # The client forgets its handles on reconnect, so the bridge frees them
+        bridge.close()
+        assert bridge.connect()
+        assert not server.saved_states
+        assert not bridge.load_state(handle)
+        bridge.close()
+
+
+def test_standin_runs_and_jumps(connected):
+    server, bridge = connected
+    bridge.reset()
+    assert bridge.step({'Right': True, 'Y': True}, repeat=2)
+    assert bridge.mario_x == neato_standin.START_X + 2 * neato_standin.RUN_SPEED
+
+    # Up on the first frame of the jump, back on the ground once gravity wins
+    assert bridge.step({'A': True})
+    assert bridge.mario_y == neato_standin.START_Y - neato_standin.JUMP_SPEED
+    heights = []
+    for _ in range(2 * neato_standin.JUMP_SPEED + 2):
+        bridge.step({})
+        heights.append(bridge.mario_y)
+    assert min(heights) < neato_standin.START_Y - neato_standin.JUMP_SPEED
+    assert heights[-1] == neato_standin.START_Y
+
+
+def test_turbo_mode_enters_and_restores(connected):
+    server, bridge = connected
+    server.sound = False  # Whatever the emulator had before is what comes back
+    assert bridge.set_turbo(True)
+    assert (server.throttled, server.rendering, server.sound) == (False, True, False)
+    # Screen observations keep the emulator drawing, and the screen still moves
+    assert bridge.reset() and bridge.step(neato_client.BUTTON_MASKS['right'], repeat=16)
+    assert server.render()[160:192, 48:64, 2].min() == 220
+    assert bridge.set_turbo(False)
+    assert (server.throttled, server.rendering, server.sound, server.turbo_mode) == (True, True, False, 0)
+
+    # A new connection leaves turbo mode, and the bridge re-enters it on reconnect
+    assert bridge.set_turbo(True)
+    bridge.close()
+    assert bridge.connect()
+    assert server.turbo_mode == neato_client.TURBO_UNTHROTTLED | neato_client.TURBO_MUTE
+
+
+def test_turbo_mode_stops_rendering_for_tile_observations():
+    layout = neato_observation.ObservationLayout(16, 14, source='tiles')
+    with neato_standin.StandInBridge() as server:
+        bridge = neato_client.NeatoBridge(port=server.port, timeout=2.0, layout=layout)
+        # Asked for before connecting: applied when the connection is made
+        assert bridge.set_turbo(True)
+        assert server.turbo_mode == 0
+        assert bridge.connect()
+        assert not server.rendering and not server.throttled
+        screen = server.render().copy()
+        assert bridge.step(neato_client.BUTTON_MASKS['right'], repeat=16)
+        assert (server.render() == screen).all()
+        bridge.close()
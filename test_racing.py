@@ -0,0 +1,63 @@
+import neat
+
+import neato_brain
+import neato_racing
+import neato_settings
+from test_pool import start_standins
+
+CONFIG_PATH = "config-feedforward"
+
+
+def test_rungs_promote_the_best_and_keep_fitness_ordered():
+    race = neato_racing.SuccessiveHalving(horizons=(600, 100, 200, 50000), keep=0.5, max_frames=400)
+    assert race.horizons == [100, 200, 400]
+
+    played = []
+
+    def play(jobs, horizon):
+        jobs = list(jobs)
+        played.append((horizon, [genome_id for genome_id, _ in jobs]))
+        # Genome speed is its weights; the score grows with the horizon
+        return [speed * horizon for _, speed in jobs]
+
+    speeds = {1: 3, 2: 1, 3: 4, 4: 1, 5: 5}
+    fitness = race.run(iter(speeds.items()), play)
+
+    assert race.rung_sizes == [5, 3, 2]
+    assert played[1] == (200, [5, 3, 1])
+    assert played[2] == (400, [5, 3])
+    assert fitness == {1: 600, 2: 100, 3: 1600, 4: 100, 5: 2000}
+
+
+def test_single_rung_without_horizons():
+    race = neato_racing.SuccessiveHalving()
+    assert race.horizons == [600]
+    assert race.run([(7, 2.0)], lambda jobs, horizon: [w * horizon for _, w in jobs]) == {7: 1200.0}
+
+
+def test_racing_generation_uses_fewer_frames(capsys):
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_PATH)
+    genomes = list(neat.Population(config).population.items())[:8]
+
+    base, servers = start_standins(2)
+    settings = neato_settings.NeatoSettings(bridge_port=base, bridge_count=2, bridge_timeout=2.0,
+                                            racing_horizons=(100, 300), racing_keep=0.5)
+    brain = neato_brain.NeatoBrain(settings)
+    for bridge, server in zip(brain.pool.bridges, servers):
+        bridge.capture_session.source = server.render
+    try:
+        brain.evaluate(genomes, config)
+    finally:
+        brain.close()
+        for server in servers:
+            server.stop()
+
+    assert brain.racing.rung_sizes == [8, 4, 2]
+    assert all(genome.fitness is not None for _, genome in genomes)
+    played = sum(server.frame for server in servers)
+    assert played <= 8 * 100 + 4 * 300 + 2 * 600
+    out = capsys.readouterr().out
+    assert "Racing: 8 genomes x 100 -> 4 genomes x 300 -> 2 genomes x 600 frames" in out
+    assert "of the fixed 4800-frame budget" in out
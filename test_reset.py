@@ -9,12 +9,8 @@ if bridge.connect():
     # Test reset 5 times
     for i in range(5):
         print(f"\n--- Reset {i+1} ---")
-        bridge.reset()
-        time.sleep(0.5)
-        
-        # Get state
-        img = bridge.get_state()
-        if img is not None:
+        # reset() returns once the state is applied, with the game variables already read
+        if bridge.reset() is not None:
             print(f"Mario X: {bridge.mario_x}")
             print(f"Mario Y: {bridge.mario_y}")
             print(f"Game Mode: {bridge.game_mode}")
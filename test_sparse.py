@@ -0,0 +1,84 @@
+import neat
+import numpy as np
+
+import neato_brain
+import neato_build
+import neato_cache
+import neato_cppn
+import neato_sparse
+
+CONFIG_PATH = "config-feedforward"
+
+
+def make_genomes():
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_PATH)
+    population = neat.Population(config)
+    return config, list(population.population.items())[:4]
+
+
+def dense_forward(cppn, substrate, inputs, threshold):
+    """The hidden-layer network written out with full matrices."""
+    compiled = neato_cppn.CompiledCPPN(cppn)
+    to_hidden = compiled.query_grid(substrate.input_coords, substrate.hidden_coords)
+    to_output = compiled.query_grid(substrate.hidden_coords, substrate.output_coords)
+    to_hidden[np.abs(to_hidden) < threshold] = 0.0
+    to_output[np.abs(to_output) < threshold] = 0.0
+    return np.dot(np.tanh(np.dot(inputs, to_hidden)), to_output)
+
+
+def test_csr_matches_dense_product():
+    rng = np.random.default_rng(0)
+    dense = rng.normal(size=(7, 11))
+    dense[2] = 0.0  # An empty row
+    dense[-2:] = 0.0  # and trailing empty rows
+    x = rng.normal(size=11).astype(np.float32)
+
+    matrix = neato_sparse.CSRMatrix.from_dense(dense, 0.5)
+    expected = np.where(np.abs(dense) >= 0.5, dense, 0.0) @ x
+    assert matrix.nnz == np.count_nonzero(np.abs(dense) >= 0.5)
+    assert np.allclose(matrix.dot(x), expected, atol=1e-5)
+    assert np.array_equal(neato_sparse.CSRMatrix.from_dense(dense, 100.0).dot(x), np.zeros(7))
+
+    trailing = neato_sparse.CSRMatrix.from_dense(np.array([[1.0, 2.0, 3.0], [0.0, 0.0, 0.0]]), 0.5)
+    assert np.allclose(trailing.dot(np.ones(3, dtype=np.float32)), [6.0, 0.0])
+
+
+def test_sparse_phenotype_matches_dense_network():
+    config, genomes = make_genomes()
+    substrate = neato_brain.Substrate(width=16, height=14, hidden_width=5, hidden_height=4)
+    inputs = np.random.default_rng(1).uniform(-1, 1, substrate.input_coords.shape[0]).astype(np.float32)
+
+    for threshold in (0.0, 0.2, 0.5):
+        substrate.weight_threshold = threshold
+        for _, genome in genomes:
+            cppn = neat.nn.FeedForwardNetwork.create(genome, config)
+            phenotype = substrate.build_phenotype(cppn, config)
+            assert isinstance(phenotype, neato_sparse.SparsePhenotype)
+            expected = dense_forward(cppn, substrate, inputs, threshold)
+            assert np.allclose(neato_sparse.forward(phenotype, inputs), expected, atol=1e-4)
+
+
+def test_sparse_builds_through_pool_and_disk_cache(tmp_path):
+    config, genomes = make_genomes()
+    substrate = neato_brain.Substrate(width=16, height=14, hidden_width=4, hidden_height=4)
+    inputs = np.linspace(-1, 1, substrate.input_coords.shape[0], dtype=np.float32)
+
+    cache = neato_cache.PhenotypeCache(max_entries=0, cache_dir=str(tmp_path))
+    builder = neato_build.PhenotypeBuilder(substrate.input_coords, substrate.output_coords, workers=2,
+                                           cache=cache, hidden_coords=substrate.hidden_coords,
+                                           weight_threshold=0.2)
+    try:
+        built = {genome_id: weights for genome_id, _, weights in builder.build_all(genomes, config)}
+    finally:
+        builder.close()
+    assert sorted(p.suffix for p in tmp_path.iterdir()) == ['.npz'] * len(genomes)
+
+    # Second builder only sees the .npz files
+    cache = neato_cache.PhenotypeCache(max_entries=0, cache_dir=str(tmp_path))
+    builder = neato_build.PhenotypeBuilder(substrate.input_coords, substrate.output_coords, cache=cache,
+                                           hidden_coords=substrate.hidden_coords, weight_threshold=0.2)
+    for genome_id, _, weights in builder.build_all(genomes, config):
+        assert np.allclose(weights.forward(inputs), built[genome_id].forward(inputs))
+    assert cache.end_generation() == (len(genomes), 0)
@@ -0,0 +1,78 @@
+import types
+
+import numpy as np
+
+import neato_brain
+import neato_settings
+import neato_standin
+import neato_termination
+import neato_trajectory
+
+
+def game(**ram):
+    values = dict(mario_x=100, mario_y=320, game_mode=20, end_level_timer=0, anim_state=0)
+    values.update(ram)
+    return types.SimpleNamespace(**values)
+
+
+def test_conditions_in_order_and_custom_predicates():
+    policy = neato_termination.TerminationPolicy(pit_y=380)
+    policy.add('far_enough', lambda bridge: bridge.mario_x > 1000)
+    assert policy.check(game(), 20) is None
+    assert policy.check(game(anim_state=9), 20) == 'death'
+    assert policy.check(game(end_level_timer=40), 20) == 'level_clear'
+    assert policy.check(game(mario_y=390), 20) == 'pit'
+    assert policy.check(game(game_mode=11), 20) == 'mode_change'
+    assert policy.check(game(mario_x=1200), 20) == 'far_enough'
+    # Death wins over everything that follows from it
+    assert policy.check(game(anim_state=9, mario_y=390, game_mode=11), 20) == 'death'
+
+    off = neato_termination.TerminationPolicy(death=False, level_clear=False, mode_change=False)
+    assert off.check(game(anim_state=9, end_level_timer=40, game_mode=11, mario_y=999), 20) is None
+
+
+def test_frames_saved_against_the_stagnation_rule():
+    policy = neato_termination.TerminationPolicy(stagnation_frames=60)
+    # Died 10 frames after the last progress: 51 more frames to get past 60
+    assert policy.finish('death', 200, 600, 10) == 51
+    # Held 4 frames per decision: 13 more decisions
+    assert policy.finish('death', 200, 600, 10, action_repeat=4) == 52
+    # Never beyond the budget, nothing saved by the fallback rules
+    assert policy.finish('level_clear', 590, 600, 0) == 10
+    assert policy.finish('stagnation', 300, 600, 61) == 0
+    reasons, saved, played = policy.end_generation()
+    assert reasons == {'death': 2, 'level_clear': 1, 'stagnation': 1}
+    assert saved == 51 + 52 + 10
+    assert played == 200 + 200 + 590 + 300
+    assert policy.end_generation() == ({}, 0, 0)
+
+
+def play(tmp_path, **standin):
+    with neato_standin.StandInBridge(**standin) as server:
+        settings = neato_settings.NeatoSettings(bridge_port=server.port, record_dir=str(tmp_path))
+        brain = neato_brain.NeatoBrain(settings)
+        bridge = brain.pool.bridges[0]
+        bridge.capture_session.source = server.render
+        bridge.connect()
+        weights = np.zeros((brain.substrate.input_coords.shape[0], len(brain.substrate.active_buttons)))
+        weights[:, brain.substrate.active_buttons.index('Right')] = 0.01
+        brain.run_simulation(weights, bridge)
+        frames = server.frame
+        reasons, saved, _ = brain.termination.end_generation()
+        brain.close()
+    return frames, reasons, saved, neato_trajectory.TrajectoryReader(str(tmp_path)).episodes[0]
+
+
+def test_walking_into_a_pit_ends_the_episode_on_death(tmp_path):
+    frames, reasons, saved, episode = play(tmp_path, pit=(100, 140))
+    assert reasons == {'death': 1}
+    assert episode['termination'] == 'death'
+    assert frames < 100 and episode['length'] == frames
+    assert saved > 0
+
+
+def test_reaching_the_goal_ends_the_episode(tmp_path):
+    frames, reasons, _, episode = play(tmp_path, goal_x=200)
+    assert reasons == {'level_clear': 1}
+    assert episode['termination'] == 'level_clear'
+    assert frames == (200 - neato_standin.START_X) // neato_standin.WALK_SPEED
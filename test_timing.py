@@ -0,0 +1,58 @@
+import pstats
+
+import neat
+
+import neato_brain
+import neato_settings
+import neato_timing
+from test_pool import start_standins
+
+CONFIG_PATH = "config-feedforward"
+
+
+def test_stage_histograms():
+    times = neato_timing.StageTimes()
+    for ms in range(1, 101):
+        times.add('infer', ms / 1000.0)
+    summary = times.summary()['infer']
+    assert summary['count'] == 100
+    assert summary['max'] == 0.1
+    assert 0.049 < summary['p50'] < 0.052
+    assert 0.094 < summary['p95'] < 0.097
+
+
+def test_evaluate_reports_every_stage_and_profiles_one_genome(tmp_path, capsys):
+    config = neat.Config(neat.DefaultGenome, neat.DefaultReproduction,
+                         neat.DefaultSpeciesSet, neat.DefaultStagnation,
+                         CONFIG_PATH)
+    genomes = list(neat.Population(config).population.items())[:3]
+    profiled = genomes[1][0]
+    profile_path = tmp_path / "genome.prof"
+
+    base, servers = start_standins(1)
+    settings = neato_settings.NeatoSettings(bridge_port=base, bridge_timeout=2.0, profile_genome=profiled,
+                                            profile_output=str(profile_path))
+    brain = neato_brain.NeatoBrain(settings)
+    brain.pool.bridges[0].capture_session.source = servers[0].render
+    reporter = neato_timing.TimingReporter(brain.timings)
+    try:
+        brain.evaluate(genomes, config)
+        reporter.post_evaluate(config, None, None, None)
+    finally:
+        brain.close()
+        servers[0].stop()
+
+    assert set(reporter.genome_statistics) == {genome_id for genome_id, _ in genomes}
+    summary = reporter.generation_statistics[0]
+    for stage in ('build', 'reset', 'grab', 'preprocess', 'infer', 'step'):
+        assert summary[stage]['count'] > 0
+    assert summary['build']['count'] == 3
+    # One sample per decision
+    assert summary['infer']['count'] == summary['step']['count'] == summary['grab']['count']
+    assert reporter.get_stage_stat('step', 'max') == [summary['step']['max']]
+    assert "preprocess" in capsys.readouterr().out
+
+    stats = pstats.Stats(str(profile_path))
+    assert any(name == 'run_simulation' for _, _, name in stats.stats)
+    # Nothing is left to leak into the next generation
+    assert brain.timings.genomes == {}
@@ -0,0 +1,111 @@
+import types
+
+import numpy as np
+
+import neato_brain
+import neato_capture
+import neato_client
+import neato_settings
+import neato_standin
+import neato_trajectory
+
+
+def fake_bridge(x):
+    return types.SimpleNamespace(frame=x, mario_x=x, mario_y=300, game_mode=20, level_index=1,
+                                 end_level_timer=0, anim_state=0)
+
+
+def test_episodes_span_chunks_and_read_back_zero_copy(tmp_path):
+    recorder = neato_trajectory.TrajectoryRecorder(str(tmp_path), chunk_frames=8)
+    rng = np.random.default_rng(0)
+    grays = rng.integers(0, 256, (13, 112 * 128), dtype=np.uint8)
+    start = 0
+    for length in (5, 8):
+        episode = recorder.start_episode()
+        for i in range(start, start + length):
+            # Inputs as capture_into() produces them
+            episode.append(neato_capture.NORMALIZE_LUT[grays[i]], fake_bridge(i), i, repeat=2)
+        recorder.finish(episode, fitness=float(length))
+        start += length
+    recorder.close()
+
+    reader = neato_trajectory.TrajectoryReader(str(tmp_path))
+    assert [e['length'] for e in reader.episodes] == [5, 8]
+    first_obs, first_ram = reader.episode(0)
+    assert isinstance(first_obs, np.memmap) and isinstance(first_ram, np.memmap)
+    assert np.array_equal(first_obs, grays[:5])
+
+    # The second episode straddles the chunk boundary at row 8
+    obs, ram = reader.episode(1)
+    assert np.array_equal(obs, grays[5:13])
+    assert list(ram['mario_x']) == list(range(5, 13))
+    assert list(ram['buttons']) == list(range(5, 13))
+    assert set(ram['repeat']) == {2}
+
+    # A new recorder picks up where the index left off
+    recorder = neato_trajectory.TrajectoryRecorder(str(tmp_path))
+    episode = recorder.start_episode()
+    episode.append(neato_capture.NORMALIZE_LUT[grays[0]], fake_bridge(99), 0)
+    recorder.finish(episode, fitness=1.0)
+    recorder.close()
+    assert neato_trajectory.TrajectoryReader(str(tmp_path)).episodes[-1]['start'] == 13
+
+
+def test_recorded_episode_replays_over_the_bridge_protocol(tmp_path):
+    with neato_standin.StandInBridge() as server:
+        settings = neato_settings.NeatoSettings(bridge_port=server.port, action_repeat=3,
+                                                record_dir=str(tmp_path))
+        brain = neato_brain.NeatoBrain(settings)
+        bridge = brain.pool.bridges[0]
+        bridge.capture_session.source = server.render
+        bridge.connect()
+        weights = np.zeros((brain.substrate.input_coords.shape[0], len(brain.substrate.active_buttons)))
+        weights[:, brain.substrate.active_buttons.index('Right')] = 0.01
+        fitness = brain.run_simulation(weights, bridge)
+        brain.close()
+
+    reader = neato_trajectory.TrajectoryReader(str(tmp_path))
+    assert reader.episodes[0]['fitness'] == fitness
+    recorded_obs, recorded_ram = reader.episode(0)
+    assert len(recorded_ram) == 200  # 600 frames held 3 at a time
+
+    with neato_trajectory.ReplayBridge(reader, 0) as replay:
+        client = neato_client.NeatoBridge(port=replay.port, timeout=2.0, frame_source=replay.render)
+        assert client.connect() and client.reset() == "RESET_OK"
+        screen = np.empty(112 * 128, dtype=np.float32)
+        for obs, ram in zip(recorded_obs, recorded_ram):
+            assert client.mario_x == ram['mario_x']
+            assert client.capture_into(screen) is screen
+            assert np.array_equal(screen, neato_capture.NORMALIZE_LUT[obs])
+            assert client.step(int(ram['buttons']), repeat=int(ram['repeat']))
+        client.close()
+
+
+def test_replay_savestates_rewind_the_recording(tmp_path):
+    recorder = neato_trajectory.TrajectoryRecorder(str(tmp_path))
+    grays = np.random.default_rng(0).integers(0, 256, (6, 112 * 128), dtype=np.uint8)
+    episode = recorder.start_episode()
+    for i in range(6):
+        episode.append(neato_capture.NORMALIZE_LUT[grays[i]], fake_bridge(10 * i), 0, repeat=2)
+    recorder.finish(episode, fitness=1.0)
+    recorder.close()
+
+    reader = neato_trajectory.TrajectoryReader(str(tmp_path))
+    with neato_trajectory.ReplayBridge(reader, 0) as replay:
+        for binary in (True, False):
+            client = neato_client.NeatoBridge(port=replay.port, timeout=2.0, binary=binary,
+                                              frame_source=replay.render)
+            screen = np.empty(112 * 128, dtype=np.float32)
+            assert client.connect() and client.reset() == "RESET_OK"
+            # Halfway through row 1
+            assert client.step(0, repeat=3) and client.mario_x == 10
+            handle = client.save_state()
+            assert handle is not None
+            assert client.step(0, repeat=5) and client.mario_x == 40
+            assert client.load_state(handle) and client.mario_x == 10
+            assert client.capture_into(screen) is screen
+            assert np.array_equal(screen, neato_capture.NORMALIZE_LUT[grays[1]])
+            # One more frame finishes row 1, as it would have before the save
+            assert client.step(0) and client.mario_x == 20
+            assert client.drop_state(handle) and not client.load_state(handle)
+            client.close()